@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Offline throughput benchmarks of the client, see benchmarks.run."""
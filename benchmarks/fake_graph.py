@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in of the Graph endpoints used by the benchmarks.
+
+FakeGraphServer serves generated mailboxes over http on localhost:
+
+- GET  /users/<id>/messages: pages of messages ($top, $skip, odata.maxpagesize,
+  and a $filter on a receivedDateTime range, the other clauses being
+  ignored), and their $count; as with Graph, a filtered query sorted on
+  properties which do not lead its $filter is rejected
+- GET  /users/<id>/calendarView: pages of the events overlapping the range
+  (startDateTime, endDateTime), in start order
+- GET  /users/<id>/mailFolders/<id>/messages/delta: delta pages, ending with
+  a delta link; a query with a delta token returns no change
+- GET, PATCH, DELETE /users/<id>/messages/<id> and
+  POST /users/<id>/messages/<id>/move: nothing is changed
+- GET  /users/<id>/messages/<id>/$value and
+  /users/<id>/messages/<id>/attachments/<id>/$value: binary content
+- POST /$batch
+
+latency delays every response, and throttle_rate/unavailable_rate turn
+that share of the requests into 429/503 responses with a Retry-After
+header; within a $batch, those are the responses of its requests, while
+batch_failure_rate turns that share of the $batch requests themselves
+into 503 responses. LocalGraphAdapter sends the requests of a requests.Session for
+graph.microsoft.com to the server, so that the client runs unchanged.
+"""
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from office365_api.v2.transport import TimeoutHTTPAdapter, build_session
+
+GRAPH_URL = 'https://graph.microsoft.com'
+DEFAULT_PAGE_SIZE = 10
+EVENTS_START = datetime(2020, 1, 1)
+# the messages of every mailbox are received every minute from MESSAGES_START
+MESSAGES_START = datetime(2020, 1, 1)
+MESSAGE_INTERVAL = timedelta(minutes=1)
+CONTENT_CHUNK_SIZE = 64 * 1024
+
+_ROUTES = []
+
+
+def route(method, pattern):
+    def decorator(func):
+        _ROUTES.append((method, re.compile('^/(?:v1\\.0|beta)' + pattern + '$'), func))
+        return func
+    return decorator
+
+
+class FakeGraph(object):
+    """
+    The generated data and the fault injection settings.
+
+    messages_count: messages of every mailbox (any user id is a mailbox)
+    body_size: size of the body of every message, in bytes
+    content_size: size of the $value content of the messages and attachments
+    """
+
+    def __init__(self, messages_count=1000, body_size=2048, content_size=1024 * 1024,
+                 latency=0, throttle_rate=0, unavailable_rate=0, retry_after=1, seed=None,
+                 events_count=1000, event_interval=timedelta(hours=7),
+                 event_duration=timedelta(hours=3), batch_failure_rate=0):
+        self.messages_count = messages_count
+        self.body_size = body_size
+        self.content_size = content_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.unavailable_rate = unavailable_rate
+        self.retry_after = retry_after
+        self.batch_failure_rate = batch_failure_rate
+        # the events of every calendar start every event_interval from EVENTS_START
+        self.events_count = events_count
+        self.event_interval = event_interval
+        self.event_duration = event_duration
+        self.random = random.Random(seed)
+        self.requests_count = 0
+        self.lock = threading.Lock()
+
+    def message(self, user_id, index):
+        return {
+            '@odata.etag': 'W/"{}"'.format(index),
+            'id': '{}-{:08d}'.format(user_id, index),
+            'createdDateTime': '2020-01-01T00:00:00Z',
+            'lastModifiedDateTime': '2020-01-01T00:00:00Z',
+            'receivedDateTime': (MESSAGES_START + index * MESSAGE_INTERVAL).isoformat() + 'Z',
+            'subject': 'Message {}'.format(index),
+            'isRead': bool(index % 2),
+            'from': {'emailAddress': {'name': 'Sender', 'address': 'sender@example.com'}},
+            'toRecipients': [
+                {'emailAddress': {'name': user_id, 'address': user_id + '@example.com'}}],
+            'body': {'contentType': 'text', 'content': 'x' * self.body_size},
+        }
+
+    def event(self, user_id, index):
+        start = EVENTS_START + index * self.event_interval
+        return {
+            'id': '{}-event-{:08d}'.format(user_id, index),
+            'subject': 'Event {}'.format(index),
+            'start': {'dateTime': start.isoformat() + '.0000000', 'timeZone': 'UTC'},
+            'end': {'dateTime': (start + self.event_duration).isoformat() + '.0000000',
+                    'timeZone': 'UTC'},
+            'body': {'contentType': 'text', 'content': 'x' * self.body_size},
+        }
+
+    def fault(self):
+        """Return the status of the injected error of a request, if any."""
+        with self.lock:
+            self.requests_count += 1
+            draw = self.random.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.unavailable_rate:
+            return 503
+        return None
+
+    def batch_fault(self):
+        """Return the status of the injected error of a whole $batch request, if any."""
+        if not self.batch_failure_rate:
+            return None
+        with self.lock:
+            draw = self.random.random()
+        return 503 if draw < self.batch_failure_rate else None
+
+    def handle(self, method, path, headers, body=None, delay=True):
+        """Return the status, headers and body (json data, or bytes iterable) of a request."""
+        if delay and self.latency:
+            time.sleep(self.latency)
+        url = urllib.parse.urlsplit(path)
+        # as with Graph, the errors are injected in the responses of the
+        # requests of a batch rather than in the response of the batch
+        status = self.fault() if not url.path.endswith('/$batch') else self.batch_fault()
+        if status is not None:
+            return status, {'Retry-After': str(self.retry_after)}, {
+                'error': {'code': 'TooManyRequests' if status == 429 else 'ServiceUnavailable',
+                          'message': 'Injected error'}}
+
+        query = dict(urllib.parse.parse_qsl(url.query))
+        for route_method, pattern, func in _ROUTES:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                return func(self, query, headers, body, *match.groups())
+        return 404, {}, {'error': {'code': 'ResourceNotFound', 'message': url.path}}
+
+    def page_size(self, query, headers):
+        prefer = headers.get('Prefer') or ''
+        match = re.search(r'odata\.maxpagesize=(\d+)', prefer)
+        if match:
+            return int(match.group(1))
+        return int(query.get('$top', DEFAULT_PAGE_SIZE))
+
+    def page(self, user_id, start, size):
+        end = min(start + size, self.messages_count)
+        return [self.message(user_id, i) for i in range(start, end)], end
+
+
+def received_range(graph, query):
+    """Return the indexes of the messages matching the receivedDateTime $filter of query."""
+    first, last = 0, graph.messages_count
+    for operator, value in re.findall(r'receivedDateTime (ge|lt) (\S+)', query.get('$filter', '')):
+        index = max(0, -(-(parse_query_datetime(value) - MESSAGES_START) // MESSAGE_INTERVAL))
+        if operator == 'ge':
+            first = max(first, index)
+        else:
+            last = min(last, index)
+    return first, max(first, last)
+
+
+def unsupported_orderby(query):
+    """
+    Return the error of a query sorted on properties which do not lead its
+    $filter, which Graph rejects, or None.
+    """
+    orderby = [clause.split()[0]
+               for clause in query.get('$orderby', '').split(',') if clause.strip()]
+    if not orderby or not query.get('$filter'):
+        return None
+    filtered = re.findall(r'(\w+) (?:eq|ne|gt|ge|lt|le) ', query['$filter'])
+    if filtered[:len(orderby)] == orderby:
+        return None
+    return 400, {}, {'error': {
+        'code': 'InefficientFilter',
+        'message': 'The restriction or sort order is too complex for this operation.'}}
+
+
+@route('GET', '/users/([^/]+)/messages')
+def list_messages(graph, query, headers, body, user_id):
+    error = unsupported_orderby(query)
+    if error is not None:
+        return error
+    size = graph.page_size(query, headers)
+    first, last = received_range(graph, query)
+    skip = int(query.get('$skip', 0))
+    end = min(first + skip + size, last)
+    data = {'value': [graph.message(user_id, i) for i in range(first + skip, end)]}
+    if end < last:
+        data['@odata.nextLink'] = '{}/v1.0/users/{}/messages?{}'.format(
+            GRAPH_URL, user_id, urllib.parse.urlencode(dict(query, **{'$skip': end - first})))
+    return 200, {}, data
+
+
+@route('GET', '/users/([^/]+)/messages/\\$count')
+def count_messages(graph, query, headers, body, user_id):
+    first, last = received_range(graph, query)
+    return 200, {'Content-Type': 'text/plain'}, [str(last - first).encode('ascii')]
+
+
+def parse_query_datetime(value):
+    return datetime.fromisoformat(value.rstrip('Z'))
+
+
+@route('GET', '/users/([^/]+)/calendarView')
+def calendar_view(graph, query, headers, body, user_id):
+    start = parse_query_datetime(query['startDateTime'])
+    end = parse_query_datetime(query['endDateTime'])
+    # the events overlapping [start, end)
+    first = max(0, (start - graph.event_duration - EVENTS_START) // graph.event_interval + 1)
+    last = min(graph.events_count, -(-(end - EVENTS_START) // graph.event_interval))
+    size = graph.page_size(query, headers)
+    skip = int(query.get('$skip', 0))
+    indexes = range(first + skip, min(first + skip + size, last))
+    data = {'value': [graph.event(user_id, i) for i in indexes]}
+    if first + skip + size < last:
+        data['@odata.nextLink'] = '{}/v1.0/users/{}/calendarView?{}'.format(
+            GRAPH_URL, user_id, urllib.parse.urlencode(dict(query, **{'$skip': skip + size})))
+    return 200, {}, data
+
+
+@route('GET', '/users/([^/]+)/mailFolders/([^/]+)/messages/delta')
+def delta_messages(graph, query, headers, body, user_id, folder_id):
+    link = '{}/v1.0/users/{}/mailFolders/{}/messages/delta?'.format(GRAPH_URL, user_id, folder_id)
+    if query.get('$deltatoken') or query.get('$deltaToken'):
+        return 200, {}, {'value': [], '@odata.deltaLink': link + '$deltatoken=synced'}
+
+    size = graph.page_size(query, headers)
+    items, end = graph.page(user_id, int(query.get('$skiptoken', 0)), size)
+    data = {'value': items}
+    if end < graph.messages_count:
+        data['@odata.nextLink'] = link + urllib.parse.urlencode({'$skiptoken': end})
+    else:
+        data['@odata.deltaLink'] = link + '$deltatoken=synced'
+    return 200, {}, data
+
+
+@route('GET', '/users/([^/]+)/messages/([^/]+)')
+def get_message(graph, query, headers, body, user_id, message_id):
+    index = int(message_id.rpartition('-')[2] or 0)
+    return 200, {'ETag': 'W/"{}"'.format(index)}, graph.message(user_id, index)
+
+
+@route('PATCH', '/users/([^/]+)/messages/([^/]+)')
+def update_message(graph, query, headers, body, user_id, message_id):
+    index = int(message_id.rpartition('-')[2] or 0)
+    return 200, {}, dict(graph.message(user_id, index), **json.loads(body or '{}'))
+
+
+@route('DELETE', '/users/([^/]+)/messages/([^/]+)')
+def delete_message(graph, query, headers, body, user_id, message_id):
+    return 204, {}, None
+
+
+@route('POST', '/users/([^/]+)/messages/([^/]+)/move')
+def move_message(graph, query, headers, body, user_id, message_id):
+    index = int(message_id.rpartition('-')[2] or 0)
+    message = graph.message(user_id, index)
+    message.update(id='moved-' + message['id'], parentFolderId=json.loads(body)['DestinationId'])
+    return 201, {}, message
+
+
+def iter_content(size):
+    chunk = bytes(range(256)) * (CONTENT_CHUNK_SIZE // 256)
+    while size > 0:
+        yield chunk[:size]
+        size -= len(chunk)
+
+
+@route('GET', '/users/([^/]+)/messages/([^/]+)/\\$value')
+def get_message_content(graph, query, headers, body, user_id, message_id):
+    return 200, {'Content-Type': 'message/rfc822'}, iter_content(graph.content_size)
+
+
+@route('GET', '/users/([^/]+)/messages/([^/]+)/attachments/([^/]+)/\\$value')
+def get_attachment_content(graph, query, headers, body, user_id, message_id, attachment_id):
+    return 200, {'Content-Type': 'application/octet-stream'}, iter_content(graph.content_size)
+
+
+@route('POST', '/\\$batch')
+def batch(graph, query, headers, body):
+    responses = []
+    for request in json.loads(body)['requests']:
+        status, response_headers, data = graph.handle(
+            request['method'].upper(), '/v1.0' + request['url'], request.get('headers') or {},
+            json.dumps(request['body']) if 'body' in request else None, delay=False)
+        response = {'id': request['id'], 'status': status, 'headers': response_headers}
+        if isinstance(data, dict):
+            # as with Graph, no body for the 204 responses
+            response['body'] = data
+        responses.append(response)
+    return 200, {}, {'responses': responses}
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        status, headers, data = self.server.graph.handle(
+            self.command, self.path, self.headers, body)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if data is None:
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif isinstance(data, dict):
+            content = json.dumps(data).encode('utf-8')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in data:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGraphServer(object):
+    """Run a FakeGraph on a local port, in a background thread."""
+
+    def __init__(self, graph=None, host='127.0.0.1', port=0):
+        self.graph = graph or FakeGraph()
+        self.httpd = ThreadingHTTPServer((host, port), FakeGraphHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.graph = self.graph
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class LocalGraphAdapter(TimeoutHTTPAdapter):
+    """Send the requests for graph.microsoft.com to a FakeGraphServer."""
+
+    def __init__(self, server_url, **kwargs):
+        self.server_url = server_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        request.url = self.server_url + request.url[len(GRAPH_URL):]
+        return super().send(request, **kwargs)
+
+
+def local_session(server, pool_maxsize=32):
+    """Return a session of transport.build_session sending the Graph requests to server."""
+    session = build_session(max_concurrency=pool_maxsize)
+    session.mount(GRAPH_URL, LocalGraphAdapter(
+        server.url, pool_connections=1, pool_maxsize=pool_maxsize))
+    return session
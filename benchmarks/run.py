@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmarks of MicrosoftGraphClient against a local FakeGraphServer.
+
+    python -m benchmarks.run [--only pagination,batch] [--latency 0.02] [--json results.json]
+
+Every benchmark reports its duration, throughput, the p50/p95 latency of the
+requests (from the instrumentation events) and the peak of the memory
+allocated by Python while it runs (tracemalloc, disabled by --no-memory as
+it slows the benchmarks down).
+"""
+import argparse
+import io
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.instrumentation import BATCH, REQUEST, Instrumentation
+from office365_api.v2.retry import RetryPolicy
+from office365_api.v2.sync import MailboxSyncScheduler, MailFolderDelta, MessageBackfill
+
+from .fake_graph import (EVENTS_START, MESSAGE_INTERVAL, MESSAGES_START, FakeGraph,
+                         FakeGraphServer, local_session)
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class CountingSink(object):
+    """File-like sink counting the bytes written, without keeping them."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+class Result(object):
+    def __init__(self, name, duration, units, unit_name, latencies, peak_memory, requests_count):
+        self.name = name
+        self.duration = duration
+        self.units = units
+        self.unit_name = unit_name
+        self.latencies = latencies
+        self.peak_memory = peak_memory
+        self.requests_count = requests_count
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        if len(self.latencies) == 1:
+            return self.latencies[0]
+        return statistics.quantiles(self.latencies, n=100)[q - 1]
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'duration': self.duration,
+            'throughput': self.units / self.duration if self.duration else None,
+            'unit': self.unit_name + '/s',
+            'requests': self.requests_count,
+            'latency_p50': self.percentile(50),
+            'latency_p95': self.percentile(95),
+            'peak_memory': self.peak_memory,
+        }
+
+    def __str__(self):
+        data = self.to_dict()
+        memory = '{:.1f} MiB'.format(self.peak_memory / 2 ** 20) if self.peak_memory else '-'
+        latency = '{:.1f}/{:.1f} ms'.format(
+            data['latency_p50'] * 1000, data['latency_p95'] * 1000) if self.latencies else '-'
+        return '{:<24} {:>8.2f}s {:>12.1f} {:<10} {:>6} req  p50/p95 {:<18} peak {}'.format(
+            self.name, self.duration, data['throughput'] or 0, data['unit'],
+            self.requests_count, latency, memory)
+
+
+def run_benchmark(name, func, server, options):
+    latencies = []
+
+    def on_event(event):
+        if event.kind in (REQUEST, BATCH) and not event.cached:
+            latencies.append(event.latency)
+
+    client = MicrosoftGraphClient(
+        local_session(server, pool_maxsize=options.workers * 2),
+        retry_policy=RetryPolicy(max_retries=8, max_backoff=options.retry_after),
+        instrumentation=Instrumentation(on_event))
+    requests_before = server.graph.requests_count
+    if options.memory:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    try:
+        units, unit_name = func(client, options)
+        duration = time.perf_counter() - started_at
+        peak_memory = tracemalloc.get_traced_memory()[1] if options.memory else None
+    finally:
+        if options.memory:
+            tracemalloc.stop()
+        client.session.close()
+    return Result(name, duration, units, unit_name, sorted(latencies), peak_memory,
+                  server.graph.requests_count - requests_before)
+
+
+@benchmark('pagination')
+def bench_pagination(client, options):
+    count = sum(1 for _ in client.users('bench').message.iter_all(max_entries=options.page_size))
+    return count, 'items'
+
+
+@benchmark('pagination-prefetch')
+def bench_pagination_prefetch(client, options):
+    pages = client.users('bench').message.iter_pages(max_entries=options.page_size, prefetch=2)
+    count = sum(1 for _ in pages.items())
+    return count, 'items'
+
+
+@benchmark('pagination-streaming')
+def bench_pagination_streaming(client, options):
+    items = client.users('bench').message.iter_all(max_entries=options.page_size, streaming=True)
+    count = sum(1 for _ in items)
+    return count, 'items'
+
+
+def calendar_range(graph):
+    end = EVENTS_START + graph.events_count * graph.event_interval
+    return EVENTS_START.isoformat() + 'Z', end.isoformat() + 'Z'
+
+
+@benchmark('calendar')
+def bench_calendar(client, options):
+    start, end = calendar_range(options.graph)
+    events = client.users('bench').calendarview.iter_all(start, end, max_entries=options.page_size)
+    return sum(1 for _ in events), 'items'
+
+
+@benchmark('calendar-sharded')
+def bench_calendar_sharded(client, options):
+    start, end = calendar_range(options.graph)
+    events = client.users('bench').calendarview.iter_sharded(
+        start, end, max_workers=options.workers, max_entries=options.page_size)
+    return sum(1 for _ in events), 'items'
+
+
+@benchmark('backfill')
+def bench_backfill(client, options):
+    counts = []
+    end = MESSAGES_START + options.messages * MESSAGE_INTERVAL
+    backfill = MessageBackfill(
+        client, 'bench', lambda user_id, items, shard: counts.append(len(items)),
+        start_datetime=MESSAGES_START, end_datetime=end,
+        shard_size=max(options.messages // 8, options.page_size),
+        max_entries=options.page_size)
+    failed = [error for error in backfill.run().values() if isinstance(error, Exception)]
+    if failed:
+        raise failed[0]
+    return sum(counts), 'items'
+
+
+@benchmark('batch')
+def bench_batch(client, options):
+    batch = client.new_batch_request(beta=False, parallelism=options.workers)
+    results = []
+    for i in range(options.batch_requests):
+        batch.add({'method': 'GET', 'url': '/users/bench/messages/bench-{:08d}'.format(i)},
+                  callback=lambda request_id, body, error: results.append(error))
+    batch.execute()
+    return sum(1 for error in results if error is None), 'requests'
+
+
+@benchmark('bulk-update')
+def bench_bulk_update(client, options):
+    message_ids = ['bench-{:08d}'.format(i) for i in range(options.batch_requests)]
+    report = client.users('bench').message.bulk_update(
+        message_ids, {'isRead': True}, parallelism=options.workers)
+    return len(report.succeeded), 'items'
+
+
+@benchmark('download')
+def bench_download(client, options):
+    sink = CountingSink()
+    for i in range(options.downloads):
+        client.users('bench').attachment.download_content(
+            'bench-{:08d}'.format(i), 'attachment', sink)
+    return sink.size / 2 ** 20, 'MiB'
+
+
+@benchmark('multi-mailbox-sync')
+def bench_sync(client, options):
+    items = []
+    scheduler = MailboxSyncScheduler(
+        client, lambda user_id, resource, page, delta_token: items.append(len(page)),
+        max_workers=options.workers)
+    for i in range(options.mailboxes):
+        scheduler.add('mailbox{}'.format(i),
+                      MailFolderDelta('inbox', max_entries=options.page_size))
+    results = scheduler.run()
+    failed = [error for error in results.values() if isinstance(error, Exception)]
+    if failed:
+        raise failed[0]
+    return sum(items), 'items'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--only', help='comma separated benchmarks, among: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--messages', type=int, default=2000, help='messages per mailbox')
+    parser.add_argument('--events', type=int, default=2000, help='events per calendar')
+    parser.add_argument('--body-size', type=int, default=2048)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--batch-requests', type=int, default=400)
+    parser.add_argument('--downloads', type=int, default=4)
+    parser.add_argument('--content-size', type=int, default=32 * 2 ** 20,
+                        help='size of every downloaded content, in bytes')
+    parser.add_argument('--mailboxes', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added to every response')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='share of 429 responses')
+    parser.add_argument('--unavailable-rate', type=float, default=0, help='share of 503 responses')
+    parser.add_argument('--batch-failure-rate', type=float, default=0,
+                        help='share of $batch requests failing as a whole with a 503')
+    parser.add_argument('--retry-after', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='do not trace the peak memory')
+    parser.add_argument('--json', help='write the results to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    names = options.only.split(',') if options.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit('Unknown benchmarks: ' + ', '.join(unknown))
+
+    graph = FakeGraph(
+        messages_count=options.messages, body_size=options.body_size,
+        content_size=options.content_size, latency=options.latency,
+        throttle_rate=options.throttle_rate, unavailable_rate=options.unavailable_rate,
+        retry_after=options.retry_after, seed=options.seed, events_count=options.events,
+        batch_failure_rate=options.batch_failure_rate)
+    options.graph = graph
+    results = []
+    with FakeGraphServer(graph) as server:
+        for name in names:
+            result = run_benchmark(name, BENCHMARKS[name], server, options)
+            print(result)
+            results.append(result)
+
+    if options.json:
+        with io.open(options.json, 'w') as f:
+            json.dump([result.to_dict() for result in results], f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
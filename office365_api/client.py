@@ -2,13 +2,23 @@
 from .services import OutlookService
 from .services import CalendarService
 from .services import AttachmentService
+# the sessions of the v1 client are the ones of the v2 client: their errors
+# raised by the raise_for_status hook are handled by BaseAPIService._send
+from .v2.transport import build_session  # noqa: F401
 
 
 class Office365Client(object):
+    """
+    http: an httplib2-like object, whose request() returns (response, content)
+    session: a requests session used instead of http, see build_session
+    """
     api_version = 'v1.0'
 
-    def __init__(self, http):
+    def __init__(self, http=None, session=None):
+        if http is None and session is None:
+            raise ValueError('Either http or session is required')
         self.http = http
+        self.session = session
         self.outlook = OutlookService(self)
         self.calendar = CalendarService(self)
         self.attachment = AttachmentService(self)
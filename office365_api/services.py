@@ -3,12 +3,46 @@ import json
 import logging
 import urllib.parse
 
+from requests import HTTPError
+
 from .exceptions import Office365ClientError, Office365ServerError
 from .filters import BaseFilter
 
 logger = logging.getLogger(__name__)
 
 
+def delta_token_from_link(delta_link):
+    """Extract the $deltaToken value of an @odata.deltaLink, '' if there is none."""
+    delta_link_qs = urllib.parse.parse_qs(urllib.parse.urlparse(delta_link or '').query)
+    delta_token_qs = delta_link_qs.get('$deltaToken') or delta_link_qs.get('$deltatoken')
+    return delta_token_qs[0] if delta_token_qs else ''
+
+
+class PagedList(object):
+    """
+    Lazily iterate over the items of every page of a list.
+
+    The pages are requested one at a time, as the items are consumed, so that
+    a single page is held in memory. delta_token is set once the iteration
+    is complete.
+    """
+
+    def __init__(self, service, url, headers=None):
+        self.service = service
+        self.url = url
+        self.headers = headers
+        self.delta_token = ''
+
+    def __iter__(self):
+        next_link = self.url
+        response = {}
+        while next_link:
+            response = self.service.execute_request(next_link, headers=self.headers)
+            yield from response['value']
+            next_link = response.get('@odata.nextLink')
+        self.delta_token = delta_token_from_link(response.get('@odata.deltaLink'))
+
+
 class BaseService(object):
 
     def __init__(self, client):
@@ -30,36 +64,42 @@ class BaseAPIService(BaseService):
                           api_path=path,
                           query_string=filter_backend.get_query_string())
 
-    def get_list(self, filter_backend, path='', custom_headers={}):
+    def get_list(self, filter_backend, path='', custom_headers={}, lazy=False):
         """
         Retrieve list
-        """
-        result = []
-        delta_token = ''
-        next_link = self.get_complete_url(path=path or self.path,
-                                          filter_backend=filter_backend)
-        while next_link:
-            response = self.execute_request(next_link, headers=custom_headers)
-            result.extend(response['value'])
-            next_link = response.get('@odata.nextLink')
-            delta_link = response.get('@odata.deltaLink', '')
-            delta_link_qs = urllib.parse.parse_qs(
-                urllib.parse.urlparse(delta_link).query)
-            if not next_link and (delta_link_qs.get('$deltaToken') or delta_link_qs.get('$deltatoken')):
-                delta_token_qs = delta_link_qs.get(
-                    '$deltaToken') or delta_link_qs.get('$deltatoken')
-                delta_token = delta_token_qs[0] if delta_token_qs else ''
 
-        return result, delta_token
+        Return the items and the delta token, or with lazy a PagedList
+        yielding the items page by page, whose delta_token is set at the end.
+        """
+        url = self.get_complete_url(path=path or self.path,
+                                    filter_backend=filter_backend)
+        items = PagedList(self, url, headers=custom_headers)
+        if lazy:
+            return items
+        result = list(items)
+        return result, items.delta_token
+
+    def _send(self, url, method, body, headers):
+        """Send the request with the session or the http of the client, return (status, content)."""
+        session = getattr(self.client, 'session', None)
+        if session is None:
+            resp, content = self.client.http.request(
+                url, method=method, body=body, headers=headers)
+            return resp.status, content
+        try:
+            resp = session.request(method, url, data=body, headers=headers)
+        except HTTPError as e:
+            # sessions having a raise_for_status hook
+            resp = e.response
+        return resp.status_code, resp.content
 
     def execute_request(self, url, method='get', body=None, headers=None):
         """
         Try API request; if access_token is expired, request a new one
         """
         logger.info('{}: {}'.format(method.upper(), url))
-        resp, content = self.client.http.request(
-            url, method=method.upper(), body=body, headers=headers)
-        if resp.status == 200:
+        status, content = self._send(url, method.upper(), body, headers)
+        if status == 200:
             return json.loads(content)
         else:
             try:
@@ -67,14 +107,14 @@ class BaseAPIService(BaseService):
             except ValueError:
                 # server failed to returned valid json
                 # probably a critical error on the server happened
-                raise Office365ServerError(resp.status, content)
+                raise Office365ServerError(status, content)
             else:
-                raise Office365ClientError(resp.status, error_data)
+                raise Office365ClientError(status, error_data)
 
 
 class CalendarService(BaseAPIService):
 
-    def get_calendarview(self, filter_backend=None, **kwargs):
+    def get_calendarview(self, filter_backend=None, lazy=False, **kwargs):
         """
         Return all events from the Office365 Calendar with given datetime range
         """
@@ -82,12 +122,13 @@ class CalendarService(BaseAPIService):
             kwargs['$deltaToken'] = kwargs.pop('deltaToken')
         filter_backend = filter_backend or BaseFilter(custom_qs=kwargs)
         headers = {'Prefer': 'odata.track-changes,odata.maxpagesize=100'}
-        return self.get_list(filter_backend, path='/calendarView', custom_headers=headers)
+        return self.get_list(filter_backend, path='/calendarView', custom_headers=headers,
+                             lazy=lazy)
 
 
 class OutlookService(BaseAPIService):
 
-    def get_messages(self, filter_backend=None, **kwargs):
+    def get_messages(self, filter_backend=None, lazy=False, **kwargs):
         """
         Return all messages from the mailbox starting from a datetime given
         """
@@ -95,18 +136,18 @@ class OutlookService(BaseAPIService):
         headers = {'Prefer': 'outlook.allow-unsafe-html'}
         return self.get_list(filter_backend,
                              path='/MailFolders/AllItems/messages',
-                             custom_headers=headers)
+                             custom_headers=headers, lazy=lazy)
 
 
 class AttachmentService(BaseAPIService):
 
-    def get_attachments(self, message_id, filter_backend=None, **kwargs):
+    def get_attachments(self, message_id, filter_backend=None, lazy=False, **kwargs):
         """
         Return all attachments from a given message
         """
         filter_backend = filter_backend or BaseFilter(custom_qs=kwargs)
         path = '/messages/{}/attachments'.format(message_id)
-        return self.get_list(filter_backend, path=path)
+        return self.get_list(filter_backend, path=path, lazy=lazy)
 
     def get_attachment(self, message_id, attachment_id, filter_backend=None, **kwargs):
         """
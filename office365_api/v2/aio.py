@@ -0,0 +1,573 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio flavour of MicrosoftGraphClient.
+
+The services are the ones of the services module, mixed with
+AsyncServiceMixin so that every request method returns an awaitable. The
+http requests go through a pluggable AsyncTransport, and the number of
+requests in flight is capped per client.
+"""
+import abc
+import asyncio
+import functools
+import json
+import logging
+
+from .decoders import default_decoder
+from .exceptions import Office365ClientError, Office365ServerError
+from .instrumentation import BATCH, PAGE, REQUEST
+from .pagination import delta_token_from_link
+from .retry import RetryPolicy
+from .services import (DEFAULT_BATCH_MAX_ATTEMPTS, DEFAULT_BATCH_PARALLELISM,
+                       DEFAULT_CHUNK_SIZE, RETRIES_COUNT, SHARDED_ORDERBY, UPLOAD_CHUNK_SIZE,
+                       AttachmentService, BatchService, BulkReport, CalendarViewService,
+                       MessageService, OutlookServicesCollection, SubscriptionService,
+                       UploadSession, UserServicesCollection, UserServicesFactory,
+                       error_from_response, open_source, source_size)
+from .sharding import (DEFAULT_PAGES_AHEAD, DEFAULT_SHARD_WINDOW, DEFAULT_SHARD_WORKERS, WAIT,
+                       WindowMerger, WindowPagesScheduler, format_datetime, split_windows)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 100
+
+
+class AsyncTransport(abc.ABC):
+    """
+    Interface of the http layer of AsyncMicrosoftGraphClient.
+
+    request() returns a response exposing status_code, headers, content and
+    json(); stream() is an async iterator over the chunks of the response
+    body. Errors are not raised by the transport: responses with a status of
+    400 or more are turned into Office365 errors by the services.
+    connection_errors lists the exceptions worth retrying the request for.
+    """
+    connection_errors = (ConnectionResetError, )
+
+    @abc.abstractmethod
+    async def request(self, method, url, headers=None, data=None, json=None):
+        """Send the request and return its response."""
+
+    @abc.abstractmethod
+    def stream(self, method, url, headers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Return an async iterator over the chunks of the response body."""
+
+    async def close(self):
+        pass
+
+
+class HttpxTransport(AsyncTransport):
+    """AsyncTransport on top of an httpx.AsyncClient (the httpx package is required)."""
+
+    def __init__(self, client=None, **client_kwargs):
+        import httpx
+        self.client = client or httpx.AsyncClient(**client_kwargs)
+        self.connection_errors = (
+            ConnectionResetError, httpx.ConnectError, httpx.ReadError, httpx.RemoteProtocolError)
+
+    async def request(self, method, url, headers=None, data=None, json=None):
+        return await self.client.request(method, url, headers=headers, content=data, json=json)
+
+    async def stream(self, method, url, headers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        async with self.client.stream(method, url, headers=headers) as resp:
+            if resp.status_code >= 400:
+                await resp.aread()
+                raise error_from_response(resp)
+            async for chunk in resp.aiter_bytes(chunk_size):
+                yield chunk
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class AsyncPageIterator(object):
+    """Async counterpart of pagination.PageIterator, used with `async for`."""
+
+    def __init__(self, service, list_method, *args, **kwargs):
+        self.service = service
+        self.list_method = list_method
+        self.args = args
+        self.kwargs = kwargs
+        self.next_link = None
+        self.delta_link = None
+        self.pages_count = 0
+
+    @property
+    def delta_token(self):
+        return delta_token_from_link(self.delta_link)
+
+    async def __aiter__(self):
+        while self.pages_count == 0 or self.next_link:
+            if self.pages_count == 0:
+                resp, next_link = await self.list_method(*self.args, **self.kwargs)
+            else:
+                follow_kwargs = {}
+                if 'max_entries' in self.kwargs:
+                    follow_kwargs['max_entries'] = self.kwargs['max_entries']
+                resp, next_link = await self.service.follow_next_link(
+                    self.next_link, **follow_kwargs)
+            self.pages_count += 1
+            self.next_link = next_link
+            self.delta_link = resp.get('@odata.deltaLink', self.delta_link)
+            yield resp
+
+    def items(self, model=None):
+        return AsyncItemIterator(self, model)
+
+
+class AsyncItemIterator(object):
+    """Async counterpart of pagination.ItemIterator."""
+
+    def __init__(self, pages, model=None):
+        self.pages = pages
+        self.model = model
+
+    @property
+    def next_link(self):
+        return self.pages.next_link
+
+    @property
+    def delta_link(self):
+        return self.pages.delta_link
+
+    @property
+    def delta_token(self):
+        return self.pages.delta_token
+
+    async def __aiter__(self):
+        async for page in self.pages:
+            for item in page.get('value', []):
+                yield item if self.model is None else self.model(item)
+
+
+class AsyncServiceMixin(object):
+    """Run the requests of a service on the async transport of the client."""
+    __slots__ = ()
+
+    async def execute_paged_request(self, method, path, query_params=None, headers=None,
+                                    cacheable=False):
+        with self.measure(PAGE, method, path) as event:
+            resp = await self.execute_request(
+                method, path, query_params=query_params, headers=headers, cacheable=cacheable)
+            next_link = resp.get('@odata.nextLink')
+            event.items = len(resp.get('value', []))
+        return resp, next_link
+
+    async def execute_request(self, method, path, query_params=None, headers=None, body=None,
+                              parse_json_result=True, set_content_type=True, cacheable=False,
+                              json_body=None):
+        if json_body is not None:
+            body = json.dumps(json_body)
+        with self.measure(REQUEST, method, path) as event:
+            return await self._execute_request(
+                event, method, path, query_params=query_params, headers=headers, body=body,
+                parse_json_result=parse_json_result, set_content_type=set_content_type,
+                cacheable=cacheable)
+
+    async def _execute_request(self, event, method, path, query_params=None, headers=None,
+                               body=None, parse_json_result=True, set_content_type=True,
+                               cacheable=False):
+        full_url, default_headers = self.prepare_request(
+            path, query_params=query_params, headers=headers,
+            parse_json_result=parse_json_result, set_content_type=set_content_type)
+
+        cache, cache_key = self.response_cache(method, full_url, cacheable)
+        stale = None
+        if cache is not None:
+            data, stale = cache.lookup(cache_key)
+            if data is not None:
+                event.cached = True
+                return data
+            if stale is not None:
+                default_headers['If-None-Match'] = stale.etag
+
+        logger.info('{}: {}'.format(method.upper(), full_url))
+        event.bytes_out = len(body) if body else 0
+        transport = self.client.transport
+        retries = RETRIES_COUNT
+        attempt = 0
+        waited = 0
+        rate_limiter = self.client.rate_limiter
+        while True:
+            if rate_limiter is not None:
+                wait = max(rate_limiter.reserve(self.prefix), 0)
+                event.throttle_wait += wait
+                await asyncio.sleep(wait)
+            try:
+                async with self.client.semaphore:
+                    resp = await transport.request(
+                        method.upper(), full_url, headers=default_headers, data=body)
+            except transport.connection_errors:
+                retries -= 1
+                if retries == 0:
+                    raise
+                event.retries += 1
+                continue
+            event.status_code = resp.status_code
+            event.bytes_in = len(resp.content)
+            if resp.status_code < 400:
+                if rate_limiter is not None:
+                    rate_limiter.on_success(self.prefix)
+                break
+
+            error = error_from_response(resp)
+            delay = self.retry_delay(event, method, full_url, error, attempt, waited)
+            if delay is None:
+                raise error
+            attempt += 1
+            waited += delay
+            await asyncio.sleep(delay)
+
+        if stale is not None and resp.status_code == 304:
+            return cache.not_modified(cache_key, stale)
+        if parse_json_result:
+            try:
+                data = self.decode_json(resp.content)
+            except ValueError:
+                return resp.content
+            if cache is not None:
+                cache.store(cache_key, data, resp.headers.get('ETag'))
+            return data
+        return resp.content
+
+    async def execute_stream_request(self, method, path, query_params=None, headers=None,
+                                     chunk_size=DEFAULT_CHUNK_SIZE):
+        full_url, headers = self.prepare_request(
+            path, query_params=query_params, headers=headers, set_content_type=False)
+
+        logger.info('{}: {} (stream)'.format(method.upper(), full_url))
+        transport = self.client.transport
+        rate_limiter = self.client.rate_limiter
+        retries = RETRIES_COUNT
+        attempt = 0
+        waited = 0
+        with self.measure(REQUEST, method, path) as event:
+            while True:
+                if rate_limiter is not None:
+                    wait = max(rate_limiter.reserve(self.prefix), 0)
+                    event.throttle_wait += wait
+                    await asyncio.sleep(wait)
+                streamed = False
+                try:
+                    async with self.client.semaphore:
+                        async for chunk in transport.stream(
+                                method.upper(), full_url, headers=headers, chunk_size=chunk_size):
+                            if chunk:
+                                streamed = True
+                                event.bytes_in += len(chunk)
+                                yield chunk
+                    if rate_limiter is not None:
+                        rate_limiter.on_success(self.prefix)
+                    return
+                except (Office365ClientError, Office365ServerError) as error:
+                    # only retried as long as nothing has been yielded
+                    if streamed:
+                        raise
+                    event.status_code = error.status_code
+                    delay = self.retry_delay(event, method, full_url, error, attempt, waited)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    waited += delay
+                    await asyncio.sleep(delay)
+                except transport.connection_errors:
+                    retries -= 1
+                    if streamed or retries == 0:
+                        raise
+                    event.retries += 1
+
+    def to_model(self, result, model_class=None):
+        model_class = model_class or self.model_class
+        if model_class is None:
+            raise TypeError('{} has no model'.format(type(self).__name__))
+
+        async def wrap():
+            return model_class(await result)
+        return wrap()
+
+    def streaming(self):
+        raise TypeError('The pages of the async services cannot be streamed')
+
+    def iter_pages(self, *args, **kwargs):
+        return AsyncPageIterator(self, self.list, *args, **kwargs)
+
+    def iter_all(self, *args, streaming=False, as_model=False, **kwargs):
+        if streaming:
+            self.streaming()
+        return self.iter_pages(*args, **kwargs).items(self.model_class if as_model else None)
+
+    def iter_delta_pages(self, *args, **kwargs):
+        return AsyncPageIterator(self, self.delta_list, *args, **kwargs)
+
+    def iter_delta(self, *args, streaming=False, as_model=False, **kwargs):
+        if streaming:
+            self.streaming()
+        return self.iter_delta_pages(*args, **kwargs).items(
+            self.delta_model_class if as_model else None)
+
+
+async def write_chunks(chunks, sink):
+    """Async counterpart of services.write_chunks."""
+    if not hasattr(sink, 'write'):
+        with open(sink, 'wb') as f:
+            return await write_chunks(chunks, f)
+
+    written = 0
+    async for chunk in chunks:
+        sink.write(chunk)
+        written += len(chunk)
+    return written
+
+
+class AsyncAttachmentMixin(AsyncServiceMixin):
+    __slots__ = ()
+
+    async def list_first_page(self, message_id, _filter=None, fields=[]):
+        resp, _ = await self.list(message_id, _filter, fields)
+        return resp
+
+    async def download_content(self, message_id, attachment_id, sink, chunk_size=DEFAULT_CHUNK_SIZE):
+        return await write_chunks(
+            self.stream_content(message_id, attachment_id, chunk_size=chunk_size), sink)
+
+    async def create_upload_session(self, message_id, name, size, content_type=None,
+                                    is_inline=False, content_id=None):
+        path = '/messages/{}/attachments/createUploadSession'.format(message_id)
+        method = 'post'
+        body = {'AttachmentItem': self._upload_item(
+            name, size, content_type=content_type, is_inline=is_inline, content_id=content_id)}
+        resp = await self.execute_request(method, path, json_body=body)
+        return UploadSession(resp['uploadUrl'], retry_policy=self.client.retry_policy)
+
+    async def upload(self, message_id, source, name=None, content_type=None, is_inline=False,
+                     content_id=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        """The ranges are sent by the blocking UploadSession, on the default executor."""
+        name = self._upload_name(source, name)
+        with open_source(source) as f:
+            size = source_size(f)
+            upload_session = await self.create_upload_session(
+                message_id, name, size, content_type=content_type, is_inline=is_inline,
+                content_id=content_id)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(
+                upload_session.upload, f, size=size, chunk_size=chunk_size))
+
+
+async def iter_window_pages(fetch, windows, max_workers=DEFAULT_SHARD_WORKERS,
+                            max_pages_ahead=DEFAULT_PAGES_AHEAD):
+    """Async counterpart of sharding.iter_window_pages, fetch returning a coroutine."""
+    scheduler = WindowPagesScheduler(windows, max_workers, max_pages_ahead)
+    try:
+        while True:
+            scheduler.collect()
+            for pages in scheduler.to_fetch():
+                pages.task = asyncio.ensure_future(fetch(pages.window, pages.next_link))
+            item = scheduler.pop()
+            if item is None:
+                break
+            if item is WAIT:
+                await asyncio.wait(scheduler.running(), return_when=asyncio.FIRST_COMPLETED)
+                continue
+            yield item
+    finally:
+        # the iteration may be stopped early: cancel the pages being fetched
+        for task in scheduler.running():
+            task.cancel()
+
+
+class AsyncCalendarViewMixin(AsyncServiceMixin):
+    __slots__ = ()
+
+    async def iter_sharded(self, start_datetime, end_datetime, window=DEFAULT_SHARD_WINDOW,
+                           max_workers=DEFAULT_SHARD_WORKERS, as_model=False, **kwargs):
+        """Async counterpart of CalendarViewService.iter_sharded, used with `async for`."""
+        kwargs = self._sharded_kwargs(kwargs)
+
+        async def fetch(window, next_link):
+            if next_link:
+                return await self.follow_next_link(next_link, **self._follow_kwargs(kwargs))
+            start, end = window
+            return await self.list(format_datetime(start), format_datetime(end),
+                                   _orderby=SHARDED_ORDERBY, **kwargs)
+
+        model = self.model_class if as_model else None
+        merger = WindowMerger()
+        windows = split_windows(start_datetime, end_datetime, window)
+        async for (_, window_end), page in iter_window_pages(
+                fetch, windows, max_workers=max_workers):
+            for event in merger.merge(window_end, page.get('value', [])):
+                yield event if model is None else model(event)
+
+
+class AsyncMessageMixin(AsyncServiceMixin):
+    __slots__ = ()
+
+    async def execute_bulk(self, item_ids, describe, parallelism=DEFAULT_BATCH_PARALLELISM,
+                           max_attempts=DEFAULT_BATCH_MAX_ATTEMPTS):
+        """Async counterpart of BulkMixin.execute_bulk, the bulk_* methods return coroutines."""
+        deferred = self.deferred()
+        report = BulkReport()
+        item_ids = iter(item_ids)
+        while True:
+            batch = self._bulk_batch(
+                AsyncBatchService, item_ids, describe, deferred, report, parallelism,
+                max_attempts)
+            if batch.is_empty:
+                break
+            await batch.execute()
+        logger.info('{}: bulk operation on {}x items, {}x failed'.format(
+            self.service_name, len(report), len(report.failed)))
+        return report
+
+    async def count(self, _filter=None, folder_id=None):
+        path = '/messages/$count'
+        if folder_id:
+            path = '/mailFolders/{}/messages/$count'.format(folder_id)
+        method = 'get'
+        query_params = {'$filter': _filter} if _filter else None
+        return int(await self.execute_request(method, path, query_params=query_params))
+
+    async def download_raw(self, message_id, sink, chunk_size=DEFAULT_CHUNK_SIZE):
+        return await write_chunks(self.stream_raw(message_id, chunk_size=chunk_size), sink)
+
+
+_MIXINS = {
+    AttachmentService: AsyncAttachmentMixin,
+    CalendarViewService: AsyncCalendarViewMixin,
+    MessageService: AsyncMessageMixin,
+}
+_async_classes = {}
+
+
+def async_service_class(service_class):
+    """Return the async flavour of a service class."""
+    if service_class not in _async_classes:
+        mixin = _MIXINS.get(service_class, AsyncServiceMixin)
+        _async_classes[service_class] = type(
+            'Async' + service_class.__name__, (mixin, service_class),
+            {'__slots__': (), 'service_name': service_class.service_name})
+    return _async_classes[service_class]
+
+
+class AsyncCollectionMixin(object):
+    def _build(self, service_class):
+        if service_class is OutlookServicesCollection:
+            return AsyncOutlookServicesCollection(self.client, self.prefix)
+        return async_service_class(service_class)(self.client, self.prefix)
+
+
+class AsyncOutlookServicesCollection(AsyncCollectionMixin, OutlookServicesCollection):
+    pass
+
+
+class AsyncUserServicesCollection(AsyncCollectionMixin, UserServicesCollection):
+    pass
+
+
+class AsyncUserServicesFactory(UserServicesFactory):
+    collection_class = AsyncUserServicesCollection
+
+
+class AsyncBatchService(BatchService):
+    service_name = BatchService.service_name
+
+    async def _execute(self, requests):
+        if self.is_empty:
+            raise Office365ClientError('No requests to execute in a batch')
+        method = 'POST'
+        default_headers = {'Content-Type': 'application/json'}
+
+        logger.info('{}: {} with {}x requests'.format(
+            method, self.batch_uri, len(requests)))
+        with self.measure(BATCH, method, '/$batch') as event:
+            event.batch_size = len(requests)
+            event.throttle_wait = max(self._reserve_rate_limit(requests), 0)
+            await asyncio.sleep(event.throttle_wait)
+            async with self.client.semaphore:
+                resp = await self.client.transport.request(
+                    method, self.batch_uri, headers=default_headers, json={'requests': requests})
+            event.status_code = resp.status_code
+            event.bytes_in = len(resp.content)
+            if resp.status_code >= 400:
+                error = error_from_response(resp)
+                self._report_rate_limit(requests, error=error)
+                raise error
+            result = self.decode_json(resp.content)
+            self._report_rate_limit(requests, result=result)
+        return result
+
+    async def _execute_round(self, requests):
+        semaphore = asyncio.Semaphore(max(self.parallelism, 1))
+
+        async def execute_chunk(chunk):
+            async with semaphore:
+                try:
+                    return await self._execute(chunk)
+                except (Office365ClientError, Office365ServerError) as e:
+                    return e
+
+        chunks = self._split(requests)
+        outcomes = await asyncio.gather(*[execute_chunk(chunk) for chunk in chunks])
+        for chunk, outcome in zip(chunks, outcomes):
+            self._store_outcome(chunk, outcome)
+
+    async def execute(self):
+        requests = self._prepare_requests()
+        if not requests:
+            return
+        attempt = 1
+        waited = 0
+        while True:
+            await self._execute_round(requests)
+            requests, delay = self._retry_requests(requests)
+            if not self._retries(requests, delay, attempt, waited):
+                break
+            attempt += 1
+            waited += delay
+            await asyncio.sleep(delay)
+        self._run_callbacks()
+
+
+class AsyncMicrosoftGraphClient(object):
+    """
+    Asyncio counterpart of MicrosoftGraphClient.
+
+    transport: an AsyncTransport, in charge of the authentication
+    max_concurrency: maximum number of requests in flight for this client
+    retry_policy: a retry.RetryPolicy, see MicrosoftGraphClient
+    rate_limiter: an optional throttling.RateLimiter
+    response_cache: an optional cache.ResponseCache
+    json_decoder: a decoders.JSONDecoder, the fastest one available by default
+    projection_profile: the projections profile requested by default
+    instrumentation: an optional instrumentation.Instrumentation
+    """
+
+    def __init__(self, transport, max_concurrency=DEFAULT_MAX_CONCURRENCY, retry_policy=None,
+                 rate_limiter=None, response_cache=None, json_decoder=None,
+                 projection_profile=None, instrumentation=None):
+        self.transport = transport
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        self.json_decoder = json_decoder or default_decoder()
+        self.projection_profile = projection_profile
+        self.instrumentation = instrumentation
+
+        self.users = AsyncUserServicesFactory(self)
+        self.me = self.users('me')
+        self.subscription = async_service_class(SubscriptionService)(self, '')
+
+    def new_batch_request(self, beta=True, parallelism=DEFAULT_BATCH_PARALLELISM,
+                          max_attempts=DEFAULT_BATCH_MAX_ATTEMPTS):
+        return AsyncBatchService(client=self, beta=beta, parallelism=parallelism,
+                                 max_attempts=max_attempts)
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
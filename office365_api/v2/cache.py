@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Opt-in cache of the responses of rarely changing resources."""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 300
+
+
+class CacheStats(object):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # stale entries confirmed by a 304 Not Modified response
+        self.revalidations = 0
+
+    def __repr__(self):
+        return '<CacheStats hits={} misses={} revalidations={}>'.format(
+            self.hits, self.misses, self.revalidations)
+
+
+class CacheEntry(object):
+    def __init__(self, data, etag, expires_at):
+        self.data = data
+        self.etag = etag
+        self.expires_at = expires_at
+
+
+class ResponseCache(object):
+    """
+    LRU cache of GET responses, shared by the services of a client.
+
+    The keys are (prefix, service name, url), so that entries are never
+    shared between mailboxes. Entries are served without a request for ttl
+    seconds; a stale entry having an ETag is revalidated with If-None-Match,
+    and served again when the response is 304 Not Modified. Any other
+    request of a service drops the entries of that service for the mailbox.
+    Hits and misses are counted per service name in `stats`.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def _stats(self, service_name):
+        if service_name not in self.stats:
+            self.stats[service_name] = CacheStats()
+        return self.stats[service_name]
+
+    def lookup(self, key):
+        """
+        Return (data, stale) for the request of key.
+
+        data is a copy of the cached response if it is fresh, None otherwise;
+        stale is the stale entry to revalidate with the If-None-Match of its
+        etag, if any, and to pass to not_modified.
+        """
+        service_name = key[1]
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, None
+            self.entries.move_to_end(key)
+            if entry.expires_at > time.monotonic():
+                self._stats(service_name).hits += 1
+                return copy.deepcopy(entry.data), None
+            if not entry.etag:
+                del self.entries[key]
+                return None, None
+            return None, entry
+
+    def not_modified(self, key, entry):
+        """Refresh the stale entry of key after a 304 response and return a copy of its data."""
+        with self.lock:
+            entry.expires_at = time.monotonic() + self.ttl
+            self._stats(key[1]).revalidations += 1
+            # the entry may have been evicted since it was looked up
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self._evict()
+            return copy.deepcopy(entry.data)
+
+    def store(self, key, data, etag=None):
+        with self.lock:
+            self._stats(key[1]).misses += 1
+            self.entries[key] = CacheEntry(
+                copy.deepcopy(data), etag, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, prefix, service_name):
+        """Drop the entries of a service for the mailbox of prefix."""
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == prefix and k[1] == service_name]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
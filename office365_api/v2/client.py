@@ -1,15 +1,75 @@
 # -*- coding: utf-8 -*-
-from .services import BatchService, SubscriptionFactory, UserServicesFactory
+import threading
+from contextlib import contextmanager
+
+from .coalescing import DEFAULT_COALESCE_WINDOW, Coalescer
+from .decoders import default_decoder
+from .retry import RetryPolicy
+from .services import (DEFAULT_BATCH_MAX_ATTEMPTS, DEFAULT_BATCH_PARALLELISM, BatchService,
+                       SubscriptionFactory, UserServicesFactory)
 
 
 class MicrosoftGraphClient(object):
-    def __init__(self, session):
+    def __init__(self, session, retry_policy=None, rate_limiter=None, response_cache=None,
+                 json_decoder=None, projection_profile=None, instrumentation=None,
+                 coalesce_window=None):
         self.http = None  # backward compatibility
         self.session = session
+        # retries the throttled (429) and unavailable (503/504) idempotent requests
+        self.retry_policy = retry_policy or RetryPolicy()
+        # optional throttling.RateLimiter shared by the threads using the client
+        self.rate_limiter = rate_limiter
+        # optional cache.ResponseCache of the rarely changing resources
+        self.response_cache = response_cache
+        # decoders.JSONDecoder of the responses, orjson when it is installed
+        self.json_decoder = json_decoder or default_decoder()
+        # name of the projections profile requested by default, such as 'sync-headers'
+        self.projection_profile = projection_profile
+        # optional instrumentation.Instrumentation receiving the events of the requests
+        self.instrumentation = instrumentation
+        # coalescing.Coalescer gathering the GET requests in batches, see coalescing()
+        self.coalescer = Coalescer(self, coalesce_window) if coalesce_window else None
+        # users of the coalescer: the coalescing() blocks, and the client itself
+        # when coalesce_window is given; it is dropped when none is left
+        self._coalescing = 1 if self.coalescer is not None else 0
+        self._coalescing_lock = threading.Lock()
 
         self.users = UserServicesFactory(self)
         self.me = self.users('me')
         self.subscription = SubscriptionFactory(self)()
 
-    def new_batch_request(self, beta=True):
-        return BatchService(client=self, beta=beta)
+    def new_batch_request(self, beta=True, parallelism=DEFAULT_BATCH_PARALLELISM,
+                          max_attempts=DEFAULT_BATCH_MAX_ATTEMPTS):
+        """
+        Return a BatchService.
+
+        parallelism: chunks of MAX_BATCH_SIZE requests sent concurrently
+        max_attempts: rounds sending again the throttled idempotent requests
+        """
+        return BatchService(client=self, beta=beta, parallelism=parallelism,
+                            max_attempts=max_attempts)
+
+    @contextmanager
+    def coalescing(self, window=DEFAULT_COALESCE_WINDOW):
+        """
+        Coalesce the GET requests of the client in batches within the block.
+
+        The coalescer is shared by the client: the blocks entered by several
+        threads at a time use the same one, flushed and dropped when the
+        last of them exits.
+        """
+        with self._coalescing_lock:
+            if self.coalescer is None:
+                self.coalescer = Coalescer(self, window)
+            self._coalescing += 1
+            coalescer = self.coalescer
+        try:
+            yield coalescer
+        finally:
+            with self._coalescing_lock:
+                self._coalescing -= 1
+                last = self._coalescing == 0
+                if last:
+                    self.coalescer = None
+            if last:
+                coalescer.flush()
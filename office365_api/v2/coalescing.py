@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing of the individual GET requests of a client into $batch requests.
+
+While a client has a Coalescer, the GET requests returning json (get, list,
+the next pages...) are not sent right away: they are queued for `window`
+seconds, then the queued requests are sent together through a
+BatchService, MAX_BATCH_SIZE at a time. Every caller blocks until its own
+result is known, and gets it (or its exception) back, as without
+coalescing.
+
+    with client.coalescing():
+        events = list(executor.map(client.me.event.get, event_ids))
+
+The gain comes from the calls made concurrently by several threads: a
+single thread issuing one call at a time only pays the window on top of
+every call.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import Future
+
+from .exceptions import Office365ServerError
+from .services import DEFAULT_BATCH_PARALLELISM, MAX_BATCH_SIZE, BatchService
+
+logger = logging.getLogger(__name__)
+
+# seconds the requests wait for other ones to be batched with
+DEFAULT_COALESCE_WINDOW = 0.01
+
+
+class Coalescer(object):
+    """
+    Gather the requests of a client in $batch requests.
+
+    window: seconds a request waits for other ones; the queued requests are
+    sent as soon as they fill MAX_BATCH_SIZE * parallelism batch items
+    parallelism: batches of MAX_BATCH_SIZE requests sent concurrently
+    """
+
+    def __init__(self, client, window=DEFAULT_COALESCE_WINDOW,
+                 parallelism=DEFAULT_BATCH_PARALLELISM):
+        self.client = client
+        self.window = window
+        self.parallelism = parallelism
+        self.max_pending = MAX_BATCH_SIZE * parallelism
+        self.lock = threading.Lock()
+        # api version -> [(request, future)]
+        self.pending = {}
+        self.timer = None
+
+    def accepts(self, service, method, body=None, parse_json_result=True, cacheable=False):
+        """Whether the request may be coalesced: the GET requests returning json data."""
+        if method.upper() != 'GET' or body is not None or not parse_json_result:
+            return False
+        # the cached requests are served by the response cache instead
+        return not (cacheable and service.response_cached and
+                    getattr(self.client, 'response_cache', None) is not None)
+
+    def submit(self, service, method, path, query_params=None, headers=None):
+        """Queue the request, wait for its batch and return its json data."""
+        request = service.describe_request(
+            method, path, query_params=query_params, headers=headers)
+        future = Future()
+        version = service.graph_api_version
+        with self.lock:
+            queue = self.pending.setdefault(version, [])
+            queue.append((request, future))
+            full = len(queue) >= self.max_pending
+            if full:
+                del self.pending[version]
+            elif self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if full:
+            self._send(version, queue)
+        return future.result()
+
+    def flush(self):
+        """Send the queued requests now."""
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        for version, queue in pending.items():
+            self._send(version, queue)
+
+    def _send(self, version, queue):
+        logger.info('Coalescing {}x requests in a batch'.format(len(queue)))
+        batch = BatchService(self.client, beta=version == 'beta', parallelism=self.parallelism)
+        for request, future in queue:
+            batch.add(request, callback=resolve_callback(future))
+        try:
+            batch.execute()
+        except Exception as e:
+            for _, future in queue:
+                if not future.done():
+                    future.set_exception(e)
+
+
+def resolve_callback(future):
+    """Return a BatchService callback setting the result or the exception of future."""
+    def callback(request_id, body, error):
+        if error is None:
+            future.set_result(body)
+        elif error.status_code >= 500 and not isinstance(error, Office365ServerError):
+            # as raised by execute_request
+            future.set_exception(Office365ServerError(
+                error.status_code, json.dumps(body), retry_after=error.retry_after))
+        else:
+            future.set_exception(error)
+    return callback
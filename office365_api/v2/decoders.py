@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""JSON decoding of the responses, with an optional faster backend and an incremental mode."""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# bytes significant outside of a string, and inside of a string
+_STRUCTURAL = re.compile(rb'["\[\]{},]')
+_STRING_SPECIAL = re.compile(rb'["\\]')
+# the top level text preceding the array of items
+_VALUE_KEY = re.compile(rb'"value"\s*:\s*\[$')
+
+
+class JSONDecoder(object):
+    """Decode json documents with the json module of the standard library."""
+
+    def loads(self, content):
+        return json.loads(content)
+
+
+class OrjsonDecoder(JSONDecoder):
+    """
+    Decode json documents with orjson (the orjson package is required).
+
+    orjson rejects some documents the json module accepts, such as lone
+    UTF-16 surrogates (a bodyPreview cut in the middle of an emoji): those
+    are decoded with the json module.
+    """
+
+    def loads(self, content):
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return json.loads(content)
+
+
+def default_decoder():
+    """Return the fastest decoder available."""
+    return OrjsonDecoder() if orjson is not None else JSONDecoder()
+
+
+class StreamingPage(object):
+    """
+    Decode an odata page incrementally from the chunks of its body.
+
+    items() yields the items of the 'value' array one by one, each decoded
+    as soon as its last byte is received, so that only one item (and one
+    chunk) is held in memory at a time. The other top level members
+    (@odata.nextLink, @odata.deltaLink...) are set in `metadata` once
+    items() is exhausted.
+    """
+
+    def __init__(self, chunks, decoder=None):
+        self.chunks = chunks
+        self.decoder = decoder or default_decoder()
+        self.metadata = None
+
+    def get(self, key, default=None):
+        if self.metadata is None:
+            raise RuntimeError('The metadata is available once the items are consumed')
+        return self.metadata.get(key, default)
+
+    def items(self):
+        loads = self.decoder.loads
+        buf = bytearray()
+        # top level document, without the items
+        rest = bytearray()
+        # next byte of buf to scan, first byte not copied to rest yet, first
+        # byte of the current item
+        pos = start = item_start = 0
+        depth = 0
+        in_string = False
+        in_items = False
+
+        for chunk in self.chunks:
+            buf += chunk
+            while True:
+                if in_string:
+                    m = _STRING_SPECIAL.search(buf, pos)
+                    if m is None:
+                        pos = len(buf)
+                        break
+                    if buf[m.start()] == 0x5c:  # backslash, skip the escaped byte
+                        if m.start() + 1 >= len(buf):
+                            pos = m.start()
+                            break
+                        pos = m.start() + 2
+                        continue
+                    in_string = False
+                    pos = m.end()
+                    continue
+
+                m = _STRUCTURAL.search(buf, pos)
+                if m is None:
+                    pos = len(buf)
+                    break
+                c = buf[m.start()]
+                pos = m.end()
+                if c == 0x22:  # "
+                    in_string = True
+                elif c in (0x5b, 0x7b):  # [ {
+                    depth += 1
+                    if depth == 2 and not in_items and c == 0x5b:
+                        rest += buf[start:pos]
+                        start = pos
+                        if _VALUE_KEY.search(rest):
+                            in_items = True
+                            item_start = pos
+                elif c in (0x5d, 0x7d):  # ] }
+                    if in_items and depth == 2:
+                        item = bytes(buf[item_start:m.start()])
+                        if item.strip():
+                            yield loads(item)
+                        in_items = False
+                        start = m.start()
+                    depth -= 1
+                elif c == 0x2c and in_items and depth == 2:  # ,
+                    yield loads(bytes(buf[item_start:m.start()]))
+                    item_start = pos
+
+            # drop the bytes which are not needed anymore
+            if in_items:
+                drop = item_start
+                item_start = 0
+            else:
+                rest += buf[start:pos]
+                drop = pos
+            del buf[:drop]
+            pos -= drop
+            start = 0
+
+        rest += buf[start:]
+        metadata = loads(bytes(rest))
+        metadata.pop('value', None)
+        self.metadata = metadata
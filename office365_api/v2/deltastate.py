@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Persistence of the progress of delta queries, per mailbox and resource."""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class DeltaState(object):
+    """
+    Progress of a delta query.
+
+    next_link: link of the next page while the query is paginating
+    delta_token: token of the last completed query, to fetch the next changes
+    checkpoint: progress of a query which is not a delta query, such as a
+    sync.MessageBackfill shard; never sent to Graph
+    """
+
+    def __init__(self, next_link=None, delta_token=None, updated_at=None, checkpoint=None):
+        self.next_link = next_link
+        self.delta_token = delta_token
+        self.updated_at = updated_at or time.time()
+        self.checkpoint = checkpoint
+
+    def to_dict(self):
+        return {
+            'next_link': self.next_link,
+            'delta_token': self.delta_token,
+            'updated_at': self.updated_at,
+            'checkpoint': self.checkpoint,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('next_link'), data.get('delta_token'), data.get('updated_at'),
+                   data.get('checkpoint'))
+
+    def __repr__(self):
+        return '<DeltaState next_link={!r} delta_token={!r} checkpoint={!r}>'.format(
+            self.next_link, self.delta_token, self.checkpoint)
+
+
+class DeltaStateStore(object):
+    """Interface of the delta state backends, keyed by mailbox and resource."""
+
+    def get(self, mailbox, resource):
+        """Return the DeltaState of the resource, or None."""
+        raise NotImplementedError
+
+    def save(self, mailbox, resource, state):
+        raise NotImplementedError
+
+    def delete(self, mailbox, resource):
+        raise NotImplementedError
+
+
+class MemoryDeltaStateStore(DeltaStateStore):
+    def __init__(self):
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def get(self, mailbox, resource):
+        with self.lock:
+            data = self.states.get((mailbox, resource))
+        return DeltaState.from_dict(data) if data else None
+
+    def save(self, mailbox, resource, state):
+        with self.lock:
+            self.states[(mailbox, resource)] = state.to_dict()
+
+    def delete(self, mailbox, resource):
+        with self.lock:
+            self.states.pop((mailbox, resource), None)
+
+
+class SQLiteDeltaStateStore(DeltaStateStore):
+    """Store the states in a table of a SQLite database, shared by the threads of a process."""
+
+    def __init__(self, path, table='delta_state'):
+        self.table = table
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS {} ('
+                'mailbox TEXT NOT NULL, resource TEXT NOT NULL, next_link TEXT, '
+                'delta_token TEXT, updated_at REAL, checkpoint TEXT, '
+                'PRIMARY KEY (mailbox, resource))'.format(self.table))
+            columns = [row[1] for row in self.connection.execute(
+                'PRAGMA table_info({})'.format(self.table))]
+            if 'checkpoint' not in columns:
+                # a table created before the checkpoints
+                self.connection.execute(
+                    'ALTER TABLE {} ADD COLUMN checkpoint TEXT'.format(self.table))
+
+    def get(self, mailbox, resource):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT next_link, delta_token, updated_at, checkpoint FROM {} '
+                'WHERE mailbox = ? AND resource = ?'.format(self.table),
+                (mailbox, resource)).fetchone()
+        return DeltaState(*row) if row else None
+
+    def save(self, mailbox, resource, state):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO {} '
+                '(mailbox, resource, next_link, delta_token, updated_at, checkpoint) '
+                'VALUES (?, ?, ?, ?, ?, ?)'.format(self.table),
+                (mailbox, resource, state.next_link, state.delta_token, state.updated_at,
+                 state.checkpoint))
+
+    def delete(self, mailbox, resource):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM {} WHERE mailbox = ? AND resource = ?'.format(self.table),
+                (mailbox, resource))
+
+    def close(self):
+        self.connection.close()
+
+
+class FileDeltaStateStore(DeltaStateStore):
+    """Store every state in a JSON file of directory, replaced atomically on save."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, mailbox, resource):
+        name = hashlib.sha1('{}\n{}'.format(mailbox, resource).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.json')
+
+    def get(self, mailbox, resource):
+        try:
+            with open(self._path(mailbox, resource)) as f:
+                return DeltaState.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def save(self, mailbox, resource, state):
+        data = dict(state.to_dict(), mailbox=mailbox, resource=resource)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path(mailbox, resource))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def delete(self, mailbox, resource):
+        try:
+            os.unlink(self._path(mailbox, resource))
+        except FileNotFoundError:
+            pass
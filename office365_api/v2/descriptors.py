@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Descriptions of requests which are not sent, returned by the deferred services.
+
+    batch = client.new_batch_request()
+    events = client.users(user_id).event.deferred()
+    batch.add(events.get(event_id), callback=on_event)
+    batch.add(events.create(subject='Sync', ...), callback=on_created)
+    batch.execute()
+"""
+
+
+class RequestDescriptor(object):
+    """
+    A request, relative to the api version, as accepted by BatchService.add.
+
+    body: the json data of the request, not serialized
+    model_class: the models.Model the response is wrapped in, if any
+    """
+    __slots__ = ('method', 'url', 'headers', 'body', 'model_class')
+
+    def __init__(self, method, url, headers=None, body=None, model_class=None):
+        self.method = method.upper()
+        self.url = url
+        self.headers = headers
+        self.body = body
+        self.model_class = model_class
+
+    def to_batch_request(self):
+        """Return the item of the requests of a $batch request body."""
+        request = {'method': self.method, 'url': self.url}
+        headers = dict(self.headers or {})
+        if self.body is not None:
+            # required by $batch for the requests having a body
+            headers.setdefault('Content-Type', 'application/json')
+            request['body'] = self.body
+        if headers:
+            request['headers'] = headers
+        return request
+
+    def __repr__(self):
+        return '<RequestDescriptor {} {}>'.format(self.method, self.url)
@@ -4,8 +4,10 @@ import json
 
 class Office365ClientError(Exception):
 
-    def __init__(self, status_code, data):
+    def __init__(self, status_code, data, retry_after=None):
         self.status_code = status_code
+        # seconds to wait before retrying, as given by the Retry-After header
+        self.retry_after = retry_after
         data = data or {}
         self.error_code = data.get('error', {}).get('code', '')
         self.error_message = data.get('error', {}).get('message', '')
@@ -32,6 +34,10 @@ class Office365ClientError(Exception):
     def is_not_found(self):
         return self.status_code == 404
 
+    @property
+    def is_throttled(self):
+        return self.status_code == 429
+
     @property
     def is_expired_sync_token(self):
         return (self.error_code or '').lower() == 'syncstatenotfound'
@@ -43,10 +49,11 @@ class Office365ClientError(Exception):
 
 class Office365ServerError(Exception):
 
-    def __init__(self, status_code, body):
+    def __init__(self, status_code, body, retry_after=None):
         super(Office365ServerError, self).__init__(
             '{}: {}'.format(status_code, body))
         self.status_code = status_code
+        self.retry_after = retry_after
         try:
             data = json.loads(body)
             self.error_code = data['error']['code']
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Events fired for every request, page and batch run by a client.
+
+Pass an Instrumentation to the client and add listeners to it: any callable
+taking an Event. HistogramAggregator is a ready-made listener aggregating
+the events per endpoint and mailbox, which exports them in the Prometheus
+text format; OpenTelemetryListener records them with an OpenTelemetry meter.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# kinds of events
+REQUEST = 'request'
+PAGE = 'page'
+BATCH = 'batch'
+
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DEFAULT_LABELS = ('kind', 'service', 'http_method', 'endpoint', 'mailbox', 'status')
+
+# path segments which are resource ids rather than part of the endpoint
+_KEY_SEGMENT = re.compile(r"^([^(]+)\(.*\)$")
+
+
+def endpoint_template(path):
+    """
+    Return path without its ids and query string, to be used as a label.
+
+    '/messages/AAMkAD...=/attachments' -> '/messages/{id}/attachments'
+    """
+    segments = []
+    for segment in path.split('?')[0].strip('/').split('/'):
+        match = _KEY_SEGMENT.match(segment)
+        if match:
+            segment = match.group(1) + '({id})'
+        elif len(segment) >= 32 or '=' in segment or segment.isdigit():
+            segment = '{id}'
+        segments.append(segment)
+    return '/' + '/'.join(segments)
+
+
+class Event(object):
+    """
+    Figures of a request, a page or a batch.
+
+    latency: seconds from the call to the response, including the retries and
+    the throttle_wait (seconds spent waiting for the rate limiter and before
+    the retries)
+    bytes_in, bytes_out: size of the response and request bodies
+    status_code: of the last response, None when no response was received
+    cached: served from the response cache of the client
+    items: number of items of a page
+    batch_size: number of requests of a batch
+    error: the exception raised by the call, if any
+    """
+    __slots__ = ('kind', 'service', 'http_method', 'endpoint', 'mailbox', 'status_code',
+                 'latency', 'bytes_in', 'bytes_out', 'retries', 'throttle_wait', 'cached',
+                 'items', 'batch_size', 'error')
+
+    def __init__(self, kind, service=None, http_method=None, endpoint=None, mailbox=None):
+        self.kind = kind
+        self.service = service
+        self.http_method = http_method
+        self.endpoint = endpoint
+        self.mailbox = mailbox
+        self.status_code = None
+        self.latency = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self.throttle_wait = 0.0
+        self.cached = False
+        self.items = None
+        self.batch_size = None
+        self.error = None
+
+    def __repr__(self):
+        return '<Event {} {} {} {} status={} latency={:.3f}>'.format(
+            self.kind, self.service, self.http_method, self.endpoint, self.status_code,
+            self.latency)
+
+
+class Instrumentation(object):
+    """Dispatch the events of a client to its listeners."""
+
+    def __init__(self, *listeners):
+        self.listeners = list(listeners)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+        return listener
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def measure(self, kind, **tags):
+        return measure(self, kind, **tags)
+
+    def emit(self, event):
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception('Instrumentation listener {!r} failed'.format(listener))
+
+
+class Measurement(object):
+    """Context manager timing an event, emitted when the block exits."""
+    __slots__ = ('instrumentation', 'event', 'started_at')
+
+    def __init__(self, instrumentation, event):
+        self.instrumentation = instrumentation
+        self.event = event
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self.event
+
+    def __exit__(self, exc_type, exc, tb):
+        event = self.event
+        event.latency = time.perf_counter() - self.started_at
+        if exc is not None:
+            event.error = exc
+            event.status_code = getattr(exc, 'status_code', event.status_code)
+        if self.instrumentation is not None:
+            self.instrumentation.emit(event)
+        return False
+
+
+def measure(instrumentation, kind, **tags):
+    """Return a Measurement of an event, emitted to instrumentation unless it is None."""
+    return Measurement(instrumentation, Event(kind, **tags))
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Series(object):
+    """Aggregated figures of the events sharing the same labels."""
+
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self.throttle_wait = 0.0
+        self.errors = 0
+        self.items = 0
+        self.batch_requests = 0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class HistogramAggregator(object):
+    """
+    Listener aggregating the events per set of labels.
+
+    labels: the Event attributes the series are split by; drop 'mailbox' to
+    bound the number of series with many mailboxes. status is the status
+    code, 'cache' for the responses served by the response cache, or the
+    exception class for the calls failing without a response.
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS, labels=DEFAULT_LABELS,
+                 namespace='office365'):
+        self.buckets = tuple(sorted(buckets))
+        self.labels = tuple(labels)
+        self.namespace = namespace
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _label(self, event, name):
+        if name != 'status':
+            return getattr(event, name)
+        if event.cached:
+            return 'cache'
+        if event.status_code is None and event.error is not None:
+            return type(event.error).__name__
+        return event.status_code
+
+    def __call__(self, event):
+        key = tuple(self._label(event, name) for name in self.labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series(self.buckets)
+            series.latency.observe(event.latency)
+            series.bytes_in += event.bytes_in
+            series.bytes_out += event.bytes_out
+            series.retries += event.retries
+            series.throttle_wait += event.throttle_wait
+            series.errors += event.error is not None
+            series.items += event.items or 0
+            series.batch_requests += event.batch_size or 0
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+
+    def _labels_text(self, key, extra=()):
+        pairs = [(name, value) for name, value in zip(self.labels, key) if value is not None]
+        pairs.extend(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + '}'
+
+    def export_prometheus(self):
+        """Return the aggregated series in the Prometheus text exposition format."""
+        with self.lock:
+            series = list(self.series.items())
+
+        name = self.namespace + '_duration_seconds'
+        lines = [
+            '# HELP {} Latency of the requests, pages and batches.'.format(name),
+            '# TYPE {} histogram'.format(name),
+        ]
+        for key, values in series:
+            histogram = values.latency
+            cumulated = 0
+            for bound, count in zip(self.buckets + ('+Inf',), histogram.counts):
+                cumulated += count
+                lines.append('{}_bucket{} {}'.format(
+                    name, self._labels_text(key, [('le', bound)]), cumulated))
+            lines.append('{}_sum{} {}'.format(name, self._labels_text(key), histogram.sum))
+            lines.append('{}_count{} {}'.format(name, self._labels_text(key), histogram.count))
+
+        counters = (
+            ('received_bytes_total', 'bytes_in', 'Bytes of the response bodies.'),
+            ('sent_bytes_total', 'bytes_out', 'Bytes of the request bodies.'),
+            ('retries_total', 'retries', 'Retried requests.'),
+            ('throttle_wait_seconds_total', 'throttle_wait',
+             'Seconds waited for the rate limiter and before the retries.'),
+            ('errors_total', 'errors', 'Calls which raised an exception.'),
+            ('page_items_total', 'items', 'Items of the pages.'),
+            ('batch_requests_total', 'batch_requests', 'Requests sent in batches.'),
+        )
+        for suffix, attribute, description in counters:
+            name = '{}_{}'.format(self.namespace, suffix)
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} counter'.format(name))
+            for key, values in series:
+                lines.append('{}{} {}'.format(name, self._labels_text(key), getattr(values, attribute)))
+        return '\n'.join(lines) + '\n'
+
+
+class OpenTelemetryListener(object):
+    """
+    Listener recording the events with an OpenTelemetry meter.
+
+    meter: an opentelemetry.metrics.Meter, e.g. metrics.get_meter(__name__)
+    """
+
+    def __init__(self, meter, labels=DEFAULT_LABELS, namespace='office365'):
+        self.labels = tuple(labels)
+        self.duration = meter.create_histogram(
+            namespace + '.duration', unit='s',
+            description='Latency of the requests, pages and batches')
+        self.bytes_in = meter.create_counter(namespace + '.received_bytes', unit='By')
+        self.bytes_out = meter.create_counter(namespace + '.sent_bytes', unit='By')
+        self.retries = meter.create_counter(namespace + '.retries')
+        self.throttle_wait = meter.create_counter(namespace + '.throttle_wait', unit='s')
+
+    def __call__(self, event):
+        attributes = {}
+        for name in self.labels:
+            value = event.status_code if name == 'status' else getattr(event, name)
+            if value is not None:
+                attributes[name] = value
+        self.duration.record(event.latency, attributes)
+        self.bytes_in.add(event.bytes_in, attributes)
+        self.bytes_out.add(event.bytes_out, attributes)
+        self.retries.add(event.retries, attributes)
+        self.throttle_wait.add(event.throttle_wait, attributes)
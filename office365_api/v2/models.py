@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight read-only records of the Graph resources.
+
+The models store the properties in slots instead of a dict per item, and
+wrap the nested properties (body, recipients, attendees...) in models only
+when they are accessed. The properties which are not declared by a model
+(@odata.etag, @removed...) are kept in `extra`.
+"""
+import keyword
+
+
+class Nested(object):
+    """Wrap a nested property in model_class (a tuple of them when many) on first access."""
+    __slots__ = ('slot', 'model_class', 'many')
+
+    def __init__(self, slot, model_class, many=False):
+        self.slot = slot
+        self.model_class = model_class
+        self.many = many
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if type(value) is dict:
+            value = self.model_class(value)
+            setattr(instance, self.slot, value)
+        elif type(value) is list:
+            value = tuple(self.model_class(v) if type(v) is dict else v for v in value)
+            setattr(instance, self.slot, value)
+        return value
+
+
+def attribute_name(name):
+    """Return the attribute of a Graph property: 'from' is exposed as 'from_'."""
+    return name + '_' if keyword.iskeyword(name) else name
+
+
+class ModelMeta(type):
+    """
+    Build the slots of a model from its declaration.
+
+    properties: the Graph properties of the model
+    nested: the properties holding other models, {name: model_class} or
+    {name: [model_class]} for collections
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        properties = namespace.setdefault('properties', ())
+        nested = namespace.setdefault('nested', {})
+        slots = []
+        for prop in properties:
+            attr = attribute_name(prop)
+            if prop in nested:
+                model_class = nested[prop]
+                many = isinstance(model_class, list)
+                namespace[attr] = Nested('_' + attr, model_class[0] if many else model_class, many)
+                attr = '_' + attr
+            slots.append(attr)
+        namespace['__slots__'] = tuple(slots) + namespace.get('__slots__', ())
+        namespace['_property_set'] = frozenset(properties)
+        namespace['_attributes'] = tuple(
+            (prop, '_' + attribute_name(prop) if prop in nested else attribute_name(prop))
+            for prop in properties)
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class Model(object, metaclass=ModelMeta):
+    __slots__ = ('extra',)
+
+    def __init__(self, data):
+        for prop, slot in self._attributes:
+            setattr(self, slot, data.get(prop))
+        properties = self._property_set
+        self.extra = {k: v for k, v in data.items() if k not in properties} or None
+
+    def __getitem__(self, key):
+        if key in self._property_set:
+            return getattr(self, attribute_name(key))
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        """Dict-like access by Graph property name, for the code written for the raw responses."""
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def to_dict(self):
+        """Return the Graph representation of the record, without the unset properties."""
+        data = {}
+        for prop, slot in self._attributes:
+            value = getattr(self, slot)
+            if isinstance(value, Model):
+                value = value.to_dict()
+            elif type(value) is tuple:
+                value = [v.to_dict() if isinstance(v, Model) else v for v in value]
+            if value is not None:
+                data[prop] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self):
+        return '<{} id={!r}>'.format(type(self).__name__, self.get('id'))
+
+
+class EmailAddress(Model):
+    properties = ('name', 'address')
+
+    def __repr__(self):
+        return '<EmailAddress {!r}>'.format(self.address)
+
+
+class Recipient(Model):
+    properties = ('emailAddress',)
+    nested = {'emailAddress': EmailAddress}
+
+    def __repr__(self):
+        return '<Recipient {!r}>'.format(self.emailAddress)
+
+
+class ItemBody(Model):
+    properties = ('contentType', 'content')
+
+
+class DateTimeTimeZone(Model):
+    properties = ('dateTime', 'timeZone')
+
+
+class ResponseStatus(Model):
+    properties = ('response', 'time')
+
+
+class Attendee(Model):
+    properties = ('emailAddress', 'type', 'status')
+    nested = {'emailAddress': EmailAddress, 'status': ResponseStatus}
+
+
+class Location(Model):
+    properties = ('displayName', 'locationType', 'uniqueId', 'address')
+
+
+class PhysicalAddress(Model):
+    properties = ('street', 'city', 'state', 'countryOrRegion', 'postalCode')
+
+
+class Message(Model):
+    properties = (
+        'id', 'createdDateTime', 'lastModifiedDateTime', 'changeKey', 'categories',
+        'receivedDateTime', 'sentDateTime', 'hasAttachments', 'internetMessageId', 'subject',
+        'bodyPreview', 'importance', 'parentFolderId', 'conversationId',
+        'isDeliveryReceiptRequested', 'isReadReceiptRequested', 'isRead', 'isDraft', 'webLink',
+        'inferenceClassification', 'body', 'sender', 'from', 'toRecipients', 'ccRecipients',
+        'bccRecipients', 'replyTo', 'flag', 'internetMessageHeaders',
+    )
+    nested = {
+        'body': ItemBody,
+        'sender': Recipient,
+        'from': Recipient,
+        'toRecipients': [Recipient],
+        'ccRecipients': [Recipient],
+        'bccRecipients': [Recipient],
+        'replyTo': [Recipient],
+    }
+
+
+class Event(Model):
+    properties = (
+        'id', 'createdDateTime', 'lastModifiedDateTime', 'changeKey', 'categories',
+        'originalStartTimeZone', 'originalEndTimeZone', 'iCalUId', 'reminderMinutesBeforeStart',
+        'isReminderOn', 'hasAttachments', 'subject', 'bodyPreview', 'importance', 'sensitivity',
+        'isAllDay', 'isCancelled', 'isOrganizer', 'responseRequested', 'seriesMasterId',
+        'showAs', 'type', 'webLink', 'onlineMeetingUrl', 'isOnlineMeeting', 'recurrence',
+        'responseStatus', 'body', 'start', 'end', 'location', 'locations', 'attendees',
+        'organizer',
+    )
+    nested = {
+        'responseStatus': ResponseStatus,
+        'body': ItemBody,
+        'start': DateTimeTimeZone,
+        'end': DateTimeTimeZone,
+        'location': Location,
+        'locations': [Location],
+        'attendees': [Attendee],
+        'organizer': Recipient,
+    }
+
+
+class Contact(Model):
+    properties = (
+        'id', 'createdDateTime', 'lastModifiedDateTime', 'changeKey', 'categories',
+        'parentFolderId', 'birthday', 'fileAs', 'displayName', 'givenName', 'initials',
+        'middleName', 'nickName', 'surname', 'title', 'generation', 'jobTitle', 'companyName',
+        'department', 'officeLocation', 'profession', 'businessHomePage', 'assistantName',
+        'manager', 'mobilePhone', 'personalNotes', 'spouseName', 'imAddresses', 'homePhones',
+        'businessPhones', 'children', 'emailAddresses', 'homeAddress', 'businessAddress',
+        'otherAddress',
+    )
+    nested = {
+        'emailAddresses': [EmailAddress],
+        'homeAddress': PhysicalAddress,
+        'businessAddress': PhysicalAddress,
+        'otherAddress': PhysicalAddress,
+    }
+
+    def __repr__(self):
+        return '<Contact id={!r} displayName={!r}>'.format(self.id, self.displayName)
+
+
+class MailFolder(Model):
+    properties = (
+        'id', 'displayName', 'parentFolderId', 'childFolderCount', 'unreadItemCount',
+        'totalItemCount', 'isHidden', 'wellKnownName',
+    )
+
+    def __repr__(self):
+        return '<MailFolder id={!r} displayName={!r}>'.format(self.id, self.displayName)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import threading
+import urllib.parse
+from collections import deque
+
+# markers of the prefetch buffer entries
+_PAGE = 'page'
+_ERROR = 'error'
+_DONE = 'done'
+
+
+def delta_token_from_link(delta_link):
+    """Extract the $deltatoken value of an @odata.deltaLink."""
+    if not delta_link:
+        return None
+    qs = urllib.parse.parse_qs(urllib.parse.urlparse(delta_link).query)
+    tokens = qs.get('$deltatoken') or qs.get('$deltaToken')
+    return tokens[0] if tokens else None
+
+
+class PageIterator(object):
+    """
+    Lazily iterate over the pages of a paginated list or delta_list call.
+
+    The first page is requested when the iteration starts, the next ones
+    through service.follow_next_link, one at a time. Once exhausted,
+    delta_link and delta_token hold the values of the last page; during the
+    iteration next_link is the link following the last page yielded.
+
+    prefetch: number of pages to fetch ahead on a worker thread while the
+    current page is processed (0 disables prefetching).
+    max_prefetch_items: stop fetching ahead while that many items are
+    already waiting in the buffer, to bound the memory used by prefetching.
+    """
+
+    def __init__(self, service, list_method, *args, prefetch=0, max_prefetch_items=None, **kwargs):
+        self.service = service
+        self.list_method = list_method
+        self.args = args
+        self.kwargs = kwargs
+        self.prefetch = prefetch
+        self.max_prefetch_items = max_prefetch_items
+        self.next_link = None
+        self.delta_link = None
+        self.pages_count = 0
+
+    @property
+    def delta_token(self):
+        return delta_token_from_link(self.delta_link)
+
+    def _follow_kwargs(self):
+        if 'max_entries' in self.kwargs:
+            return {'max_entries': self.kwargs['max_entries']}
+        return {}
+
+    def _fetch_pages(self):
+        resp, next_link = self.list_method(*self.args, **self.kwargs)
+        yield resp, next_link
+        while next_link:
+            resp, next_link = self.service.follow_next_link(next_link, **self._follow_kwargs())
+            yield resp, next_link
+
+    def _prefetch_pages(self):
+        """Run _fetch_pages on a worker thread, keeping up to `prefetch` pages ahead."""
+        buffer = deque()
+        condition = threading.Condition()
+        state = {'pages': 0, 'items': 0, 'stopped': False}
+
+        def is_full():
+            if state['pages'] >= self.prefetch:
+                return True
+            return bool(self.max_prefetch_items) and state['items'] >= self.max_prefetch_items
+
+        def worker():
+            pages = self._fetch_pages()
+            while True:
+                with condition:
+                    while is_full() and not state['stopped']:
+                        condition.wait()
+                    if state['stopped']:
+                        return
+                try:
+                    entry = (_PAGE, next(pages))
+                except StopIteration:
+                    entry = (_DONE, None)
+                except Exception as e:
+                    entry = (_ERROR, e)
+                with condition:
+                    if entry[0] == _PAGE:
+                        state['pages'] += 1
+                        state['items'] += len(entry[1][0].get('value', ()))
+                    buffer.append(entry)
+                    condition.notify_all()
+                if entry[0] != _PAGE:
+                    return
+
+        thread = threading.Thread(target=worker, name='office365-prefetch', daemon=True)
+        thread.start()
+        try:
+            while True:
+                with condition:
+                    while not buffer:
+                        condition.wait()
+                    kind, value = buffer.popleft()
+                    if kind == _PAGE:
+                        state['pages'] -= 1
+                        state['items'] -= len(value[0].get('value', ()))
+                    condition.notify_all()
+                if kind == _DONE:
+                    return
+                if kind == _ERROR:
+                    raise value
+                yield value
+        finally:
+            with condition:
+                state['stopped'] = True
+                condition.notify_all()
+
+    def _update(self, resp, next_link):
+        self.pages_count += 1
+        self.next_link = next_link
+        self.delta_link = resp.get('@odata.deltaLink', self.delta_link)
+
+    def __iter__(self):
+        pages = self._prefetch_pages() if self.prefetch else self._fetch_pages()
+        for resp, next_link in pages:
+            self._update(resp, next_link)
+            yield resp
+
+    def items(self, model=None):
+        """Return an ItemIterator over the items, wrapped in model if given (see models)."""
+        return ItemIterator(self, model)
+
+
+class ItemIterator(object):
+    """Lazily iterate over the items ('value') of every page of a PageIterator."""
+
+    def __init__(self, pages, model=None):
+        self.pages = pages
+        self.model = model
+
+    @property
+    def next_link(self):
+        return self.pages.next_link
+
+    @property
+    def delta_link(self):
+        return self.pages.delta_link
+
+    @property
+    def delta_token(self):
+        return self.pages.delta_token
+
+    def __iter__(self):
+        for page in self.pages:
+            if self.model is None:
+                yield from page.get('value', [])
+            else:
+                yield from map(self.model, page.get('value', []))
+
+
+class StreamingItemIterator(object):
+    """
+    Lazily iterate over the items of every page, decoding each page as it is received.
+
+    list_method must belong to a streaming service (see
+    services.BaseService.streaming), so that it returns decoders.StreamingPage
+    objects: at most one item and one chunk of a page are held in memory. The
+    next link of a page is known once its items are consumed, so the pages
+    are fetched one at a time.
+    """
+
+    def __init__(self, service, list_method, *args, model=None, **kwargs):
+        self.service = service
+        self.list_method = list_method
+        self.model = model
+        self.args = args
+        self.kwargs = kwargs
+        self.next_link = None
+        self.delta_link = None
+        self.pages_count = 0
+
+    @property
+    def delta_token(self):
+        return delta_token_from_link(self.delta_link)
+
+    _follow_kwargs = PageIterator._follow_kwargs
+
+    def __iter__(self):
+        page, _ = self.list_method(*self.args, **self.kwargs)
+        while True:
+            if self.model is None:
+                yield from page.items()
+            else:
+                yield from map(self.model, page.items())
+            self.pages_count += 1
+            self.next_link = page.get('@odata.nextLink')
+            self.delta_link = page.get('@odata.deltaLink')
+            if not self.next_link:
+                return
+            page, _ = self.service.follow_next_link(self.next_link, **self._follow_kwargs())
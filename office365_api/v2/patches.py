@@ -7,10 +7,14 @@ Batch Request to JSON.
 
 Patches the execute_request() to not fire the http request. Instead,
 force to return a json data of the request for batch processing.
+
+Deprecated: the services returned by service.deferred() describe their
+requests without being patched, see descriptors.RequestDescriptor.
 """
 
 
-def become_request(self, method, path, query_params=None, headers=None, body=None, parse_json_result=True):
+def become_request(self, method, path, query_params=None, headers=None, body=None, parse_json_result=True,
+                   json_body=None, **kwargs):
     default_headers = {'Content-Type': 'application/json'}
     if headers:
         default_headers.update(headers)
@@ -19,7 +23,9 @@ def become_request(self, method, path, query_params=None, headers=None, body=Non
         'method': method.upper(),
         'headers': default_headers,
     }
-    if body:
+    if json_body is not None:
+        request['body'] = json_body
+    elif body:
         # Reverse the json dump
         body = json.loads(body)
         request['body'] = body
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Named projection profiles: the properties ($select) and the navigation
+properties ($expand) requested for each kind of resource.
+
+The 'full' profile requests every property, as the api does without $select.
+"""
+PROFILE_FULL = 'full'
+PROFILE_SYNC_HEADERS = 'sync-headers'
+
+# (profile name, resource) -> Projection
+_profiles = {}
+
+
+class Projection(object):
+    def __init__(self, fields=(), expand=()):
+        self.fields = tuple(fields)
+        self.expand = tuple(expand)
+
+    def query_params(self):
+        """Return the $select and $expand query params of the projection."""
+        query_params = {}
+        if self.fields:
+            query_params['$select'] = ','.join(self.fields)
+        if self.expand:
+            query_params['$expand'] = ','.join(self.expand)
+        return query_params
+
+    def __repr__(self):
+        return '<Projection fields={!r} expand={!r}>'.format(self.fields, self.expand)
+
+
+FULL = Projection()
+
+
+def register_profile(name, resource, fields=(), expand=()):
+    """Register (or replace) the projection of the profile name for resource."""
+    projection = _profiles[(name, resource)] = Projection(fields, expand)
+    return projection
+
+
+def get_profile(name, resource, strict=True):
+    """
+    Return the projection of the profile name for resource.
+
+    Unknown profiles raise a KeyError, unless strict is False: the full
+    projection is returned instead.
+    """
+    if name == PROFILE_FULL:
+        return FULL
+    try:
+        return _profiles[(name, resource)]
+    except KeyError:
+        if strict:
+            raise KeyError('No projection profile {!r} for {}'.format(name, resource))
+        return FULL
+
+
+def profiles():
+    """Return the names of the registered profiles, by resource."""
+    names = {}
+    for name, resource in _profiles:
+        names.setdefault(resource, []).append(name)
+    return names
+
+
+# the properties needed to detect and order the changes, without the bodies
+register_profile(PROFILE_SYNC_HEADERS, 'message', fields=(
+    'id', 'changeKey', 'createdDateTime', 'lastModifiedDateTime', 'receivedDateTime',
+    'sentDateTime', 'parentFolderId', 'conversationId', 'internetMessageId', 'subject',
+    'from', 'isRead', 'isDraft', 'hasAttachments'))
+register_profile(PROFILE_SYNC_HEADERS, 'event', fields=(
+    'id', 'changeKey', 'createdDateTime', 'lastModifiedDateTime', 'iCalUId', 'subject',
+    'start', 'end', 'isAllDay', 'isCancelled', 'seriesMasterId', 'type', 'organizer'))
+register_profile(PROFILE_SYNC_HEADERS, 'contact', fields=(
+    'id', 'changeKey', 'createdDateTime', 'lastModifiedDateTime', 'parentFolderId',
+    'displayName', 'emailAddresses'))
+register_profile(PROFILE_SYNC_HEADERS, 'mailFolder', fields=(
+    'id', 'displayName', 'parentFolderId', 'childFolderCount', 'totalItemCount'))
+register_profile(PROFILE_SYNC_HEADERS, 'attachment', fields=(
+    'id', 'name', 'contentType', 'size', 'isInline', 'lastModifiedDateTime'))
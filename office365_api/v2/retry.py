@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import email.utils
+import random
+import time
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+RETRY_STATUSES = (429, 503, 504)
+
+
+def retry_after_seconds(headers):
+    """Return the Retry-After header of headers in seconds, or None."""
+    value = None
+    for name, header_value in (headers or {}).items():
+        if name.lower() == 'retry-after':
+            value = header_value
+            break
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+class RetryPolicy(object):
+    """
+    Decide whether a request failing with an Office365 error is retried, and when.
+
+    The delay is the Retry-After of the response when given, an exponential
+    backoff (backoff_factor * 2 ** attempt, capped to max_backoff, with full
+    jitter) otherwise. A request is retried at most max_retries times and
+    for at most max_total_delay seconds of waiting overall; only the methods
+    of retry_methods are retried, as the other ones may have been applied.
+    """
+
+    def __init__(self, max_retries=4, backoff_factor=0.5, max_backoff=30, max_total_delay=60,
+                 retry_statuses=RETRY_STATUSES, retry_methods=IDEMPOTENT_METHODS, jitter=True):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_total_delay = max_total_delay
+        self.retry_statuses = retry_statuses
+        self.retry_methods = retry_methods
+        self.jitter = jitter
+
+    def backoff(self, attempt):
+        delay = min(self.max_backoff, self.backoff_factor * 2 ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def get_retry_delay(self, method, error, attempt, waited=0):
+        """
+        Return the seconds to wait before retrying, or None to give up.
+
+        attempt: number of retries already done
+        waited: seconds already spent waiting for those retries
+        """
+        if attempt >= self.max_retries:
+            return None
+        if method.upper() not in self.retry_methods:
+            return None
+        if getattr(error, 'status_code', None) not in self.retry_statuses:
+            return None
+
+        retry_after = getattr(error, 'retry_after', None)
+        delay = retry_after if retry_after is not None else self.backoff(attempt)
+        if waited + delay > self.max_total_delay:
+            return None
+        return delay
+
+
+class NoRetryPolicy(RetryPolicy):
+    """Never retry a failed request."""
+
+    def __init__(self):
+        super().__init__(max_retries=0)
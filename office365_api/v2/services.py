@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
+import itertools
 import json
 import logging
+import os
+import time
 import urllib.error
 import urllib.parse
 import urllib.request
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import Any, Dict, List, Tuple
 
 from requests import HTTPError
@@ -11,21 +17,126 @@ from requests.exceptions import ChunkedEncodingError
 from requests.exceptions import ConnectionError as RequestsConnectionError
 from requests.exceptions import JSONDecodeError as RequestsJSONDecodeError
 
+from .decoders import StreamingPage, default_decoder
+from .descriptors import RequestDescriptor
 from .exceptions import Office365ClientError, Office365ServerError
+from .instrumentation import BATCH, PAGE, REQUEST, endpoint_template, measure
+from .models import Contact, Event, MailFolder, Message
+from .pagination import PageIterator, StreamingItemIterator
+from .projections import PROFILE_FULL, Projection, get_profile
+from .retry import IDEMPOTENT_METHODS, RetryPolicy, retry_after_seconds
+from .sharding import (DEFAULT_SHARD_WINDOW, DEFAULT_SHARD_WORKERS, WindowMerger,
+                       format_datetime, iter_window_pages, split_windows)
+from .throttling import mailbox_key
+from .transport import build_session
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_MAX_ENTRIES = 50
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# upload session ranges must be a multiple of 320 KiB and smaller than 4 MiB
+UPLOAD_CHUNK_SIZE = 320 * 1024 * 10
 RETRIES_COUNT = 2
+UPLOAD_RETRIES_COUNT = 3
+# errors of the upload session requests worth retrying, see UploadSession.retry_delay
+UPLOAD_RETRY_ERRORS = (Office365ClientError, Office365ServerError, ConnectionResetError,
+                       RequestsConnectionError, ChunkedEncodingError)
+# maximum number of requests accepted by the $batch endpoint
+MAX_BATCH_SIZE = 20
+DEFAULT_BATCH_PARALLELISM = 4
+DEFAULT_BATCH_MAX_ATTEMPTS = 3
+# seconds to wait before retrying batch items without a Retry-After header
+BATCH_RETRY_DELAY = 1
+# seconds a batch waits overall for its retries, as RetryPolicy.max_total_delay
+BATCH_MAX_TOTAL_DELAY = 60
+BATCH_RETRY_STATUSES = (429, 503, 504)
+# the items of the bulk operations are retried whatever their method, but
+# the non idempotent ones only when throttled (429): a throttled item has
+# not been applied, a 503/504 one may have been
+BULK_RETRY_METHODS = IDEMPOTENT_METHODS + ('PATCH', 'POST')
+# order of the events of CalendarViewService.iter_sharded, which its windows are merged in
+SHARDED_ORDERBY = 'start/dateTime'
 
 RESPONSE_FORMAT_ODATA = 'odata'
 RESPONSE_FORMAT_RAW = 'raw'
 
+# decoder of the clients without a json_decoder
+JSON_DECODER = default_decoder()
+
+
+def error_from_response(response):
+    """Build the Office365 exception matching a failed http response."""
+    retry_after = retry_after_seconds(response.headers)
+    if response.status_code < 500:
+        try:
+            error_data = response.json()
+        except (ValueError, RequestsJSONDecodeError):
+            error_data = {
+                'error': {'message': response.content, 'code': 'unknown'}}
+        return Office365ClientError(response.status_code, error_data, retry_after=retry_after)
+    return Office365ServerError(response.status_code, response.content, retry_after=retry_after)
+
+
+def write_chunks(chunks, sink):
+    """
+    Write an iterable of bytes to sink and return the number of bytes written.
+
+    sink: a file path or a writable file-like object
+    """
+    if isinstance(sink, (str, os.PathLike)):
+        with open(sink, 'wb') as f:
+            return write_chunks(chunks, f)
+
+    written = 0
+    for chunk in chunks:
+        sink.write(chunk)
+        written += len(chunk)
+    return written
+
+
+@contextmanager
+def open_source(source):
+    """Yield a seekable binary file for source (a file path, file object or mmap)."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield f
+    else:
+        yield source
+
+
+def source_size(source):
+    """Return the size in bytes of a seekable binary source, keeping its position."""
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    if size is None:
+        # mmap.seek() returns None
+        size = source.tell()
+    source.seek(position)
+    return size
+
 
 class BaseService(object):
+    # __dict__ keeps the instances patchable (patches.become_request,
+    # mock.patch.object); it is only allocated for the patched instances
+    __slots__ = ('client', 'prefix', '__dict__')
     base_url = 'https://graph.microsoft.com'
     graph_api_version = 'v1.0'
     supported_response_formats = [RESPONSE_FORMAT_ODATA, RESPONSE_FORMAT_RAW]
+    # whether some requests of the service use the response cache of the client
+    response_cached = False
+    # models.Model of the items of list and get, and of the items of delta_list
+    model_class = None
+    delta_model_class = None
+    # resource of the projection profiles of the service (see projections)
+    projection_resource = None
+    default_profile = PROFILE_FULL
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # name of the service in the instrumentation events, kept by the
+        # async and streaming flavours
+        if 'service_name' not in cls.__dict__:
+            cls.service_name = cls.__name__
 
     def __init__(self, client, prefix):
         self.client = client
@@ -44,21 +155,12 @@ class BaseService(object):
         _, _, path = next_link.partition(full_prefix)
         headers = {'Prefer': 'odata.maxpagesize=%d' % max_entries}
         query_params = {"$select": ','.join(fields)} if fields else None
-        resp = self.execute_request(
+        return self.execute_paged_request(
             'get', path, query_params=query_params, headers=headers)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
 
-    def execute_request(self, method, path, query_params=None, headers=None, body=None,
+    def prepare_request(self, path, query_params=None, headers=None,
                         parse_json_result=True, set_content_type=True):
-        """
-        Run the http request and returns the json data upon success.
-
-        path: the path of the api endpoint with leading slash (excluding the
-        api version and user id prefix) query_params: dict to be urlencoded and
-        appended to the final url headers: dict body: bytestring to be used as
-        request body
-        """
+        """Return the full url and the headers of a request to the api endpoint path."""
         full_url = self.build_url(path)
         if query_params:
             querystring = urllib.parse.urlencode(query_params)
@@ -76,31 +178,169 @@ class BaseService(object):
         if headers:
             default_headers.update(headers)
 
+        return full_url, default_headers
+
+    def describe_request(self, method, path, query_params=None, headers=None, json_body=None):
+        """Return the RequestDescriptor of a request to the api endpoint path."""
+        url = '/' + '/'.join(part.strip('/') for part in (self.prefix, path) if part.strip('/'))
+        if query_params:
+            url += ('&' if '?' in url else '?') + urllib.parse.urlencode(query_params)
+        return RequestDescriptor(method, url, headers=headers, body=json_body)
+
+    def decode_json(self, content):
+        """Decode a json response body with the json_decoder of the client, if any."""
+        decoder = getattr(self.client, 'json_decoder', None) or JSON_DECODER
+        return decoder.loads(content)
+
+    def projection(self, query_params=None, fields=[], expand=[], profile=None, resource=None):
+        """
+        Return query_params with the $select and $expand of the request.
+
+        Explicit fields and expand win over the profile; without a profile,
+        the projection_profile of the client applies if it is registered for
+        the resource, then the default_profile of the service.
+        """
+        resource = resource or self.projection_resource
+        if fields or expand:
+            projection = Projection(fields, expand)
+        elif profile:
+            projection = get_profile(profile, resource)
+        else:
+            profile = getattr(self.client, 'projection_profile', None) or self.default_profile
+            projection = get_profile(profile, resource, strict=False)
+        query_params = dict(query_params or {})
+        query_params.update(projection.query_params())
+        return query_params
+
+    def measure(self, kind, method, path):
+        """Return an instrumentation.Measurement of a call to the endpoint path."""
+        return measure(
+            getattr(self.client, 'instrumentation', None), kind, service=self.service_name,
+            http_method=method.upper(), endpoint=endpoint_template(path),
+            mailbox=mailbox_key(self.prefix))
+
+    def to_model(self, result, model_class=None):
+        """Wrap the json data of a response in model_class, the model of the service by default."""
+        model_class = model_class or self.model_class
+        if model_class is None:
+            raise TypeError('{} has no model'.format(type(self).__name__))
+        return model_class(result)
+
+    def streaming(self):
+        """Return a copy of the service whose paginated requests return StreamingPage objects."""
+        return streaming_service_class(type(self))(self.client, self.prefix)
+
+    def deferred(self):
+        """Return a copy of the service whose methods return RequestDescriptor objects."""
+        return deferred_service_class(type(self))(self.client, self.prefix)
+
+    def response_cache(self, method, full_url, cacheable):
+        """
+        Return the response cache of the client and the cache key of the request.
+
+        Both are None unless the client has a response_cache, the service is
+        response_cached and the request is a cacheable GET; the other
+        requests of the service invalidate its entries for the mailbox.
+        """
+        cache = getattr(self.client, 'response_cache', None)
+        if cache is None or not self.response_cached:
+            return None, None
+        if method.upper() != 'GET':
+            cache.invalidate(self.prefix, type(self).__name__)
+            return None, None
+        if not cacheable:
+            return None, None
+        return cache, (self.prefix, type(self).__name__, full_url)
+
+    def execute_paged_request(self, method, path, query_params=None, headers=None,
+                              cacheable=False):
+        """Run the request of a paginated endpoint, return the json data and the next link."""
+        with self.measure(PAGE, method, path) as event:
+            resp = self.execute_request(
+                method, path, query_params=query_params, headers=headers, cacheable=cacheable)
+            next_link = resp.get('@odata.nextLink')
+            event.items = len(resp.get('value', []))
+        return resp, next_link
+
+    def execute_request(self, method, path, query_params=None, headers=None, body=None,
+                        parse_json_result=True, set_content_type=True, cacheable=False,
+                        json_body=None):
+        """
+        Run the http request and returns the json data upon success.
+
+        path: the path of the api endpoint with leading slash (excluding the
+        api version and user id prefix) query_params: dict to be urlencoded and
+        appended to the final url headers: dict body: bytestring to be used as
+        request body json_body: data to be sent as json instead of body
+        cacheable: serve the request from the response cache of the client, if
+        any
+        """
+        if json_body is not None:
+            body = json.dumps(json_body)
+        coalescer = getattr(self.client, 'coalescer', None)
+        if coalescer is not None and coalescer.accepts(
+                self, method, body=body, parse_json_result=parse_json_result, cacheable=cacheable):
+            return coalescer.submit(self, method, path, query_params=query_params, headers=headers)
+        with self.measure(REQUEST, method, path) as event:
+            return self._execute_request(
+                event, method, path, query_params=query_params, headers=headers, body=body,
+                parse_json_result=parse_json_result, set_content_type=set_content_type,
+                cacheable=cacheable)
+
+    def _execute_request(self, event, method, path, query_params=None, headers=None, body=None,
+                         parse_json_result=True, set_content_type=True, cacheable=False):
+        full_url, default_headers = self.prepare_request(
+            path, query_params=query_params, headers=headers,
+            parse_json_result=parse_json_result, set_content_type=set_content_type)
+
+        cache, cache_key = self.response_cache(method, full_url, cacheable)
+        stale = None
+        if cache is not None:
+            data, stale = cache.lookup(cache_key)
+            if data is not None:
+                event.cached = True
+                return data
+            if stale is not None:
+                default_headers['If-None-Match'] = stale.etag
+
         logger.info('{}: {}'.format(method.upper(), full_url))
+        event.bytes_out = len(body) if body else 0
         retries = RETRIES_COUNT
+        rate_limiter = getattr(self.client, 'rate_limiter', None)
+        attempt = 0
+        waited = 0
         while True:
+            if rate_limiter is not None:
+                event.throttle_wait += rate_limiter.acquire(self.prefix)
             try:
                 resp = self.client.session.request(
                     url=full_url, method=method.upper(), data=body, headers=default_headers)
+                event.status_code = resp.status_code
+                event.bytes_in = len(resp.content)
+                if rate_limiter is not None:
+                    rate_limiter.on_success(self.prefix)
+                if stale is not None and resp.status_code == 304:
+                    return cache.not_modified(cache_key, stale)
                 if parse_json_result:
                     try:
-                        return resp.json()
-                    except RequestsJSONDecodeError:
+                        data = self.decode_json(resp.content)
+                    except ValueError:
                         return resp.content
+                    if cache is not None:
+                        cache.store(cache_key, data, resp.headers.get('ETag'))
+                    return data
                 else:
                     return resp.content
             except HTTPError as e:
-                if e.response.status_code < 500:
-                    try:
-                        error_data = e.response.json()
-                    except (ValueError, RequestsJSONDecodeError):
-                        error_data = {
-                            'error': {'message': e.response.content, 'code': 'uknown'}}
-                    raise Office365ClientError(
-                        e.response.status_code, error_data)
-                else:
-                    raise Office365ServerError(
-                        e.response.status_code, e.response.content)
+                error = error_from_response(e.response)
+                event.status_code = error.status_code
+                event.bytes_in = len(e.response.content or b'')
+                delay = self.retry_delay(event, method, full_url, error, attempt, waited)
+                if delay is None:
+                    raise error
+                attempt += 1
+                waited += delay
+                time.sleep(delay)
             except (
                 ConnectionResetError,
                 # requests lib re-raises ConnectionResetError exception as one of below
@@ -109,42 +349,303 @@ class BaseService(object):
                 retries -= 1
                 if retries == 0:
                     raise
+                event.retries += 1
+
+    def retry_delay(self, event, method, full_url, error, attempt, waited):
+        """
+        Return the seconds to wait before retrying a request failing with the
+        Office365 error, or None to raise it.
+
+        attempt: number of retries already done
+        waited: seconds already spent waiting for those retries
+        The throttling is reported to the rate limiter of the client and the
+        retry is counted in the instrumentation event.
+        """
+        rate_limiter = getattr(self.client, 'rate_limiter', None)
+        if rate_limiter is not None and error.status_code == 429:
+            rate_limiter.on_throttled(self.prefix, error.retry_after)
+        retry_policy = getattr(self.client, 'retry_policy', None)
+        if retry_policy is None:
+            return None
+        delay = retry_policy.get_retry_delay(method, error, attempt, waited)
+        if delay is not None:
+            event.retries += 1
+            event.throttle_wait += delay
+            logger.info('Retrying {}: {} in {:.2f}s after {}'.format(
+                method.upper(), full_url, delay, error.status_code))
+        return delay
+
+    def execute_stream_request(self, method, path, query_params=None, headers=None,
+                               chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Run the http request and yield the response body in chunks.
+
+        Only chunk_size bytes of the body are held in memory at a time, so it
+        is suited for large binary content ($value endpoints). The request is
+        sent when the first chunk is requested, and retried as execute_request
+        does until the response is received.
+        """
+        full_url, headers = self.prepare_request(
+            path, query_params=query_params, headers=headers, set_content_type=False)
+
+        logger.info('{}: {} (stream)'.format(method.upper(), full_url))
+        rate_limiter = getattr(self.client, 'rate_limiter', None)
+        retries = RETRIES_COUNT
+        attempt = 0
+        waited = 0
+        with self.measure(REQUEST, method, path) as event:
+            while True:
+                if rate_limiter is not None:
+                    event.throttle_wait += rate_limiter.acquire(self.prefix)
+                try:
+                    resp = self.client.session.request(
+                        url=full_url, method=method.upper(), headers=headers, stream=True)
+                    event.status_code = resp.status_code
+                    break
+                except HTTPError as e:
+                    # nothing has been yielded yet, the request can be retried
+                    error = error_from_response(e.response)
+                    event.status_code = error.status_code
+                    delay = self.retry_delay(event, method, full_url, error, attempt, waited)
+                    if delay is None:
+                        raise error
+                    attempt += 1
+                    waited += delay
+                    time.sleep(delay)
+                except (
+                    ConnectionResetError,
+                    RequestsConnectionError,
+                        ChunkedEncodingError, ):
+                    retries -= 1
+                    if retries == 0:
+                        raise
+                    event.retries += 1
+
+            try:
+                for chunk in resp.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        event.bytes_in += len(chunk)
+                        yield chunk
+            finally:
+                resp.close()
 
 
 class BaseBetaService(BaseService):
+    __slots__ = ()
     graph_api_version = 'beta'
 
 
-class ServicesCollection(object):
-    def __init__(self, client, prefix):
-        self.client = client
-        self.prefix = prefix
+class ListIterMixin(object):
+    """Lazy iteration over every page of `list`, following the next links."""
+    __slots__ = ()
 
+    def iter_pages(self, *args, **kwargs):
+        """Return a PageIterator over the responses of list(*args, **kwargs)."""
+        return PageIterator(self, self.list, *args, **kwargs)
 
-class UserServicesCollection(ServicesCollection):
-    """Wrap a collection of services in a context."""
+    def iter_all(self, *args, streaming=False, as_model=False, **kwargs):
+        """
+        Return an ItemIterator over the items of list(*args, **kwargs).
 
-    def __init__(self, client, prefix):
-        super().__init__(client, prefix)
-        self.calendar = CalendarService(self.client, self.prefix)
-        self.calendarview = CalendarViewService(self.client, self.prefix)
-        self.event = EventService(self.client, self.prefix)
-        self.event_beta = EventServiceBeta(self.client, self.prefix)
-        self.message = MessageService(self.client, self.prefix)
-        self.attachment = AttachmentService(self.client, self.prefix)
-        self.contactfolder = ContactFolderService(self.client, self.prefix)
-        self.contact = ContactService(self.client, self.prefix)
-        self.mailfolder = MailFolderService(self.client, self.prefix)
-        self.user = UserService(self.client, self.prefix)
-        self.mailboxSettings = MailboxSettingsService(self.client, self.prefix)
-        self.outlook = OutlookServicesCollection(self.client, self.prefix)
+        streaming: decode the pages incrementally as they are received,
+        holding a single item in memory instead of a whole page.
+        as_model: yield instances of the model_class of the service instead
+        of dicts.
+        """
+        model = self.model_class if as_model else None
+        if as_model and model is None:
+            raise TypeError('{} has no model'.format(type(self).__name__))
+        if streaming:
+            service = self.streaming()
+            return StreamingItemIterator(service, service.list, *args, model=model, **kwargs)
+        return self.iter_pages(*args, **kwargs).items(model)
 
 
-class OutlookServicesCollection(ServicesCollection):
-    """Wrap a collection of services grouped by 'outlook' context."""
-    def __init__(self, client, prefix):
-        super().__init__(client, prefix + '/outlook')
-        self.masterCategories = MasterCategoriesService(self.client, self.prefix)
+class DeltaIterMixin(object):
+    """Lazy iteration over every page of `delta_list`, exposing the final delta token."""
+    __slots__ = ()
+
+    def iter_delta_pages(self, *args, **kwargs):
+        """Return a PageIterator over the responses of delta_list(*args, **kwargs)."""
+        return PageIterator(self, self.delta_list, *args, **kwargs)
+
+    def iter_delta(self, *args, streaming=False, as_model=False, **kwargs):
+        """
+        Return an ItemIterator over the items of delta_list(*args, **kwargs).
+
+        streaming, as_model: see ListIterMixin.iter_all, the items are
+        wrapped in the delta_model_class of the service.
+        """
+        model = self.delta_model_class if as_model else None
+        if as_model and model is None:
+            raise TypeError('{} has no model'.format(type(self).__name__))
+        if streaming:
+            service = self.streaming()
+            return StreamingItemIterator(
+                service, service.delta_list, *args, model=model, **kwargs)
+        return self.iter_delta_pages(*args, **kwargs).items(model)
+
+
+class StreamingServiceMixin(object):
+    """
+    Decode the responses of the paginated requests incrementally.
+
+    execute_paged_request returns a decoders.StreamingPage and no next link:
+    the next link is known once the items of the page are consumed, so
+    iter_all and iter_delta always stream.
+    """
+    __slots__ = ()
+
+    def streaming(self):
+        return self
+
+    def iter_all(self, *args, streaming=True, as_model=False, **kwargs):
+        return super().iter_all(*args, streaming=True, as_model=as_model, **kwargs)
+
+    def iter_delta(self, *args, streaming=True, as_model=False, **kwargs):
+        return super().iter_delta(*args, streaming=True, as_model=as_model, **kwargs)
+
+    def execute_paged_request(self, method, path, query_params=None, headers=None,
+                              cacheable=False):
+        headers = dict(headers or {}, Accept='application/json')
+        chunks = self.execute_stream_request(
+            method, path, query_params=query_params, headers=headers)
+        return StreamingPage(chunks, getattr(self.client, 'json_decoder', None)), None
+
+
+_streaming_classes = {}
+
+
+def streaming_service_class(cls):
+    """Return the streaming flavour of a service class."""
+    if cls not in _streaming_classes:
+        _streaming_classes[cls] = type(
+            'Streaming' + cls.__name__, (StreamingServiceMixin, cls),
+            {'__slots__': (), 'service_name': cls.service_name})
+    return _streaming_classes[cls]
+
+
+class DeferredServiceMixin(object):
+    """
+    Describe the requests of a service instead of sending them.
+
+    The methods return a descriptors.RequestDescriptor, to be added to a
+    BatchService; the responses of the methods returning a model are
+    wrapped in that model by the batch. The methods which process their
+    response further (upload sessions...) or stream it are not supported.
+    """
+    __slots__ = ()
+
+    def execute_request(self, method, path, query_params=None, headers=None, body=None,
+                        parse_json_result=True, set_content_type=True, cacheable=False,
+                        json_body=None):
+        if not parse_json_result:
+            raise TypeError('Only the requests of json data can be deferred')
+        if json_body is None and body:
+            # the json serialized body of the methods not using json_body
+            json_body = json.loads(body)
+        return self.describe_request(
+            method, path, query_params=query_params, headers=headers, json_body=json_body)
+
+    def execute_paged_request(self, method, path, query_params=None, headers=None,
+                              cacheable=False):
+        return self.execute_request(method, path, query_params=query_params, headers=headers)
+
+    def execute_stream_request(self, method, path, query_params=None, headers=None,
+                               chunk_size=DEFAULT_CHUNK_SIZE):
+        raise TypeError('Streamed requests cannot be deferred')
+
+    def to_model(self, result, model_class=None):
+        result.model_class = model_class or self.model_class
+        return result
+
+
+class BulkReport(object):
+    """
+    Outcome of a bulk operation, per item id.
+
+    succeeded: {item id: id of the item after the operation (a moved message
+    gets a new id), None when there is no item anymore}
+    failed: {item id: the Office365 error of the item}
+    """
+
+    def __init__(self):
+        self.succeeded = OrderedDict()
+        self.failed = OrderedDict()
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def __len__(self):
+        return len(self.succeeded) + len(self.failed)
+
+    def __repr__(self):
+        return '<BulkReport succeeded={} failed={}>'.format(len(self.succeeded), len(self.failed))
+
+
+class BulkMixin(object):
+    """
+    Apply an operation to many items through $batch requests.
+
+    The items are sent in slices of MAX_BATCH_SIZE * parallelism requests,
+    each slice as up to parallelism concurrent batches. The items failing
+    with a status of BATCH_RETRY_STATUSES are sent again, up to
+    max_attempts times (the POST and PATCH ones only when throttled); the
+    other ones are not. Every item is reported from its own response, or
+    from the error of the $batch request it was sent in.
+    """
+    __slots__ = ()
+
+    def execute_bulk(self, item_ids, describe, parallelism=DEFAULT_BATCH_PARALLELISM,
+                     max_attempts=DEFAULT_BATCH_MAX_ATTEMPTS):
+        """
+        Run describe(deferred_service, item_id), the RequestDescriptor of the
+        operation, for every item id and return a BulkReport.
+        """
+        deferred = self.deferred()
+        report = BulkReport()
+        item_ids = iter(item_ids)
+        while True:
+            batch = self._bulk_batch(
+                BatchService, item_ids, describe, deferred, report, parallelism, max_attempts)
+            if batch.is_empty:
+                break
+            batch.execute()
+        logger.info('{}: bulk operation on {}x items, {}x failed'.format(
+            self.service_name, len(report), len(report.failed)))
+        return report
+
+    def _bulk_batch(self, batch_class, item_ids, describe, deferred, report, parallelism,
+                    max_attempts):
+        """Return a batch_class of the next slice of item_ids, reporting to report."""
+        batch = batch_class(
+            self.client, beta=self.graph_api_version == 'beta', parallelism=parallelism,
+            max_attempts=max_attempts, retry_methods=BULK_RETRY_METHODS)
+        ids = {}
+
+        def callback(request_id, body, error):
+            item_id = ids[request_id]
+            if error is not None:
+                report.failed[item_id] = error
+            else:
+                report.succeeded[item_id] = body.get('id') if isinstance(body, dict) else None
+
+        for item_id in itertools.islice(item_ids, MAX_BATCH_SIZE * parallelism):
+            ids[batch.add(describe(deferred, item_id), callback=callback)] = item_id
+        return batch
+
+
+_deferred_classes = {}
+
+
+def deferred_service_class(cls):
+    """Return the deferred flavour of a service class."""
+    if cls not in _deferred_classes:
+        _deferred_classes[cls] = type(
+            'Deferred' + cls.__name__, (DeferredServiceMixin, cls),
+            {'__slots__': (), 'service_name': cls.service_name})
+    return _deferred_classes[cls]
 
 
 class BaseFactory(object):
@@ -158,8 +659,35 @@ class SubscriptionFactory(BaseFactory):
 
 
 class BatchService(BaseService):
-    def __init__(self, client, beta=True):
+    """
+    Send requests through the $batch endpoint.
+
+    The requests are split in chunks of MAX_BATCH_SIZE, keeping the requests
+    chained by dependsOn in the same chunk, and up to `parallelism` chunks
+    are sent concurrently. The callbacks are run in the order the requests
+    were added. When the $batch request of a chunk fails, the callbacks of
+    its requests get its error and the other chunks are processed as usual;
+    execute() then raises the error if one of its requests has no callback.
+
+    Items failing with a status of BATCH_RETRY_STATUSES are sent again in a
+    new round, after their Retry-After delay, as long as their method is in
+    retry_methods and max_attempts is not reached; the non idempotent ones
+    only when throttled (429), as a 503/504 one may have been applied. No
+    round is sent once the delays would exceed max_total_delay seconds
+    overall: the items keep their last response. Only those items (and the
+    ones which failed because they depend on them) are sent again.
+    """
+
+    def __init__(self, client, beta=True, parallelism=DEFAULT_BATCH_PARALLELISM,
+                 max_attempts=DEFAULT_BATCH_MAX_ATTEMPTS, retry_methods=IDEMPOTENT_METHODS,
+                 max_total_delay=BATCH_MAX_TOTAL_DELAY):
         self.client = client
+        # the requests of a batch may target several mailboxes
+        self.prefix = ''
+        self.parallelism = parallelism
+        self.max_attempts = max_attempts
+        self.retry_methods = retry_methods
+        self.max_total_delay = max_total_delay
 
         channel = 'beta' if beta else 'v1.0'
         self.batch_uri = f'https://graph.microsoft.com/{channel}/$batch'
@@ -181,6 +709,12 @@ class BatchService(BaseService):
         # A map from request id to (httplib2.Response, content) response pairs
         self._responses = {}
 
+        # A map from request id to the error of the $batch request it was sent in.
+        self._errors = {}
+
+        # A map from request id to the model its response is wrapped in.
+        self._models = {}
+
     def _new_id(self):
         """
         Create a new id.
@@ -196,11 +730,25 @@ class BatchService(BaseService):
 
         return str(self._last_auto_id)
 
-    def add(self, request, callback=None):
-        request_id = self._new_id()
+    def add(self, request, callback=None, request_id=None):
+        """
+        Queue request and return its id, to be referenced by the dependsOn of other requests.
+
+        request: a $batch request item (dict), or the RequestDescriptor
+        returned by a deferred service
+        """
+        if request_id is None:
+            request_id = self._new_id()
+        elif request_id in self._requests:
+            raise ValueError('Duplicated request id: {}'.format(request_id))
+        if isinstance(request, RequestDescriptor):
+            if request.model_class is not None:
+                self._models[request_id] = request.model_class
+            request = request.to_batch_request()
         self._requests[request_id] = request
         self._callbacks[request_id] = callback
         self._order.append(request_id)
+        return request_id
 
     def _execute(self, requests):
         if self.is_empty:
@@ -210,53 +758,232 @@ class BatchService(BaseService):
 
         logger.info('{}: {} with {}x requests'.format(
             method, self.batch_uri, len(requests)))
-        try:
-            resp = self.client.session.request(
-                url=self.batch_uri,
-                method=method,
-                json={'requests': requests},
-                headers=default_headers)
-            return resp.json()
-        except HTTPError as e:
-            if e.response.status_code < 500:
-                try:
-                    error_data = e.response.json()
-                except (ValueError, RequestsJSONDecodeError):
-                    error_data = {
-                        'error': {'message': e.response.content, 'code': 'unknown'}}
-                raise Office365ClientError(e.response.status_code, error_data)
+        with self.measure(BATCH, method, '/$batch') as event:
+            event.batch_size = len(requests)
+            wait = self._reserve_rate_limit(requests)
+            if wait > 0:
+                event.throttle_wait = wait
+                time.sleep(wait)
+            try:
+                resp = self.client.session.request(
+                    url=self.batch_uri,
+                    method=method,
+                    json={'requests': requests},
+                    headers=default_headers)
+                event.status_code = resp.status_code
+                event.bytes_in = len(resp.content)
+                result = self.decode_json(resp.content)
+            except HTTPError as e:
+                error = error_from_response(e.response)
+                self._report_rate_limit(requests, error=error)
+                raise error
+            self._report_rate_limit(requests, result=result)
+        return result
+
+    def _reserve_rate_limit(self, requests):
+        """Take the rate limiter tokens of every request, return the seconds to wait."""
+        rate_limiter = getattr(self.client, 'rate_limiter', None)
+        if rate_limiter is None:
+            return 0
+        counts = Counter(mailbox_key(request['url']) or '' for request in requests)
+        return max(rate_limiter.reserve(prefix, count) for prefix, count in counts.items())
+
+    def _report_rate_limit(self, requests, result=None, error=None):
+        """Feed the rate limiter with the throttling of the batch, or of its items."""
+        rate_limiter = getattr(self.client, 'rate_limiter', None)
+        if rate_limiter is None:
+            return
+        if error is not None:
+            if error.status_code == 429:
+                rate_limiter.on_throttled('', error.retry_after)
+            return
+        prefixes = {request['id']: mailbox_key(request['url']) or '' for request in requests}
+        for resp in result.get('responses', []):
+            prefix = prefixes.get(resp['id'], '')
+            if resp.get('status') == 429:
+                rate_limiter.on_throttled(prefix, retry_after_seconds(resp.get('headers')))
             else:
-                raise Office365ServerError(
-                    e.response.status_code, e.response.content)
+                rate_limiter.on_success(prefix)
 
-    def execute(self):
+    def _prepare_requests(self):
         requests = []
         for request_id in self._order:
             request = self._requests[request_id]
             request['id'] = request_id
             requests.append(request)
+        return requests
+
+    def _split(self, requests):
+        """Split requests in chunks of MAX_BATCH_SIZE, keeping dependsOn chains in the same chunk."""
+        positions = {request['id']: i for i, request in enumerate(requests)}
+        groups = []
+        group_of = {}
+        for request in requests:
+            merged = sorted({group_of[dep] for dep in request.get('dependsOn', []) if dep in group_of})
+            if merged:
+                index = merged[0]
+                for other in merged[1:]:
+                    for request_id in groups[other]:
+                        group_of[request_id] = index
+                    groups[index].extend(groups[other])
+                    groups[other] = None
+            else:
+                index = len(groups)
+                groups.append([])
+            groups[index].append(request['id'])
+            group_of[request['id']] = index
+
+        chunks = []
+        chunk = []
+        for group in groups:
+            if group is None:
+                continue
+            if len(group) > MAX_BATCH_SIZE:
+                raise ValueError('More than {} requests depend on each other'.format(MAX_BATCH_SIZE))
+            if len(chunk) + len(group) > MAX_BATCH_SIZE:
+                chunks.append(chunk)
+                chunk = []
+            chunk.extend(group)
+        if chunk:
+            chunks.append(chunk)
+
+        return [[requests[positions[request_id]] for request_id in sorted(chunk, key=positions.get)]
+                for chunk in chunks]
+
+    def _execute_chunk(self, chunk):
+        """Return the result of the $batch request of chunk, or its Office365 error."""
+        try:
+            return self._execute(chunk)
+        except (Office365ClientError, Office365ServerError) as e:
+            return e
+
+    def _execute_round(self, requests):
+        chunks = self._split(requests)
+        if len(chunks) == 1 or self.parallelism <= 1:
+            outcomes = [self._execute_chunk(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.parallelism, len(chunks))) as executor:
+                outcomes = list(executor.map(self._execute_chunk, chunks))
+        for chunk, outcome in zip(chunks, outcomes):
+            self._store_outcome(chunk, outcome)
 
-        responses = self._execute(requests)
+    def execute(self):
+        requests = self._prepare_requests()
+        if not requests:
+            return
+        attempt = 1
+        waited = 0
+        while True:
+            self._execute_round(requests)
+            requests, delay = self._retry_requests(requests)
+            if not self._retries(requests, delay, attempt, waited):
+                break
+            attempt += 1
+            waited += delay
+            time.sleep(delay)
+        self._run_callbacks()
+
+    def _retries(self, requests, delay, attempt, waited):
+        """Whether requests are sent again after delay, attempt rounds and waited seconds."""
+        if not requests or attempt >= self.max_attempts:
+            return False
+        if waited + delay > self.max_total_delay:
+            logger.warning('Not retrying {}x batch requests: waiting {}s more exceeds {}s'.format(
+                len(requests), delay, self.max_total_delay))
+            return False
+        logger.info('Retrying {}x batch requests in {}s'.format(len(requests), delay))
+        return True
+
+    def _status(self, request_id):
+        """Return the status and the Retry-After seconds of the last response of a request."""
+        error = self._errors.get(request_id)
+        if error is not None:
+            return error.status_code, error.retry_after
+        response = self._responses.get(request_id) or {}
+        return response.get('status'), retry_after_seconds(response.get('headers'))
+
+    def _is_retried(self, method, status):
+        method = method.upper()
+        if status not in BATCH_RETRY_STATUSES or method not in self.retry_methods:
+            return False
+        return status == 429 or method in IDEMPOTENT_METHODS
+
+    def _retry_requests(self, requests):
+        """Return the requests of the last round to send again, and the delay to wait before."""
+        retry_ids = set()
+        delay = 0
+        for request in requests:
+            status, retry_after = self._status(request['id'])
+            if self._is_retried(request['method'], status):
+                retry_ids.add(request['id'])
+                delay = max(delay, BATCH_RETRY_DELAY if retry_after is None else retry_after)
+            elif status == 424 and retry_ids.intersection(request.get('dependsOn', [])):
+                # failed dependency on a request which is retried
+                retry_ids.add(request['id'])
+
+        retried = []
+        for request in requests:
+            if request['id'] not in retry_ids:
+                continue
+            request = dict(request)
+            depends_on = [dep for dep in request.get('dependsOn', []) if dep in retry_ids]
+            if depends_on:
+                request['dependsOn'] = depends_on
+            else:
+                request.pop('dependsOn', None)
+            retried.append(request)
+        return retried, delay
+
+    def _store_outcome(self, chunk, outcome):
+        """Store the result of the $batch request of chunk, or its error for every request."""
+        if isinstance(outcome, Exception):
+            logger.warning('Batch of {}x requests failed: {}'.format(len(chunk), outcome))
+            for request in chunk:
+                self._responses.pop(request['id'], None)
+                self._errors[request['id']] = outcome
+        else:
+            self._store_responses([outcome])
 
+    def _store_responses(self, results):
         # Map the responses to the request_ids
-        for resp in responses['responses']:
-            self._responses[resp['id']] = resp
-
+        for result in results:
+            for resp in result['responses']:
+                self._errors.pop(resp['id'], None)
+                self._responses[resp['id']] = resp
+
+    def _run_callbacks(self):
+        # the error of a failed $batch request, when one of its requests has no callback
+        unreported = None
         # Process the callbacks
         for request_id in self._order:
-            response = self._responses[request_id]
-            request = self._requests[request_id]
             callback = self._callbacks[request_id]
+            error = self._errors.get(request_id)
+            if error is not None:
+                # the $batch request of this one failed as a whole
+                if callback is not None:
+                    callback(request_id, None, error)
+                elif unreported is None:
+                    unreported = error
+                continue
+            response = self._responses[request_id]
             exception = None
             try:
                 if response['status'] >= 300:
                     error_data = response.get('body')
-                    raise Office365ClientError(response['status'], error_data)
+                    raise Office365ClientError(
+                        response['status'], error_data,
+                        retry_after=retry_after_seconds(response.get('headers')))
             except Office365ClientError as e:
                 exception = e
 
+            body = response.get('body')
+            model_class = self._models.get(request_id)
+            if model_class is not None and exception is None and body is not None:
+                body = model_class(body)
             if callback is not None:
-                callback(request_id, response['body'], exception)
+                callback(request_id, body, exception)
+        if unreported is not None:
+            raise unreported
 
     @property
     def is_empty(self) -> bool:
@@ -264,20 +991,19 @@ class BatchService(BaseService):
 
 
 class SubscriptionService(BaseService):
+    __slots__ = ()
 
     def create(self, body=None):
         """https://developer.microsoft.com/en-us/graph/docs/api-reference/v1.0/resources/webhooks ."""
         path = 'subscriptions'
         method = 'post'
-        _body = json.dumps(body)
-        return self.execute_request(method, path, body=_body)
+        return self.execute_request(method, path, json_body=body)
 
     def update(self, subscription_id, body=None):
         """Extend the duration of the subscription."""
         method = 'patch'
         path = 'subscriptions/%s' % subscription_id
-        _body = json.dumps(body)
-        return self.execute_request(method, path, body=_body)
+        return self.execute_request(method, path, json_body=body)
 
     def delete(self, subscription_id):
         """Unsubscribe to a webhook channel."""
@@ -286,28 +1012,26 @@ class SubscriptionService(BaseService):
         return self.execute_request(method, path)
 
 
-class UserServicesFactory(BaseFactory):
-    def __call__(self, user_id):
-        self.user_id = user_id
-        if user_id == 'me':
-            # special case for 'me'
-            return UserServicesCollection(self.client, 'me')
-        else:
-            return UserServicesCollection(self.client, 'users/' + user_id)
-
-
 class UserService(BaseService):
-    def get(self):
+    __slots__ = ()
+    projection_resource = 'user'
+    response_cached = True
+
+    def get(self, fields=[], expand=[], profile=None):
         path = ''
         method = 'get'
-        resp = self.execute_request(method, path)
+        query_params = self.projection(fields=fields, expand=expand, profile=profile)
+        resp = self.execute_request(method, path, query_params=query_params, cacheable=True)
         return resp
 
 
-class CalendarService(BaseService):
-    def list(self, _filter='', max_entries=DEFAULT_MAX_ENTRIES):
+class CalendarService(ListIterMixin, BaseService):
+    __slots__ = ()
+    projection_resource = 'calendar'
+    response_cached = True
+
+    def list(self, _filter='', max_entries=DEFAULT_MAX_ENTRIES, fields=[], expand=[], profile=None):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/user_list_calendars."""
-        # TODO: handle pagination
         path = '/calendars'
         method = 'get'
         query_params = {
@@ -315,25 +1039,24 @@ class CalendarService(BaseService):
         }
         if _filter:
             query_params['$filter'] = _filter
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        query_params = self.projection(query_params, fields, expand, profile)
+        return self.execute_paged_request(method, path, query_params=query_params, cacheable=True)
 
-    def get(self, calendar_id=None):
+    def get(self, calendar_id=None, fields=[], expand=[], profile=None):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/calendar_get ."""
         if calendar_id:
             path = '/calendars/' + calendar_id
         else:
             path = '/calendar'
         method = 'get'
-        return self.execute_request(method, path)
+        query_params = self.projection(fields=fields, expand=expand, profile=profile)
+        return self.execute_request(method, path, query_params=query_params, cacheable=True)
 
     def create(self, **kwargs):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/user_post_calendars ."""
         path = '/calendars'
         method = 'post'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
     def delete(self, calendar_id):
         path = '/calendars/' + calendar_id
@@ -343,11 +1066,14 @@ class CalendarService(BaseService):
     def update(self, calendar_id, **kwargs):
         path = '/calendars/' + calendar_id
         method = 'patch'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
 
-class EventService(BaseService):
+class EventService(ListIterMixin, BaseService):
+    __slots__ = ()
+    model_class = Event
+    projection_resource = 'event'
+
     def create(self, calendar_id=None, **kwargs):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/calendar_post_events ."""
         if calendar_id:
@@ -357,10 +1083,10 @@ class EventService(BaseService):
             # create in default calendar
             path = '/calendar/events'
         method = 'post'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
-    def list(self, calendar_id=None, _filter='', max_entries=DEFAULT_MAX_ENTRIES):
+    def list(self, calendar_id=None, _filter='', max_entries=DEFAULT_MAX_ENTRIES, fields=[],
+             expand=[], profile=None):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/calendar_list_events ."""
         if calendar_id:
             # create in specific calendar
@@ -374,18 +1100,20 @@ class EventService(BaseService):
         }
         if _filter:
             query_params['$filter'] = _filter
+        query_params = self.projection(query_params, fields, expand, profile)
 
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        return self.execute_paged_request(method, path, query_params=query_params)
 
-    def get(self, event_id, params=None, path=None):
+    def get(self, event_id, params=None, path=None, as_model=False, fields=[], expand=[],
+            profile=None):
         if not path:
             path = '/calendar/events/'
         path += event_id
 
         method = 'get'
-        return self.execute_request(method, path, query_params=params)
+        params = self.projection(params, fields, expand, profile)
+        result = self.execute_request(method, path, query_params=params)
+        return self.to_model(result) if as_model else result
 
     def update(self, event_id, path=None, **kwargs):
         if not path:
@@ -393,8 +1121,7 @@ class EventService(BaseService):
         path += event_id
 
         method = 'patch'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
     def delete(self, event_id, path=None):
         if not path:
@@ -406,23 +1133,30 @@ class EventService(BaseService):
 
 
 class EventServiceBeta(BaseBetaService):
-    def get(self, event_id, params=None, path=None, fields=[]):
+    __slots__ = ()
+    model_class = Event
+    projection_resource = 'event'
+
+    def get(self, event_id, params=None, path=None, fields=[], as_model=False, expand=[],
+            profile=None):
         if not path:
             path = '/events/'
         path += event_id
 
-        if params is None:
-            params = {}
-
-        if fields:
-            params['$select'] = ','.join(fields)
+        params = self.projection(params, fields, expand, profile)
 
         method = 'get'
-        return self.execute_request(method, path, query_params=params)
+        result = self.execute_request(method, path, query_params=params)
+        return self.to_model(result) if as_model else result
+
 
+class CalendarViewService(ListIterMixin, DeltaIterMixin, BaseService):
+    __slots__ = ()
+    model_class = delta_model_class = Event
+    projection_resource = 'event'
 
-class CalendarViewService(BaseService):
-    def list(self, start_datetime, end_datetime, max_entries=DEFAULT_MAX_ENTRIES, _filter='', calendar_id=None):
+    def list(self, start_datetime, end_datetime, max_entries=DEFAULT_MAX_ENTRIES, _filter='', calendar_id=None,
+             fields=[], expand=[], profile=None, _orderby=''):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/user_list_calendarview."""
         path = ''
         if calendar_id:
@@ -436,14 +1170,61 @@ class CalendarViewService(BaseService):
         }
         if _filter:
             query_params['$filter'] = _filter
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        if _orderby:
+            query_params['$orderby'] = _orderby
+        query_params = self.projection(query_params, fields, expand, profile)
+        return self.execute_paged_request(method, path, query_params=query_params)
+
+    def iter_sharded(self, start_datetime, end_datetime, window=DEFAULT_SHARD_WINDOW,
+                     max_workers=DEFAULT_SHARD_WORKERS, as_model=False, **kwargs):
+        """
+        Iterate over the events of a long range, fetched concurrently in windows.
+
+        The range is split in windows of `window` (a timedelta), the pages of
+        up to max_workers windows are fetched at a time, and the events are
+        yielded page by page in start time order. An event spanning several
+        windows is returned by each of them but yielded once; the occurrences
+        of the recurring events have their own ids. kwargs: the other
+        arguments of list, but _orderby.
+        """
+        kwargs = self._sharded_kwargs(kwargs)
+
+        def fetch(window, next_link):
+            if next_link:
+                return self.follow_next_link(next_link, **self._follow_kwargs(kwargs))
+            start, end = window
+            return self.list(format_datetime(start), format_datetime(end),
+                             _orderby=SHARDED_ORDERBY, **kwargs)
+
+        model = self.model_class if as_model else None
+        merger = WindowMerger()
+        windows = split_windows(start_datetime, end_datetime, window)
+        for (_, window_end), page in iter_window_pages(fetch, windows, max_workers=max_workers):
+            for event in merger.merge(window_end, page.get('value', [])):
+                yield event if model is None else model(event)
+
+    @staticmethod
+    def _sharded_kwargs(kwargs):
+        if '_orderby' in kwargs:
+            raise TypeError('The sharded events are sorted by {}'.format(SHARDED_ORDERBY))
+        fields = kwargs.get('fields')
+        if fields:
+            # needed to merge the windows
+            kwargs['fields'] = list(fields) + [f for f in ('id', 'start', 'end') if f not in fields]
+        return kwargs
+
+    @staticmethod
+    def _follow_kwargs(kwargs):
+        if 'max_entries' in kwargs:
+            return {'max_entries': kwargs['max_entries']}
+        return {}
 
     def delta_list(self, start_datetime=None, end_datetime=None, delta_token=None, calendar_id=None, max_entries=DEFAULT_MAX_ENTRIES):
         """
         Support tracking of changes in the calendarview.
 
+        The delta of the calendarview supports no $select: the projection
+        profiles do not apply.
         https://developer.microsoft.com/en-us/graph/docs/concepts/delta_query_overview
         """
         path = ''
@@ -465,17 +1246,21 @@ class CalendarViewService(BaseService):
             query_params.update({
                 '$deltaToken': delta_token,
             })
-        resp = self.execute_request(
+        return self.execute_paged_request(
             method, path, query_params=query_params, headers=headers)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
 
 
-class MessageService(BaseService):
+class MessageService(ListIterMixin, BulkMixin, BaseService):
+    __slots__ = ()
+    model_class = Message
+    projection_resource = 'message'
 
-    def list(self, _filter=None, _search=None, max_entries=DEFAULT_MAX_ENTRIES, fields=[]):
+    def list(self, _filter=None, _search=None, max_entries=DEFAULT_MAX_ENTRIES, fields=[],
+             expand=[], profile=None, _orderby=None, folder_id=None):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/user_list_messages ."""
         path = '/messages'
+        if folder_id:
+            path = '/mailFolders/{}/messages'.format(folder_id)
         method = 'get'
         query_params = {
             "$top": max_entries
@@ -486,34 +1271,57 @@ class MessageService(BaseService):
         if _search:
             query_params['$search'] = _search
 
-        if fields:
-            query_params['$select'] = ','.join(fields)
+        if _orderby:
+            query_params['$orderby'] = _orderby
 
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        query_params = self.projection(query_params, fields, expand, profile)
+
+        return self.execute_paged_request(method, path, query_params=query_params)
+
+    def count(self, _filter=None, folder_id=None):
+        """Return the number of messages matching _filter, in the folder folder_id if any."""
+        path = '/messages/$count'
+        if folder_id:
+            path = '/mailFolders/{}/messages/$count'.format(folder_id)
+        method = 'get'
+        query_params = {'$filter': _filter} if _filter else None
+        return int(self.execute_request(method, path, query_params=query_params))
 
-    def get(self, message_id, _filter=None, format=RESPONSE_FORMAT_ODATA):
+    def get(self, message_id, _filter=None, format=RESPONSE_FORMAT_ODATA, as_model=False,
+            fields=[], expand=[], profile=None):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/user_list_messages ."""
         if format not in self.supported_response_formats:
             raise ValueError(format)
+        if as_model and format != RESPONSE_FORMAT_ODATA:
+            raise ValueError('as_model requires the {} format'.format(RESPONSE_FORMAT_ODATA))
 
         if format == RESPONSE_FORMAT_ODATA:
             path = '/messages/{}'.format(message_id)
+            _filter = self.projection(_filter, fields, expand, profile)
         elif format == RESPONSE_FORMAT_RAW:
             path = '/messages/{}/$value'.format(message_id)
         else:
             raise NotImplementedError(format)
 
         method = 'get'
-        return self.execute_request(method, path, query_params=_filter, parse_json_result=(not format == RESPONSE_FORMAT_RAW))
+        result = self.execute_request(method, path, query_params=_filter, parse_json_result=(not format == RESPONSE_FORMAT_RAW))
+        return self.to_model(result) if as_model else result
+
+    def stream_raw(self, message_id, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield the MIME content of the message in chunks of chunk_size bytes."""
+        path = '/messages/{}/$value'.format(message_id)
+        method = 'get'
+        return self.execute_stream_request(method, path, chunk_size=chunk_size)
+
+    def download_raw(self, message_id, sink, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Write the MIME content of the message to sink (path or file-like), return the size."""
+        return write_chunks(self.stream_raw(message_id, chunk_size=chunk_size), sink)
 
     def create(self, **kwargs):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/user_post_messages ."""
         path = '/messages'
         method = 'post'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
     def send(self, message_id, **kwargs):
         """https://developer.microsoft.com/en-us/graph/docs/api-reference/v1.0/api/message_send ."""
@@ -526,18 +1334,180 @@ class MessageService(BaseService):
     def update(self, message_id, **kwargs):
         path = '/messages/{}'.format(message_id)
         method = 'patch'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
     def move(self, message_id, destination_id):
         path = '/messages/{}/move'.format(message_id)
         method = 'post'
-        body = json.dumps({'DestinationId': destination_id})
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body={'DestinationId': destination_id})
 
+    def delete(self, message_id):
+        path = '/messages/{}'.format(message_id)
+        method = 'delete'
+        return self.execute_request(method, path)
+
+    def bulk_move(self, message_ids, destination_id, parallelism=DEFAULT_BATCH_PARALLELISM):
+        """Move the messages to the folder destination_id, return a BulkReport of their new ids."""
+        return self.execute_bulk(
+            message_ids, lambda service, message_id: service.move(message_id, destination_id),
+            parallelism=parallelism)
+
+    def bulk_update(self, message_ids, changes, parallelism=DEFAULT_BATCH_PARALLELISM):
+        """Apply the properties of changes (isRead, categories, flag...) to the messages."""
+        return self.execute_bulk(
+            message_ids, lambda service, message_id: service.update(message_id, **changes),
+            parallelism=parallelism)
+
+    def bulk_delete(self, message_ids, parallelism=DEFAULT_BATCH_PARALLELISM):
+        """Delete the messages (to the Deleted Items folder), return a BulkReport."""
+        return self.execute_bulk(
+            message_ids, lambda service, message_id: service.delete(message_id),
+            parallelism=parallelism)
+
+
+class UploadSession(object):
+    """
+    Upload content to a Graph upload session in fixed-size byte ranges.
+
+    https://docs.microsoft.com/en-us/graph/outlook-large-attachments
+    The upload url is pre-authenticated, so the requests are sent on a
+    session of their own, without the authentication of the client: a
+    pooled session with the default timeouts of transport.build_session,
+    closed once the upload is done, unless a session is given.
+    retry_policy: the retry.RetryPolicy giving the delay before retrying a
+    failed range, the one of the client
+    """
+
+    def __init__(self, upload_url, session=None, retry_policy=None):
+        self.upload_url = upload_url
+        self.owns_session = session is None
+        if session is None:
+            parts = urllib.parse.urlsplit(upload_url)
+            session = build_session(
+                max_concurrency=1, url='{}://{}'.format(parts.scheme, parts.netloc))
+        self.session = session
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    def _request(self, method, **kwargs):
+        try:
+            resp = self.session.request(url=self.upload_url, method=method, **kwargs)
+        except HTTPError as e:
+            raise error_from_response(e.response)
+        if resp.status_code >= 400:
+            raise error_from_response(resp)
+        return resp
+
+    def get_status(self):
+        """Return the session status, including 'nextExpectedRanges'."""
+        return self._request('GET').json()
+
+    def next_offset(self):
+        """Return the first byte the server expects next, retrying as the ranges are."""
+        attempt = 0
+        waited = 0
+        while True:
+            try:
+                status = self.get_status()
+                break
+            except UPLOAD_RETRY_ERRORS as e:
+                delay = self.retry_delay(e, attempt, waited)
+                if delay is None:
+                    raise
+                attempt += 1
+                waited += delay
+                logger.info('Retrying upload session status in {:.2f}s after {}'.format(delay, e))
+                time.sleep(delay)
+        ranges = status.get('nextExpectedRanges') or ['0-']
+        return int(ranges[0].split('-')[0])
+
+    def cancel(self):
+        self._request('DELETE')
+
+    def close(self):
+        if self.owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        return self
 
-class AttachmentService(BaseService):
-    def list(self, message_id, _filter=None, fields=[], max_entries=DEFAULT_MAX_ENTRIES):
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def retry_delay(self, error, attempt, waited):
+        """
+        Return the seconds to wait before retrying a request failing with
+        error, its Retry-After or the backoff of the retry policy, or None to
+        give up: on a client error other than a throttling (429), after
+        UPLOAD_RETRIES_COUNT retries or past the max_total_delay of the policy.
+
+        attempt: number of retries already done
+        waited: seconds already spent waiting for those retries
+        """
+        if isinstance(error, Office365ClientError) and not error.is_throttled:
+            return None
+        if attempt >= UPLOAD_RETRIES_COUNT:
+            return None
+        retry_after = getattr(error, 'retry_after', None)
+        delay = retry_after if retry_after is not None else self.retry_policy.backoff(attempt)
+        if waited + delay > self.retry_policy.max_total_delay:
+            return None
+        return delay
+
+    def upload(self, source, size=None, chunk_size=UPLOAD_CHUNK_SIZE, resume=False):
+        """
+        Upload source range by range and return the url of the created item.
+
+        source: a file path, a binary file object or a mmap; only one range is
+        read in memory at a time.
+        resume: continue from the ranges already stored by the server, e.g.
+        after a worker restart.
+        A range failing with a server error, a throttling (429) or a
+        connection error is retried from the offset reported by the server,
+        after the delay of retry_delay, up to UPLOAD_RETRIES_COUNT times in a
+        row. The session is closed once done.
+        """
+        with self, open_source(source) as f:
+            if size is None:
+                size = source_size(f)
+            offset = self.next_offset() if resume else 0
+            attempt = 0
+            waited = 0
+            resp = None
+            while offset < size:
+                end = min(offset + chunk_size, size) - 1
+                f.seek(offset)
+                data = f.read(end - offset + 1)
+                headers = {
+                    'Content-Length': str(len(data)),
+                    'Content-Range': 'bytes {}-{}/{}'.format(offset, end, size),
+                }
+                logger.info('PUT: upload session range {}-{}/{}'.format(offset, end, size))
+                try:
+                    resp = self._request('PUT', data=data, headers=headers)
+                except UPLOAD_RETRY_ERRORS as e:
+                    delay = self.retry_delay(e, attempt, waited)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    waited += delay
+                    logger.info('Retrying upload session range {}-{} in {:.2f}s after {}'.format(
+                        offset, end, delay, e))
+                    time.sleep(delay)
+                    offset = self.next_offset()
+                    continue
+                attempt = 0
+                waited = 0
+                offset = end + 1
+
+        return resp.headers.get('Location') if resp is not None else None
+
+
+class AttachmentService(ListIterMixin, BaseService):
+    __slots__ = ()
+    projection_resource = 'attachment'
+
+    def list(self, message_id, _filter=None, fields=[], max_entries=DEFAULT_MAX_ENTRIES,
+             expand=[], profile=None):
         path = '/messages/{}/attachments'.format(message_id)
         method = 'get'
         query_params = {
@@ -545,22 +1515,20 @@ class AttachmentService(BaseService):
         }
         if _filter:
             query_params['$filter'] = _filter
-        if fields:
-            query_params['$select'] = ','.join(fields)
+        query_params = self.projection(query_params, fields, expand, profile)
 
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        return self.execute_paged_request(method, path, query_params=query_params)
 
     def list_first_page(self, message_id, _filter=None, fields=[]):
         # backwards compatibility
         resp, _ = self.list(message_id, _filter, fields)
         return resp
 
-    def get(self, message_id, attachment_id):
+    def get(self, message_id, attachment_id, fields=[], expand=[], profile=None):
         path = '/messages/{}/attachments/{}'.format(message_id, attachment_id)
         method = 'get'
-        return self.execute_request(method, path)
+        query_params = self.projection(fields=fields, expand=expand, profile=profile)
+        return self.execute_request(method, path, query_params=query_params)
 
     def get_content(self, message_id, attachment_id):
         path = '/messages/{}/attachments/{}/$value'.format(
@@ -568,38 +1536,103 @@ class AttachmentService(BaseService):
         method = 'get'
         return self.execute_request(method, path, parse_json_result=False)
 
+    def stream_content(self, message_id, attachment_id, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield the attachment content in chunks of chunk_size bytes."""
+        path = '/messages/{}/attachments/{}/$value'.format(
+            message_id, attachment_id)
+        method = 'get'
+        return self.execute_stream_request(method, path, chunk_size=chunk_size)
+
+    def download_content(self, message_id, attachment_id, sink, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Write the attachment content to sink (path or file-like), return the size."""
+        return write_chunks(
+            self.stream_content(message_id, attachment_id, chunk_size=chunk_size), sink)
+
     def create(self, message_id, **kwargs):
         """https://graph.microsoft.io/en-us/docs/api-reference/v1.0/api/message_post_attachments ."""
         path = '/messages/{}/attachments'.format(message_id)
         method = 'post'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
+    def create_upload_session(self, message_id, name, size, content_type=None, is_inline=False,
+                              content_id=None):
+        """https://docs.microsoft.com/en-us/graph/api/attachment-createuploadsession ."""
+        path = '/messages/{}/attachments/createUploadSession'.format(message_id)
+        method = 'post'
+        body = {'AttachmentItem': self._upload_item(
+            name, size, content_type=content_type, is_inline=is_inline, content_id=content_id)}
+        resp = self.execute_request(method, path, json_body=body)
+        return UploadSession(
+            resp['uploadUrl'], retry_policy=getattr(self.client, 'retry_policy', None))
+
+    @staticmethod
+    def _upload_name(source, name):
+        if name is None:
+            if not isinstance(source, (str, os.PathLike)):
+                raise ValueError('name is required when source is not a path')
+            name = os.path.basename(source)
+        return name
+
+    @staticmethod
+    def _upload_item(name, size, content_type=None, is_inline=False, content_id=None):
+        attachment_item = {
+            'attachmentType': 'file',
+            'name': name,
+            'size': size,
+        }
+        if content_type:
+            attachment_item['contentType'] = content_type
+        if is_inline:
+            attachment_item['isInline'] = True
+        if content_id:
+            attachment_item['contentId'] = content_id
+        return attachment_item
+
+    def upload(self, message_id, source, name=None, content_type=None, is_inline=False,
+               content_id=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        """
+        Attach a large file through an upload session, without loading it in memory.
 
-class ContactFolderService(BaseService):
-    def list(self, max_entries=DEFAULT_MAX_ENTRIES):
+        source: a file path, a binary file object or a mmap.
+        Return the url of the created attachment.
+        """
+        name = self._upload_name(source, name)
+        with open_source(source) as f:
+            size = source_size(f)
+            upload_session = self.create_upload_session(
+                message_id, name, size, content_type=content_type, is_inline=is_inline,
+                content_id=content_id)
+            return upload_session.upload(f, size=size, chunk_size=chunk_size)
+
+
+class ContactFolderService(ListIterMixin, DeltaIterMixin, BaseService):
+    __slots__ = ()
+    delta_model_class = Contact
+    projection_resource = 'contactFolder'
+
+    def list(self, max_entries=DEFAULT_MAX_ENTRIES, fields=[], expand=[], profile=None):
         path = '/contactFolders'
         method = 'get'
         query_params = {
             '$top': max_entries
         }
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        query_params = self.projection(query_params, fields, expand, profile)
+        return self.execute_paged_request(method, path, query_params=query_params)
 
-    def get(self, folder_id):
+    def get(self, folder_id, fields=[], expand=[], profile=None):
         path = '/contactFolders/' + folder_id
         method = 'get'
-        return self.execute_request(method, path)
+        query_params = self.projection(fields=fields, expand=expand, profile=profile)
+        return self.execute_request(method, path, query_params=query_params)
 
     def create(self, **kwargs):
         path = '/contactFolders'
         method = 'post'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
     def delta_list(self, folder_id: str = 'contacts', fields: List[str] = [
-    ], delta_token: str = None, max_entries=DEFAULT_MAX_ENTRIES) -> Tuple[Dict[str, Any], str]:
+    ], delta_token: str = None, max_entries=DEFAULT_MAX_ENTRIES, expand: List[str] = [],
+            profile: str = None) -> Tuple[Dict[str, Any], str]:
         path = f"/contactFolders('{folder_id}')/contacts/delta"
         method = 'get'
         query_params = None
@@ -607,19 +1640,20 @@ class ContactFolderService(BaseService):
             query_params = {
                 '$deltatoken': delta_token
             }
-        elif fields:
-            query_params = {
-                '$select': ','.join(fields)
-            }
+        else:
+            query_params = self.projection(
+                fields=fields, expand=expand, profile=profile, resource='contact')
         headers = {
             'Prefer': 'odata.maxpagesize=%d' % max_entries
         }
-        resp = self.execute_request(method, path, query_params=query_params, headers=headers)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        return self.execute_paged_request(method, path, query_params=query_params, headers=headers)
+
 
+class ContactService(ListIterMixin, BaseService):
+    __slots__ = ()
+    model_class = Contact
+    projection_resource = 'contact'
 
-class ContactService(BaseService):
     def create(self, contact_folder_id=None, **kwargs):
         if contact_folder_id:
             # create in specific folder
@@ -628,10 +1662,10 @@ class ContactService(BaseService):
             # create in default calendar
             path = '/contacts'
         method = 'post'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
-    def list(self, contact_folder_id=None, _filter='', max_entries=DEFAULT_MAX_ENTRIES):
+    def list(self, contact_folder_id=None, _filter='', max_entries=DEFAULT_MAX_ENTRIES, fields=[],
+             expand=[], profile=None):
         if contact_folder_id:
             # list in specific folder
             path = '/contactFolders/' + contact_folder_id + '/contacts'
@@ -644,15 +1678,16 @@ class ContactService(BaseService):
         }
         if _filter:
             query_params['$filter'] = _filter
+        query_params = self.projection(query_params, fields, expand, profile)
 
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        return self.execute_paged_request(method, path, query_params=query_params)
 
-    def get(self, contact_id):
+    def get(self, contact_id, as_model=False, fields=[], expand=[], profile=None):
         path = '/contacts/' + contact_id
         method = 'get'
-        return self.execute_request(method, path)
+        query_params = self.projection(fields=fields, expand=expand, profile=profile)
+        result = self.execute_request(method, path, query_params=query_params)
+        return self.to_model(result) if as_model else result
 
     def delete(self, contact_id):
         path = '/contacts/' + contact_id
@@ -662,26 +1697,30 @@ class ContactService(BaseService):
     def update(self, contact_id, **kwargs):
         path = '/contacts/' + contact_id
         method = 'patch'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
 
-class MailFolderService(BaseService):
+class MailFolderService(ListIterMixin, DeltaIterMixin, BaseService):
+    __slots__ = ()
+    response_cached = True
+    model_class = MailFolder
+    delta_model_class = Message
+    projection_resource = 'mailFolder'
+
     def create(self, **kwargs):
         path = '/mailFolders'
         method = 'post'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
-    def list(self, max_entries=DEFAULT_MAX_ENTRIES):
+    def list(self, max_entries=DEFAULT_MAX_ENTRIES, fields=[], expand=[], profile=None):
         path = '/mailFolders'
         method = 'get'
         query_params = {'$top': max_entries}
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        query_params = self.projection(query_params, fields, expand, profile)
+        return self.execute_paged_request(method, path, query_params=query_params, cacheable=True)
 
-    def delta_list(self, folder_id, delta_token=None, _filter=None, max_entries=DEFAULT_MAX_ENTRIES, fields=[]):
+    def delta_list(self, folder_id, delta_token=None, _filter=None, max_entries=DEFAULT_MAX_ENTRIES, fields=[],
+                   expand=[], profile=None):
         """
         Support tracking of changes in the mailFolders.
 
@@ -700,57 +1739,59 @@ class MailFolderService(BaseService):
         if _filter:
             query_params.update({'$filter': _filter})
 
-        if fields:
-            query_params.update({'$select': ','.join(fields)})
+        query_params = self.projection(
+            query_params, fields, expand, profile, resource='message')
 
-        resp = self.execute_request(
+        return self.execute_paged_request(
             method, path, query_params=query_params, headers=headers)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
 
-    def get(self, folder_id):
+    def get(self, folder_id, as_model=False, fields=[], expand=[], profile=None):
         path = '/mailFolders/' + folder_id
         method = 'get'
-        return self.execute_request(method, path)
+        query_params = self.projection(fields=fields, expand=expand, profile=profile)
+        result = self.execute_request(method, path, query_params=query_params)
+        return self.to_model(result) if as_model else result
 
-    def list_childfolders(self, folder_id, max_entries=DEFAULT_MAX_ENTRIES):
+    def list_childfolders(self, folder_id, max_entries=DEFAULT_MAX_ENTRIES, fields=[], expand=[],
+                          profile=None):
         path = '/mailFolders/' + folder_id + '/childFolders'
         method = 'get'
         query_params = {'$top': max_entries}
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        query_params = self.projection(query_params, fields, expand, profile)
+        return self.execute_paged_request(method, path, query_params=query_params)
 
     def create_childfolder(self, folder_id, **kwargs):
         path = '/mailFolders/' + folder_id + '/childFolders'
         method = 'post'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
 
 class MailboxSettingsService(BaseService):
+    __slots__ = ()
+    response_cached = True
+
     def get(self):
         """https://docs.microsoft.com/en-us/graph/api/user-get-mailboxsettings"""
         path = '/mailboxSettings'
         method = 'get'
-        resp = self.execute_request(method, path)
+        resp = self.execute_request(method, path, cacheable=True)
         return resp
 
 
-class MasterCategoriesService(BaseService):
+class MasterCategoriesService(ListIterMixin, BaseService):
+    __slots__ = ()
+    response_cached = True
+
     def list(self, max_entries=DEFAULT_MAX_ENTRIES):
         path = '/masterCategories'
         method = 'get'
         query_params = {'$top': max_entries}
-        resp = self.execute_request(method, path, query_params=query_params)
-        next_link = resp.get('@odata.nextLink')
-        return resp, next_link
+        return self.execute_paged_request(method, path, query_params=query_params, cacheable=True)
 
     def create(self, **kwargs):
         path = '/masterCategories'
         method = 'post'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
     def get(self, category_id):
         path = '/masterCategories/' + category_id
@@ -760,10 +1801,85 @@ class MasterCategoriesService(BaseService):
     def update(self, category_id, **kwargs):
         path = '/masterCategories/' + category_id
         method = 'patch'
-        body = json.dumps(kwargs)
-        return self.execute_request(method, path, body=body)
+        return self.execute_request(method, path, json_body=kwargs)
 
     def delete(self, category_id):
         path = '/masterCategories/' + category_id
         method = 'delete'
         return self.execute_request(method, path)
+
+
+class LazyService(object):
+    """
+    Build the service of a collection on first access.
+
+    The service is then stored in the instance dict, which takes precedence
+    over this (non-data) descriptor on the next accesses.
+    """
+
+    def __init__(self, service_class):
+        self.service_class = service_class
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        service = instance._build(self.service_class)
+        instance.__dict__[self.name] = service
+        return service
+
+
+class ServicesCollection(object):
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+
+    def _build(self, service_class):
+        return service_class(self.client, self.prefix)
+
+
+class OutlookServicesCollection(ServicesCollection):
+    """Wrap a collection of services grouped by 'outlook' context."""
+    masterCategories = LazyService(MasterCategoriesService)
+
+    def __init__(self, client, prefix):
+        super().__init__(client, prefix + '/outlook')
+
+
+class UserServicesCollection(ServicesCollection):
+    """Wrap a collection of services in a context, built on first access."""
+    calendar = LazyService(CalendarService)
+    calendarview = LazyService(CalendarViewService)
+    event = LazyService(EventService)
+    event_beta = LazyService(EventServiceBeta)
+    message = LazyService(MessageService)
+    attachment = LazyService(AttachmentService)
+    contactfolder = LazyService(ContactFolderService)
+    contact = LazyService(ContactService)
+    mailfolder = LazyService(MailFolderService)
+    user = LazyService(UserService)
+    mailboxSettings = LazyService(MailboxSettingsService)
+    outlook = LazyService(OutlookServicesCollection)
+
+
+class UserServicesFactory(BaseFactory):
+    """
+    Return the services of a user.
+
+    Each call returns a new collection, so that a service patched by one
+    caller (patches.become_request, a mock) is never seen by the others.
+    The collections build their services on first access, so a call costs
+    a single small object.
+    """
+    collection_class = UserServicesCollection
+
+    def __call__(self, user_id):
+        self.user_id = user_id
+        if user_id == 'me':
+            # special case for 'me'
+            return self.collection_class(self.client, 'me')
+        else:
+            return self.collection_class(self.client, 'users/' + user_id)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Split a time range in windows which are fetched concurrently.
+
+The pages of the windows are fetched by a bounded pool of threads, and
+yielded in the order of the windows, so that the items keep the order of
+the range.
+"""
+import itertools
+import re
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_SHARD_WINDOW = timedelta(days=30)
+DEFAULT_SHARD_WORKERS = 4
+# pages of a window fetched ahead of the one being yielded
+DEFAULT_PAGES_AHEAD = 2
+# returned by WindowPagesScheduler.pop while the next page is being fetched
+WAIT = object()
+
+# Graph returns up to 7 digits of fractional seconds
+_FRACTION = re.compile(r'(\.\d{6})\d+')
+
+
+def parse_datetime(value):
+    """
+    Return value, a datetime or an ISO 8601 string, as an aware UTC datetime.
+
+    Naive values are in UTC, as the dateTime of the Graph responses
+    requested without an outlook.timezone preference.
+    """
+    if not isinstance(value, datetime):
+        value = _FRACTION.sub(r'\1', value.strip())
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def format_datetime(value):
+    """Return the UTC datetime value in the format of the Graph query parameters."""
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def split_windows(start, end, window=DEFAULT_SHARD_WINDOW):
+    """Return the consecutive (start, end) windows of at most window covering [start, end)."""
+    start = parse_datetime(start)
+    end = parse_datetime(end)
+    if window <= timedelta(0):
+        raise ValueError('The window must be positive')
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start += window
+    return windows
+
+
+class WindowMerger(object):
+    """
+    Drop the events of a window already yielded by the previous windows.
+
+    An event spanning several windows is returned by each of them: the ids
+    of the events ending after the end of their window are kept until a
+    window starts after them. The events of a window may be merged page by
+    page.
+    """
+
+    def __init__(self):
+        # id -> end of the events yielded which may be returned by the next windows
+        self.spanning = {}
+        self.window_end = None
+
+    def merge(self, window_end, events):
+        """Return the events of the window ending at window_end which were not yielded yet."""
+        if window_end != self.window_end:
+            if self.window_end is not None:
+                # the window starts at the end of the previous one
+                self.spanning = {event_id: end for event_id, end in self.spanning.items()
+                                 if end is None or end >= self.window_end}
+            self.window_end = window_end
+        merged = []
+        for event in events:
+            event_id = event.get('id')
+            if event_id in self.spanning:
+                continue
+            end = (event.get('end') or {}).get('dateTime')
+            end = parse_datetime(end) if end else None
+            # also kept when ending on the boundary, if the next window returns it
+            if end is None or end >= window_end:
+                self.spanning[event_id] = end
+            merged.append(event)
+        return merged
+
+
+class WindowPages(object):
+    """The pages of a window fetched and not yielded yet, and the request of the next one."""
+    __slots__ = ('window', 'pages', 'next_link', 'started', 'task', 'error')
+
+    def __init__(self, window):
+        self.window = window
+        self.pages = deque()
+        self.next_link = None
+        self.started = False
+        # the future (or asyncio task) of the page being fetched
+        self.task = None
+        self.error = None
+
+    @property
+    def done(self):
+        return self.started and self.next_link is None and self.task is None
+
+
+class WindowPagesScheduler(object):
+    """
+    Schedule the page requests of consecutive windows, to yield their pages in order.
+
+    The pages of a window are chained by their next links, so a window has a
+    single page request at a time. Up to max_workers requests run at a
+    time, for the next max_workers windows, starting with the window being
+    yielded; every window buffers up to max_pages_ahead pages.
+    """
+
+    def __init__(self, windows, max_workers=DEFAULT_SHARD_WORKERS,
+                 max_pages_ahead=DEFAULT_PAGES_AHEAD):
+        self.windows = deque(WindowPages(window) for window in windows)
+        self.max_workers = max_workers
+        self.max_pages_ahead = max_pages_ahead
+
+    def running(self):
+        return [pages.task for pages in self.windows if pages.task is not None]
+
+    def to_fetch(self):
+        """Return the WindowPages whose next page is to be requested, and stored as their task."""
+        ahead = list(itertools.islice(self.windows, self.max_workers))
+        running = len([pages for pages in ahead if pages.task is not None])
+        to_fetch = []
+        for pages in ahead:
+            if running >= self.max_workers:
+                break
+            if (pages.task is None and pages.error is None and not pages.done
+                    and len(pages.pages) < self.max_pages_ahead):
+                to_fetch.append(pages)
+                running += 1
+        return to_fetch
+
+    def collect(self):
+        """Store the outcome of the page requests which are done."""
+        for pages in self.windows:
+            if pages.task is None or not pages.task.done():
+                continue
+            try:
+                page, pages.next_link = pages.task.result()
+                pages.pages.append(page)
+            except Exception as e:
+                pages.error = e
+            pages.started = True
+            pages.task = None
+
+    def pop(self):
+        """
+        Return the next (window, page), WAIT while it is being fetched, or
+        None once every page is yielded. The error of a window is raised when
+        it is reached.
+        """
+        while self.windows:
+            head = self.windows[0]
+            if head.pages:
+                return head.window, head.pages.popleft()
+            if head.error is not None:
+                raise head.error
+            if not head.done:
+                return WAIT
+            self.windows.popleft()
+        return None
+
+
+def iter_window_pages(fetch, windows, max_workers=DEFAULT_SHARD_WORKERS,
+                      max_pages_ahead=DEFAULT_PAGES_AHEAD):
+    """
+    Yield (window, page) for every page of the windows, in the order of the windows.
+
+    fetch(window, next_link) returns the page of the window following
+    next_link (its first page when None) and the link of the next one. The
+    pages are fetched by a pool of max_workers threads, as scheduled by
+    WindowPagesScheduler.
+    """
+    scheduler = WindowPagesScheduler(windows, max_workers, max_pages_ahead)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while True:
+            scheduler.collect()
+            for pages in scheduler.to_fetch():
+                pages.task = executor.submit(fetch, pages.window, pages.next_link)
+            item = scheduler.pop()
+            if item is None:
+                break
+            if item is WAIT:
+                wait(scheduler.running(), return_when=FIRST_COMPLETED)
+                continue
+            yield item
+    finally:
+        # the iteration may be stopped early: drop the pages not requested yet
+        executor.shutdown(wait=False, cancel_futures=True)
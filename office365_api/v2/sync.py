@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""Delta synchronization of many mailboxes on a bounded pool of threads."""
+import logging
+import math
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+
+from .deltastate import DeltaState
+from .exceptions import Office365ClientError
+from .pagination import delta_token_from_link
+from .services import DEFAULT_MAX_ENTRIES
+from .sharding import format_datetime, parse_datetime, split_windows
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+# Graph allows 4 concurrent requests per app and mailbox
+MAILBOX_CONCURRENCY_LIMIT = 4
+DEFAULT_PER_MAILBOX_CONCURRENCY = 2
+# messages of a backfill shard above which it is split, and in at most how many parts
+DEFAULT_BACKFILL_SHARD_SIZE = 5000
+MAX_BACKFILL_SPLIT = 16
+# markers of the backfill checkpoints, stored as the checkpoint of their states
+BACKFILL_RANGE = 'range:'
+BACKFILL_SPLIT = 'split:'
+BACKFILL_DONE = 'done'
+# lower bound of the receivedDateTime filter of the query of the oldest message
+OLDEST_RECEIVED = datetime(1900, 1, 1, tzinfo=timezone.utc)
+
+
+class DeltaResource(object):
+    """A delta query on a resource of a mailbox."""
+    max_entries = DEFAULT_MAX_ENTRIES
+
+    @property
+    def key(self):
+        """Identify the resource within its mailbox."""
+        raise NotImplementedError
+
+    def service(self, services):
+        """Return the service of the UserServicesCollection running the query."""
+        raise NotImplementedError
+
+    def first_page(self, services, delta_token=None):
+        """Run the delta query, return the response and the next link."""
+        raise NotImplementedError
+
+
+class MailFolderDelta(DeltaResource):
+    def __init__(self, folder_id, fields=[], _filter=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 profile=None):
+        self.folder_id = folder_id
+        self.fields = fields
+        self.profile = profile
+        self._filter = _filter
+        self.max_entries = max_entries
+
+    @property
+    def key(self):
+        return 'mailfolder:' + self.folder_id
+
+    def service(self, services):
+        return services.mailfolder
+
+    def first_page(self, services, delta_token=None):
+        return services.mailfolder.delta_list(
+            self.folder_id, delta_token=delta_token, _filter=self._filter,
+            max_entries=self.max_entries, fields=self.fields, profile=self.profile)
+
+
+class CalendarViewDelta(DeltaResource):
+    def __init__(self, start_datetime, end_datetime, calendar_id=None,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+        self.calendar_id = calendar_id
+        self.max_entries = max_entries
+
+    @property
+    def key(self):
+        return 'calendarview:{}:{}:{}'.format(
+            self.calendar_id or '', self.start_datetime, self.end_datetime)
+
+    def service(self, services):
+        return services.calendarview
+
+    def first_page(self, services, delta_token=None):
+        return services.calendarview.delta_list(
+            start_datetime=self.start_datetime, end_datetime=self.end_datetime,
+            delta_token=delta_token, calendar_id=self.calendar_id, max_entries=self.max_entries)
+
+
+class ContactFolderDelta(DeltaResource):
+    def __init__(self, folder_id='contacts', fields=[], max_entries=DEFAULT_MAX_ENTRIES,
+                 profile=None):
+        self.folder_id = folder_id
+        self.fields = fields
+        self.profile = profile
+        self.max_entries = max_entries
+
+    @property
+    def key(self):
+        return 'contactfolder:' + self.folder_id
+
+    def service(self, services):
+        return services.contactfolder
+
+    def first_page(self, services, delta_token=None):
+        return services.contactfolder.delta_list(
+            folder_id=self.folder_id, fields=self.fields, delta_token=delta_token,
+            max_entries=self.max_entries, profile=self.profile)
+
+
+def iter_resumable_delta(services, mailbox, resource, state_store, on_resync=None):
+    """
+    Yield the pages of the delta query of resource, resuming from state_store.
+
+    The state is saved once the caller is done with a page: the next link
+    while paginating, then the new delta token, so that a restarted worker
+    resumes from the last processed page. When the stored state has expired
+    (syncStateNotFound), it is dropped, on_resync(mailbox, resource) is
+    called and the query restarts as a full sync.
+    """
+    state = state_store.get(mailbox, resource.key) or DeltaState()
+    service = resource.service(services)
+    next_link = state.next_link
+    while True:
+        try:
+            if next_link:
+                resp, next_link = service.follow_next_link(
+                    next_link, max_entries=resource.max_entries)
+            else:
+                resp, next_link = resource.first_page(services, delta_token=state.delta_token)
+        except Office365ClientError as e:
+            if not e.is_expired_sync_token or not (state.next_link or state.delta_token):
+                raise
+            logger.info('Delta state of {} {} expired, resyncing'.format(mailbox, resource.key))
+            state_store.delete(mailbox, resource.key)
+            if on_resync is not None:
+                on_resync(mailbox, resource)
+            state = DeltaState()
+            next_link = None
+            continue
+
+        yield resp
+        if next_link:
+            state = DeltaState(next_link=next_link, delta_token=state.delta_token)
+        else:
+            state = DeltaState(delta_token=delta_token_from_link(resp.get('@odata.deltaLink')))
+        state_store.save(mailbox, resource.key, state)
+        if not next_link:
+            return
+
+
+class SyncTask(object):
+    """The next page to fetch for a resource of a mailbox."""
+
+    def __init__(self, user_id, resource, delta_token=None, next_link=None):
+        self.user_id = user_id
+        self.resource = resource
+        self.delta_token = delta_token
+        self.next_link = next_link
+        self.pages_count = 0
+
+
+class MailboxSyncScheduler(object):
+    """
+    Run the delta queries of many mailboxes on a bounded pool of threads.
+
+    Each task fetches a single page. The task fetching the next page goes
+    back to its mailbox queue, and the mailboxes are served in turn, so that
+    a large mailbox progresses at the same pace as the others instead of
+    starving them. At most per_mailbox_concurrency pages of a mailbox are
+    fetched at the same time.
+
+    sink(user_id, resource, items, delta_token) is called for every page,
+    from the thread running run(); delta_token is None until the last page
+    of the resource.
+
+    With a deltastate.DeltaStateStore, the queries start from the stored
+    state and the state is checkpointed after each page has been sunk. A
+    query whose token has expired restarts as a full sync, after a call to
+    on_resync(user_id, resource).
+
+    With as_models, the items are passed to the sink as instances of the
+    delta_model_class of the services (see models) instead of dicts.
+    """
+
+    def __init__(self, client, sink, max_workers=DEFAULT_MAX_WORKERS,
+                 per_mailbox_concurrency=DEFAULT_PER_MAILBOX_CONCURRENCY, state_store=None,
+                 on_resync=None, as_models=False):
+        self.client = client
+        self.sink = sink
+        self.max_workers = max_workers
+        self.per_mailbox_concurrency = per_mailbox_concurrency
+        self.state_store = state_store
+        self.on_resync = on_resync
+        self.as_models = as_models
+        # user_id -> deque of the tasks ready to run, for the mailboxes having
+        # some, in turn order
+        self._queues = OrderedDict()
+        self._in_flight = {}
+        self._services = {}
+        self.results = {}
+
+    def add(self, user_id, resource, delta_token=None):
+        """Schedule the delta query of resource for the mailbox of user_id."""
+        task = SyncTask(user_id, resource, delta_token=delta_token)
+        if delta_token is None and self.state_store is not None:
+            state = self.state_store.get(user_id, resource.key)
+            if state is not None:
+                task.delta_token = state.delta_token
+                task.next_link = state.next_link
+        self._queues.setdefault(user_id, deque()).append(task)
+        self._in_flight.setdefault(user_id, 0)
+
+    def _services_of(self, user_id):
+        if user_id not in self._services:
+            self._services[user_id] = self.client.users(user_id)
+        return self._services[user_id]
+
+    def _next_task(self):
+        """Pop the task of the next mailbox in turn which is below its concurrency cap."""
+        for _ in range(len(self._queues)):
+            user_id, queue = next(iter(self._queues.items()))
+            self._queues.move_to_end(user_id)
+            if self._in_flight[user_id] < self.per_mailbox_concurrency:
+                self._in_flight[user_id] += 1
+                task = queue.popleft()
+                if not queue:
+                    del self._queues[user_id]
+                return task
+        return None
+
+    def _run_task(self, task):
+        services = self._services_of(task.user_id)
+        if task.next_link:
+            return task.resource.service(services).follow_next_link(
+                task.next_link, max_entries=task.resource.max_entries)
+        return task.resource.first_page(services, delta_token=task.delta_token)
+
+    def _task_done(self, task, resp, next_link):
+        task.pages_count += 1
+        delta_token = None if next_link else delta_token_from_link(resp.get('@odata.deltaLink'))
+        items = resp.get('value', [])
+        if self.as_models:
+            service = task.resource.service(self._services_of(task.user_id))
+            items = [service.to_model(item, service.delta_model_class) for item in items]
+        self.sink(task.user_id, task.resource, items, delta_token)
+        if self.state_store is not None:
+            self.state_store.save(task.user_id, task.resource.key, DeltaState(
+                next_link=next_link, delta_token=delta_token if not next_link else task.delta_token))
+        if next_link:
+            task.next_link = next_link
+            self._queues.setdefault(task.user_id, deque()).append(task)
+        else:
+            self.results[(task.user_id, task.resource.key)] = delta_token
+
+    def _task_failed(self, task, error):
+        if (isinstance(error, Office365ClientError) and error.is_expired_sync_token
+                and (task.next_link or task.delta_token)):
+            logger.info('Delta state of {} {} expired, resyncing'.format(
+                task.user_id, task.resource.key))
+            if self.state_store is not None:
+                self.state_store.delete(task.user_id, task.resource.key)
+            if self.on_resync is not None:
+                self.on_resync(task.user_id, task.resource)
+            task.next_link = task.delta_token = None
+            self._queues.setdefault(task.user_id, deque()).append(task)
+            return
+        logger.warning('Delta sync of {} {} failed: {!r}'.format(
+            task.user_id, task.resource.key, error))
+        self.results[(task.user_id, task.resource.key)] = error
+
+    def run(self):
+        """
+        Run the scheduled queries to completion.
+
+        Return a dict mapping (user_id, resource.key) to the new delta token,
+        or to the exception which interrupted the query.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            while True:
+                while len(futures) < self.max_workers:
+                    task = self._next_task()
+                    if task is None:
+                        break
+                    futures[executor.submit(self._run_task, task)] = task
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = futures.pop(future)
+                    self._in_flight[task.user_id] -= 1
+                    try:
+                        resp, next_link = future.result()
+                    except Exception as e:
+                        self._task_failed(task, e)
+                    else:
+                        self._task_done(task, resp, next_link)
+        return self.results
+
+
+class BackfillShard(object):
+    """The messages received in [start, end), and the next page to fetch."""
+
+    def __init__(self, start, end, next_link=None):
+        self.start = start
+        self.end = end
+        self.next_link = next_link
+        self.items_count = 0
+
+    def filter(self):
+        return 'receivedDateTime ge {} and receivedDateTime lt {}'.format(
+            format_datetime(self.start), format_datetime(self.end))
+
+    def split(self, parts):
+        """Return the shards of parts windows of whole seconds covering the shard."""
+        seconds = math.ceil((self.end - self.start).total_seconds() / parts)
+        return [BackfillShard(start, end)
+                for start, end in split_windows(self.start, self.end, timedelta(seconds=seconds))]
+
+    def __repr__(self):
+        return '<BackfillShard {} {}>'.format(
+            format_datetime(self.start), format_datetime(self.end))
+
+
+class MessageBackfill(object):
+    """
+    Initial load of the messages of a mailbox, sharded by receivedDateTime.
+
+    The range (by default from the oldest message to now) is split in
+    shards of about shard_size messages, according to the totalItemCount of
+    the folder then to the $count of every shard, and the pages of the
+    shards are fetched concurrently, up to `concurrency` requests at a
+    time, within the limit of Graph per mailbox. The messages received
+    after the range are left to a delta query.
+
+    sink(user_id, items, shard) is called for every page, from the thread
+    running run(). With a deltastate.DeltaStateStore, the range, the split
+    shards and the progress of every shard are checkpointed, so that a
+    restarted backfill resumes where it stopped.
+    """
+
+    def __init__(self, client, user_id, sink, start_datetime=None, end_datetime=None,
+                 folder_id=None, _filter=None, concurrency=MAILBOX_CONCURRENCY_LIMIT,
+                 shard_size=DEFAULT_BACKFILL_SHARD_SIZE, max_entries=DEFAULT_MAX_ENTRIES,
+                 fields=[], profile=None, state_store=None, as_models=False):
+        self.client = client
+        self.user_id = user_id
+        self.sink = sink
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+        self.folder_id = folder_id
+        self._filter = _filter
+        self.concurrency = max(1, min(concurrency, MAILBOX_CONCURRENCY_LIMIT))
+        self.shard_size = shard_size
+        self.max_entries = max_entries
+        self.fields = fields
+        self.profile = profile
+        self.state_store = state_store
+        self.as_models = as_models
+        self.services = client.users(user_id)
+        self.results = OrderedDict()
+
+    @property
+    def key(self):
+        return 'messages-backfill:' + (self.folder_id or '')
+
+    def shard_key(self, shard):
+        return '{}:{}:{}'.format(self.key, format_datetime(shard.start), format_datetime(shard.end))
+
+    def _load(self, key):
+        return self.state_store.get(self.user_id, key) if self.state_store is not None else None
+
+    def _save(self, key, next_link=None, checkpoint=None):
+        if self.state_store is not None:
+            self.state_store.save(
+                self.user_id, key, DeltaState(next_link=next_link, checkpoint=checkpoint))
+
+    def _range(self):
+        """Return the (start, end) of the backfill, stored on its first run."""
+        state = self._load(self.key)
+        if state is not None and (state.checkpoint or '').startswith(BACKFILL_RANGE):
+            start, end = state.checkpoint[len(BACKFILL_RANGE):].split('/')
+            return parse_datetime(start), parse_datetime(end)
+
+        if self.start_datetime is not None:
+            start = parse_datetime(self.start_datetime)
+        else:
+            # Graph sorts a filtered query only on a property leading its filter
+            _filter = 'receivedDateTime ge {}'.format(format_datetime(OLDEST_RECEIVED))
+            if self._filter:
+                _filter = '{} and ({})'.format(_filter, self._filter)
+            resp, _ = self.services.message.list(
+                _filter=_filter, max_entries=1, fields=['receivedDateTime'],
+                _orderby='receivedDateTime asc', folder_id=self.folder_id)
+            if not resp.get('value'):
+                return None
+            start = parse_datetime(resp['value'][0]['receivedDateTime'])
+        if self.end_datetime is not None:
+            end = parse_datetime(self.end_datetime)
+        else:
+            end = datetime.now(timezone.utc) + timedelta(seconds=1)
+        # the filters have a resolution of a second
+        start = start.replace(microsecond=0)
+        if end.microsecond:
+            end = end.replace(microsecond=0) + timedelta(seconds=1)
+        self._save(self.key, checkpoint='{}{}/{}'.format(
+            BACKFILL_RANGE, format_datetime(start), format_datetime(end)))
+        return start, end
+
+    def _filter_of(self, shard):
+        if self._filter:
+            return '({}) and {}'.format(self._filter, shard.filter())
+        return shard.filter()
+
+    def _plan(self, shard, tasks):
+        """Queue the tasks of shard, or of its parts, according to its checkpoint."""
+        state = self._load(self.shard_key(shard))
+        checkpoint = (state.checkpoint or '') if state is not None else ''
+        if checkpoint == BACKFILL_DONE:
+            self.results[self.shard_key(shard)] = 0
+        elif checkpoint.startswith(BACKFILL_SPLIT):
+            for part in shard.split(int(checkpoint[len(BACKFILL_SPLIT):])):
+                self._plan(part, tasks)
+        elif state is not None and state.next_link:
+            shard.next_link = state.next_link
+            tasks.append(('page', shard))
+        else:
+            tasks.append(('count', shard))
+
+    def _count(self, shard, root=False):
+        if root and self.folder_id and not self._filter:
+            # the folder total bounds the messages of the range
+            folder = self.services.mailfolder.get(self.folder_id, fields=['totalItemCount'])
+            return folder.get('totalItemCount') or 0
+        return self.services.message.count(
+            _filter=self._filter_of(shard), folder_id=self.folder_id)
+
+    def _fetch(self, shard):
+        message = self.services.message
+        if shard.next_link:
+            # the next link keeps the $filter and $select of the first page
+            return message.follow_next_link(shard.next_link, max_entries=self.max_entries)
+        return message.list(
+            _filter=self._filter_of(shard), max_entries=self.max_entries, fields=self.fields,
+            profile=self.profile, folder_id=self.folder_id)
+
+    def _run_task(self, task):
+        kind, shard, root = task
+        if kind == 'count':
+            return self._count(shard, root)
+        return self._fetch(shard)
+
+    def _counted(self, shard, count, tasks):
+        key = self.shard_key(shard)
+        seconds = (shard.end - shard.start).total_seconds()
+        if count == 0:
+            self._save(key, checkpoint=BACKFILL_DONE)
+            self.results[key] = 0
+        elif count > self.shard_size and seconds >= 2:
+            parts = min(math.ceil(count / self.shard_size), MAX_BACKFILL_SPLIT, int(seconds))
+            logger.info('Splitting backfill shard {} of {}x messages in {}'.format(
+                key, count, parts))
+            self._save(key, checkpoint='{}{}'.format(BACKFILL_SPLIT, parts))
+            tasks.extend(('count', part) for part in shard.split(parts))
+        else:
+            tasks.append(('page', shard))
+
+    def _fetched(self, shard, resp, next_link, tasks):
+        items = resp.get('value', [])
+        if self.as_models:
+            items = [self.services.message.to_model(item) for item in items]
+        self.sink(self.user_id, items, shard)
+        shard.items_count += len(items)
+        key = self.shard_key(shard)
+        if next_link:
+            self._save(key, next_link=next_link)
+            shard.next_link = next_link
+            tasks.append(('page', shard))
+        else:
+            self._save(key, checkpoint=BACKFILL_DONE)
+            self.results[key] = shard.items_count
+
+    def run(self):
+        """
+        Run the backfill to completion.
+
+        Return a dict mapping the key of every shard to the number of
+        messages sunk, or to the exception which interrupted it.
+        """
+        time_range = self._range()
+        if time_range is None:
+            return self.results
+        root = BackfillShard(*time_range)
+        tasks = deque()
+        self._plan(root, tasks)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {}
+            while True:
+                while tasks and len(futures) < self.concurrency:
+                    kind, shard = tasks.popleft()
+                    task = (kind, shard, shard is root)
+                    futures[executor.submit(self._run_task, task)] = task
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, shard, _ = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning('Backfill of {} {} failed: {!r}'.format(
+                            self.user_id, self.shard_key(shard), e))
+                        self.results[self.shard_key(shard)] = e
+                        continue
+                    if kind == 'count':
+                        self._counted(shard, result, tasks)
+                    else:
+                        self._fetched(shard, *result, tasks)
+        return self.results
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+
+# Graph allows 10000 requests per 10 minutes per app and mailbox
+DEFAULT_MAILBOX_RATE = 16
+DEFAULT_TENANT_RATE = 200
+DEFAULT_MAX_MAILBOXES = 10000
+
+
+def mailbox_key(path):
+    """
+    Return the mailbox part ('me' or 'users/<id>') of a service prefix or a batch url.
+
+    Return None for the requests which are not bound to a mailbox, such as
+    subscriptions.
+    """
+    parts = path.lstrip('/').split('/')
+    if parts[0].lower() == 'me':
+        return 'me'
+    if parts[0].lower() == 'users' and len(parts) > 1:
+        return 'users/' + parts[1].split('?')[0]
+    return None
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled at `rate` tokens per second, up to `capacity` tokens.
+
+    Reservations may overdraw the bucket: the caller is told how long to wait
+    for its tokens instead, so that the waiting requests are served in order.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, tokens=1):
+        """Take tokens and return the seconds to wait before using them."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= tokens
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        """Hand out no token for the next `seconds`."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter(object):
+    """
+    Client side rate limiter shared by the threads using a client.
+
+    Every request takes a token from the tenant bucket and from the bucket of
+    its mailbox. The rates adapt to the throttling reported by Graph: a 429
+    multiplies the rates by decrease_factor (down to min_rate) and pauses the
+    buckets for the Retry-After delay, and each successful request adds
+    increase_step back, up to the configured rates.
+    """
+
+    def __init__(self, tenant_rate=DEFAULT_TENANT_RATE, mailbox_rate=DEFAULT_MAILBOX_RATE,
+                 min_rate=1, decrease_factor=0.5, increase_step=0.1,
+                 max_mailboxes=DEFAULT_MAX_MAILBOXES):
+        self.tenant_rate = tenant_rate
+        self.mailbox_rate = mailbox_rate
+        self.min_rate = min_rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.max_mailboxes = max_mailboxes
+        self.tenant_bucket = TokenBucket(tenant_rate)
+        self.mailbox_buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _mailbox_bucket(self, key):
+        bucket = self.mailbox_buckets.get(key)
+        if bucket is None:
+            bucket = self.mailbox_buckets[key] = TokenBucket(self.mailbox_rate)
+            if len(self.mailbox_buckets) > self.max_mailboxes:
+                self.mailbox_buckets.popitem(last=False)
+        else:
+            self.mailbox_buckets.move_to_end(key)
+        return bucket
+
+    def _buckets(self, prefix):
+        buckets = [self.tenant_bucket]
+        key = mailbox_key(prefix)
+        if key is not None:
+            buckets.append(self._mailbox_bucket(key))
+        return buckets
+
+    def reserve(self, prefix, tokens=1):
+        """Take tokens for requests on prefix, return the seconds to wait before sending them."""
+        with self.lock:
+            return max(bucket.reserve(tokens) for bucket in self._buckets(prefix))
+
+    def acquire(self, prefix, tokens=1):
+        """Block until tokens are available for requests on prefix, return the seconds waited."""
+        wait = self.reserve(prefix, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return max(wait, 0)
+
+    def on_throttled(self, prefix, retry_after=None):
+        with self.lock:
+            for bucket in self._buckets(prefix):
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+                if retry_after:
+                    bucket.pause(retry_after)
+
+    def on_success(self, prefix):
+        with self.lock:
+            buckets = self._buckets(prefix)
+            buckets[0].rate = min(self.tenant_rate, buckets[0].rate + self.increase_step)
+            for bucket in buckets[1:]:
+                bucket.rate = min(self.mailbox_rate, bucket.rate + self.increase_step)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Sessions tuned for MicrosoftGraphClient.
+
+requests keeps 10 connections per host by default: with more threads using
+a client, the extra connections are opened (TLS handshake included) and
+dropped for every request. build_session sizes the pool to the number of
+threads, keeps the connections alive and sets default timeouts; with
+http2=True the requests are multiplexed on a few HTTP/2 connections
+instead (the httpx package with its http2 extra is required).
+
+    session = build_session(max_concurrency=64, headers={'Authorization': 'Bearer ' + token})
+    client = MicrosoftGraphClient(session)
+
+The authentication is left to the caller: pass an auth, default headers
+(Authorization), or an already authorized requests session (e.g. an
+OAuth2Session) to be tuned.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+GRAPH_URL = 'https://graph.microsoft.com'
+DEFAULT_MAX_CONCURRENCY = 32
+# seconds to establish a connection, and between two bytes of a response
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+
+
+def raise_for_status(response, *args, **kwargs):
+    """Response hook raising an HTTPError for the 4xx/5xx responses, as the services expect."""
+    response.raise_for_status()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter applying a default timeout to the requests sent without one."""
+
+    def __init__(self, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT), **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def build_session(max_concurrency=DEFAULT_MAX_CONCURRENCY, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                  read_timeout=DEFAULT_READ_TIMEOUT, auth=None, headers=None, session=None,
+                  pool_block=False, http2=False, url=GRAPH_URL):
+    """
+    Return a session for MicrosoftGraphClient.
+
+    max_concurrency: number of threads sharing the session, the connections
+    kept alive to graph.microsoft.com
+    pool_block: wait for a connection of the pool rather than opening a
+    connection which is not kept alive when every one is busy
+    session: a requests session to tune instead of a new one, keeping its
+    authentication
+    http2: return an Http2Session instead (session is not supported then)
+    url: the prefix of the urls the pool and the timeouts apply to
+    """
+    if http2:
+        if session is not None:
+            raise ValueError('A requests session cannot be used over HTTP/2')
+        return Http2Session(max_concurrency=max_concurrency, connect_timeout=connect_timeout,
+                            read_timeout=read_timeout, auth=auth, headers=headers)
+
+    session = session or requests.Session()
+    adapter = TimeoutHTTPAdapter(
+        timeout=(connect_timeout, read_timeout), pool_connections=1,
+        pool_maxsize=max_concurrency, pool_block=pool_block)
+    session.mount(url, adapter)
+    if auth is not None:
+        session.auth = auth
+    if headers:
+        session.headers.update(headers)
+    if raise_for_status not in session.hooks['response']:
+        session.hooks['response'].append(raise_for_status)
+    return session
+
+
+class Http2Response(object):
+    """The parts of a requests.Response used by the services, over an httpx.Response."""
+
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.reason = response.reason_phrase
+
+    @property
+    def content(self):
+        return self.response.read()
+
+    @property
+    def text(self):
+        self.response.read()
+        return self.response.text
+
+    def json(self, **kwargs):
+        return self.response.json(**kwargs)
+
+    def iter_content(self, chunk_size=None, decode_unicode=False):
+        return self.response.iter_bytes(chunk_size)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('{} Error for url: {}'.format(self.status_code, self.url),
+                                     response=self)
+
+    def close(self):
+        self.response.close()
+
+
+class Http2Session(object):
+    """
+    requests-like session multiplexing the requests on HTTP/2 connections.
+
+    It runs on an httpx.Client, raising requests exceptions so that the
+    services handle the errors and retries as with a requests session: an
+    HTTPError for the 4xx/5xx responses and a ConnectionError for the
+    connection failures.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 auth=None, headers=None, client=None):
+        import httpx
+        self.httpx = httpx
+        self.client = client or httpx.Client(
+            http2=True, auth=auth, headers=headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            # every connection carries up to ~100 concurrent streams
+            limits=httpx.Limits(max_connections=max_concurrency,
+                                max_keepalive_connections=max_concurrency))
+
+    @property
+    def headers(self):
+        return self.client.headers
+
+    def request(self, method, url, params=None, data=None, headers=None, json=None,
+                stream=False, timeout=None, **kwargs):
+        httpx = self.httpx
+        request = self.client.build_request(
+            method, url, params=params, content=data, json=json, headers=headers,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+        try:
+            resp = Http2Response(self.client.send(request, stream=stream))
+            if stream and resp.status_code >= 400:
+                # the error body is read for error_from_response
+                resp.response.read()
+        except httpx.ConnectTimeout as e:
+            raise requests.ConnectTimeout(str(e))
+        except httpx.TimeoutException as e:
+            raise requests.ReadTimeout(str(e))
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e))
+        resp.raise_for_status()
+        return resp
+
+    def close(self):
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
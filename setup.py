@@ -5,5 +5,11 @@ setup(name='office365-rest-client',
       version='3.4.3',
       description='Python api wrapper for Office365 API v3.4.2',
       author='SugarCRM',
-      packages=find_packages(),
+      packages=find_packages(exclude=['benchmarks', 'benchmarks.*', 'tests', 'tests.*']),
+      install_requires=['requests>=2.27'],
+      extras_require={
+          'orjson': ['orjson'],
+          'async': ['httpx'],
+          'http2': ['httpx[http2]'],
+      },
       zip_safe=False)
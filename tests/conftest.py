@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from benchmarks.fake_graph import FakeGraph, FakeGraphServer, local_session
+from office365_api.v2.client import MicrosoftGraphClient
+
+
+@pytest.fixture
+def fake_graph():
+    """Return a function starting a FakeGraphServer, returning a client of it and its FakeGraph."""
+    servers = []
+
+    def start(**kwargs):
+        server = FakeGraphServer(FakeGraph(**kwargs)).start()
+        servers.append(server)
+        return MicrosoftGraphClient(local_session(server)), server.graph
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Sessions and transports answering the requests of the clients without a network."""
+import asyncio
+import json
+
+import requests
+from requests import Response
+
+from office365_api.v2.aio import AsyncTransport
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.services import error_from_response
+
+
+def json_response(status_code, data=None, headers=None, url='https://graph.microsoft.com'):
+    """Return a requests.Response of the json data."""
+    resp = Response()
+    resp.status_code = status_code
+    resp.url = url
+    resp._content = json.dumps(data).encode('utf-8') if data is not None else b''
+    # the content is read already, for iter_content and close
+    resp._content_consumed = True
+    resp.headers.update(headers or {})
+    return resp
+
+
+def error_data(code, message=''):
+    return {'error': {'code': code, 'message': message}}
+
+
+class MockSession(object):
+    """
+    requests session answering with handler(method, url, kwargs).
+
+    The 4xx/5xx responses raise an HTTPError, as with the sessions of
+    transport.build_session. The requests are kept in `requests`.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method.upper(), url, kwargs))
+        resp = self.handler(method.upper(), url, kwargs)
+        resp.raise_for_status()
+        return resp
+
+    def close(self):
+        pass
+
+
+class SessionTransport(AsyncTransport):
+    """AsyncTransport sending the requests with a requests session, on the default executor."""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def request(self, method, url, headers=None, data=None, json=None):
+        def send():
+            try:
+                return self.session.request(method, url, headers=headers, data=data, json=json)
+            except requests.HTTPError as e:
+                return e.response
+        return await asyncio.get_running_loop().run_in_executor(None, send)
+
+    async def stream(self, method, url, headers=None, chunk_size=None):
+        resp = await self.request(method, url, headers=headers)
+        if resp.status_code >= 400:
+            raise error_from_response(resp)
+        for chunk in resp.iter_content(chunk_size):
+            yield chunk
+
+
+def new_batch(handler=None, **kwargs):
+    session = MockSession(handler or (lambda method, url, kwargs: json_response(200, {})))
+    return MicrosoftGraphClient(session).new_batch_request(**kwargs), session
+
+
+def batch_handler(status_of=lambda request: 200, failed_batch=lambda ids: None):
+    """Answer a $batch with status_of(request) per request, or failed_batch(ids) as a whole."""
+    def handler(method, url, kwargs):
+        requests = kwargs['json']['requests']
+        status = failed_batch([request['id'] for request in requests])
+        if status is not None:
+            return json_response(status, error_data('ServiceUnavailable'), {'Retry-After': '0'})
+        return json_response(200, {'responses': [
+            {'id': request['id'], 'status': status_of(request), 'headers': {'Retry-After': '0'},
+             'body': {'id': 'new-' + request['id']}}
+            for request in requests]})
+    return handler
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from office365_api.v2.aio import AsyncMicrosoftGraphClient, AsyncTransport
+from office365_api.v2.exceptions import Office365ClientError
+from office365_api.v2.retry import RetryPolicy
+
+from .helpers import MockSession, SessionTransport, error_data, json_response
+
+
+class ThrottledStreamTransport(AsyncTransport):
+    """Stream two chunks, after throttling the first `throttled` requests."""
+
+    def __init__(self, throttled):
+        self.throttled = throttled
+        self.requests_count = 0
+
+    async def request(self, method, url, headers=None, data=None, json=None):
+        raise AssertionError('Only streamed requests are expected')
+
+    async def stream(self, method, url, headers=None, chunk_size=None):
+        self.requests_count += 1
+        if self.requests_count <= self.throttled:
+            raise Office365ClientError(429, None, retry_after=0)
+        for chunk in (b'ab', b'cd'):
+            yield chunk
+
+
+def test_iter_all_matches_the_sync_client(fake_graph):
+    client, _ = fake_graph(messages_count=250)
+    serial = [m['id'] for m in client.users('u1').message.iter_all(max_entries=100)]
+
+    async def iter_all():
+        async_client = AsyncMicrosoftGraphClient(SessionTransport(client.session))
+        messages = async_client.users('u1').message.iter_all(max_entries=100, as_model=True)
+        return [m.id async for m in messages]
+
+    assert asyncio.run(iter_all()) == serial
+
+
+def test_errors_are_raised():
+    session = MockSession(lambda method, url, kwargs: json_response(
+        404, error_data('ErrorItemNotFound')))
+
+    async def get():
+        async_client = AsyncMicrosoftGraphClient(SessionTransport(session))
+        return await async_client.users('u1').message.get('missing')
+
+    with pytest.raises(Office365ClientError) as info:
+        asyncio.run(get())
+    assert info.value.status_code == 404
+
+
+def test_requests_in_flight_are_capped(fake_graph):
+    client, _ = fake_graph(messages_count=10)
+    in_flight = []
+
+    class CountingTransport(SessionTransport):
+        running = 0
+
+        async def request(self, *args, **kwargs):
+            self.running += 1
+            in_flight.append(self.running)
+            try:
+                return await super().request(*args, **kwargs)
+            finally:
+                self.running -= 1
+
+    async def get_all():
+        async_client = AsyncMicrosoftGraphClient(
+            CountingTransport(client.session), max_concurrency=2)
+        messages = async_client.users('u1').message
+        return await asyncio.gather(*(
+            messages.get('u1-{:08d}'.format(i)) for i in range(10)))
+
+    assert len(asyncio.run(get_all())) == 10
+    assert max(in_flight) == 2
+
+
+def test_transport_interface_is_abstract():
+    with pytest.raises(TypeError):
+        AsyncTransport()
+
+
+def test_stream_request_is_retried_until_the_first_chunk():
+    transport = ThrottledStreamTransport(throttled=2)
+
+    async def stream():
+        client = AsyncMicrosoftGraphClient(transport)
+        return [chunk async for chunk in client.users('u1').message.stream_raw('m')]
+
+    assert asyncio.run(stream()) == [b'ab', b'cd']
+    assert transport.requests_count == 3
+
+
+def test_stream_request_gives_up_with_the_retry_policy():
+    async def stream():
+        client = AsyncMicrosoftGraphClient(
+            ThrottledStreamTransport(throttled=2), retry_policy=RetryPolicy(max_retries=1))
+        return [chunk async for chunk in client.users('u1').message.stream_raw('m')]
+
+    with pytest.raises(Office365ClientError):
+        asyncio.run(stream())
+
+
+def test_empty_batch():
+    async def execute():
+        transport = SessionTransport(MockSession(None))
+        await AsyncMicrosoftGraphClient(transport).new_batch_request().execute()
+
+    asyncio.run(execute())
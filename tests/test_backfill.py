@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from collections import Counter
+
+import pytest
+
+from office365_api.v2.aio import AsyncMicrosoftGraphClient
+from office365_api.v2.deltastate import DeltaState, MemoryDeltaStateStore
+from office365_api.v2.exceptions import Office365ClientError
+from office365_api.v2.sync import BACKFILL_DONE, MessageBackfill
+
+from .helpers import SessionTransport
+
+BACKFILL_END = '2020-01-03T00:00:00Z'
+
+
+def test_backfill_sinks_every_message_once(fake_graph):
+    client, _ = fake_graph(messages_count=3000, throttle_rate=0.05, retry_after=0.01, seed=4)
+    seen = Counter()
+
+    results = MessageBackfill(
+        client, 'u1', lambda user_id, items, shard: seen.update(item['id'] for item in items),
+        shard_size=400, max_entries=100, end_datetime=BACKFILL_END).run()
+
+    # 2 days of a message every minute
+    assert len(seen) == 2880 and max(seen.values()) == 1
+    assert sum(results.values()) == 2880
+    assert len(results) > 1
+
+
+def test_backfill_resumes_from_its_checkpoints(fake_graph):
+    client, _ = fake_graph(messages_count=3000, throttle_rate=0.05, retry_after=0.01, seed=4)
+    store = MemoryDeltaStateStore()
+    seen = Counter()
+    pages = []
+
+    def sink(user_id, items, shard):
+        pages.append(shard)
+        if len(pages) == 12:
+            raise RuntimeError('Worker stopped')
+        seen.update(item.id for item in items)
+
+    def backfill():
+        return MessageBackfill(client, 'u1', sink, end_datetime=BACKFILL_END, shard_size=400,
+                               max_entries=100, state_store=store, as_models=True)
+
+    with pytest.raises(RuntimeError):
+        backfill().run()
+    interrupted = len(seen)
+    assert 0 < interrupted < 2880
+
+    backfill().run()
+
+    assert len(seen) == 2880 and max(seen.values()) == 1
+    states = [DeltaState.from_dict(data) for data in store.states.values()]
+    assert sum(state.checkpoint == BACKFILL_DONE for state in states) > 1
+    # the checkpoints are never taken for delta tokens
+    assert all(state.delta_token is None for state in states)
+
+
+def test_backfill_with_a_filter_finds_the_oldest_message(fake_graph):
+    client, _ = fake_graph(messages_count=500)
+    seen = []
+
+    results = MessageBackfill(
+        client, 'u1', lambda user_id, items, shard: seen.extend(items), _filter='isRead eq false',
+        end_datetime=BACKFILL_END, max_entries=100).run()
+
+    # the fake server ignores the isRead clause, but not a sort it does not lead
+    assert len(seen) == 500
+    assert not any(isinstance(result, Exception) for result in results.values())
+
+
+def test_fake_graph_rejects_a_sort_not_leading_the_filter(fake_graph):
+    client, _ = fake_graph()
+
+    with pytest.raises(Office365ClientError) as info:
+        client.users('u1').message.list(
+            _filter='isRead eq false', _orderby='receivedDateTime asc')
+    assert info.value.status_code == 400
+
+
+def test_async_count(fake_graph):
+    client, _ = fake_graph(messages_count=120)
+
+    async def count():
+        async_client = AsyncMicrosoftGraphClient(SessionTransport(client.session))
+        return await async_client.users('u1').message.count()
+
+    assert asyncio.run(count()) == 120
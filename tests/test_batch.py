@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from office365_api.v2.exceptions import Office365ServerError
+from office365_api.v2.services import MAX_BATCH_SIZE
+
+from .helpers import batch_handler, new_batch
+
+
+def add_requests(batch, count, method='GET'):
+    for i in range(count):
+        batch.add({'method': method, 'url': '/users/u/messages/{}'.format(i)})
+
+
+def test_split_keeps_depends_on_chains_in_a_chunk():
+    batch, _ = new_batch()
+    add_requests(batch, 15)
+    previous = None
+    for i in range(10):
+        request = {'method': 'GET', 'url': '/me/events/{}'.format(i)}
+        if previous is not None:
+            request['dependsOn'] = [previous]
+        previous = batch.add(request)
+
+    chunks = batch._split(batch._prepare_requests())
+
+    assert all(len(chunk) <= MAX_BATCH_SIZE for chunk in chunks)
+    chain = [str(i) for i in range(16, 26)]
+    [chain_chunk] = [chunk for chunk in chunks if '16' in [r['id'] for r in chunk]]
+    assert [r['id'] for r in chain_chunk if r['id'] in chain] == chain
+    assert sorted(r['id'] for chunk in chunks for r in chunk) == sorted(str(i) for i in range(1, 26))
+
+
+def test_split_merges_the_chains_joined_by_a_request():
+    batch, _ = new_batch()
+    first = batch.add({'method': 'GET', 'url': '/me/events/a'})
+    add_requests(batch, 19)
+    second = batch.add({'method': 'GET', 'url': '/me/events/b'})
+    batch.add({'method': 'GET', 'url': '/me/events/c', 'dependsOn': [first, second]})
+
+    chunks = batch._split(batch._prepare_requests())
+
+    ids = [[r['id'] for r in chunk] for chunk in chunks]
+    [joined] = [chunk for chunk in ids if first in chunk]
+    assert second in joined and '22' in joined
+    # the requests keep the order they were added in
+    assert joined == sorted(joined, key=int)
+
+
+def test_split_rejects_too_many_dependent_requests():
+    batch, _ = new_batch()
+    previous = batch.add({'method': 'GET', 'url': '/me/events/0'})
+    for i in range(MAX_BATCH_SIZE):
+        previous = batch.add({'method': 'GET', 'url': '/me/events/x', 'dependsOn': [previous]})
+
+    with pytest.raises(ValueError):
+        batch._split(batch._prepare_requests())
+
+
+def test_failed_chunk_goes_to_its_callbacks_only():
+    # the chunk of the first request fails as a whole
+    batch, session = new_batch(batch_handler(
+        failed_batch=lambda ids: 500 if '1' in ids else None), parallelism=2)
+    results = {}
+    for i in range(45):
+        batch.add({'method': 'GET', 'url': '/me/messages/{}'.format(i)},
+                  callback=lambda request_id, body, error: results.setdefault(request_id, error))
+
+    batch.execute()
+
+    assert len(results) == 45
+    failed = [request_id for request_id, error in results.items() if error is not None]
+    assert sorted(failed, key=int) == [str(i) for i in range(1, 21)]
+    assert all(isinstance(results[request_id], Office365ServerError) for request_id in failed)
+    assert len(session.requests) == 3
+
+
+def test_failed_chunk_raises_without_a_callback():
+    batch, _ = new_batch(batch_handler(failed_batch=lambda ids: 500 if '1' in ids else None))
+    results = []
+    batch.add({'method': 'GET', 'url': '/me/messages/1'})
+    batch.add({'method': 'GET', 'url': '/me/messages/2'},
+              callback=lambda request_id, body, error: results.append(error))
+
+    with pytest.raises(Office365ServerError):
+        batch.execute()
+    # the other callbacks are run first
+    assert len(results) == 1 and isinstance(results[0], Office365ServerError)
+
+
+@pytest.mark.parametrize('parallelism', [1, 4])
+def test_empty_batch(parallelism):
+    batch, session = new_batch(parallelism=parallelism)
+
+    batch.execute()
+
+    assert session.requests == []
+
+
+def test_batch_over_a_failing_fake_graph(fake_graph):
+    client, _ = fake_graph(batch_failure_rate=0.3, retry_after=0.01, seed=5)
+    batch = client.new_batch_request(beta=False, parallelism=4, max_attempts=10)
+    results = {}
+    for i in range(100):
+        batch.add({'method': 'GET', 'url': '/users/u1/messages/u1-{:08d}'.format(i)},
+                  callback=lambda request_id, body, error: results.setdefault(
+                      request_id, (body, error)))
+
+    batch.execute()
+
+    assert len(results) == 100
+    assert all(error is None for _, error in results.values())
+    assert results['1'][0]['id'] == 'u1-00000000'
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import time
+
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.exceptions import Office365ClientError
+from office365_api.v2.services import BULK_RETRY_METHODS, BatchService
+
+from .helpers import MockSession, batch_handler, json_response, new_batch
+
+
+def test_retry_requests():
+    batch = BatchService(MicrosoftGraphClient(MockSession(None)), retry_methods=BULK_RETRY_METHODS)
+    statuses = {
+        '1': ('GET', 429, {'Retry-After': '2'}, []),
+        '2': ('GET', 404, {}, []),
+        '3': ('GET', 424, {}, ['1', '2']),
+        '4': ('PATCH', 503, {}, []),
+        '5': ('POST', 429, {}, []),
+        '6': ('GET', 200, {}, []),
+        '7': ('DELETE', 504, {}, []),
+        '8': ('GET', 424, {}, ['2']),
+    }
+    requests = []
+    for request_id, (method, status, headers, depends_on) in statuses.items():
+        request = {'id': request_id, 'method': method, 'url': '/me/messages/' + request_id}
+        if depends_on:
+            request['dependsOn'] = depends_on
+        requests.append(request)
+        batch._responses[request_id] = {'id': request_id, 'status': status, 'headers': headers}
+
+    retried, delay = batch._retry_requests(requests)
+
+    # a 503/504 is retried for the idempotent methods only, a 429 for all
+    assert [r['id'] for r in retried] == ['1', '3', '5', '7']
+    assert retried[1]['dependsOn'] == ['1']
+    assert 'dependsOn' not in retried[0]
+    assert delay == 2
+
+
+def test_retry_requests_of_the_default_methods():
+    batch, _ = new_batch()
+    requests = [{'id': '1', 'method': 'POST', 'url': '/me/messages'},
+                {'id': '2', 'method': 'GET', 'url': '/me/messages/x'}]
+    for request in requests:
+        batch._responses[request['id']] = {'id': request['id'], 'status': 429}
+
+    retried, delay = batch._retry_requests(requests)
+
+    assert [r['id'] for r in retried] == ['2']
+    assert delay == 1
+
+
+def test_failed_chunk_is_retried_when_throttled():
+    attempts = []
+
+    def failed_batch(ids):
+        attempts.append(ids)
+        return 429 if len(attempts) == 1 else None
+
+    batch, _ = new_batch(batch_handler(failed_batch=failed_batch))
+    results = []
+    for i in range(3):
+        batch.add({'method': 'GET', 'url': '/me/messages/{}'.format(i)},
+                  callback=lambda request_id, body, error: results.append((body, error)))
+
+    batch.execute()
+
+    assert len(attempts) == 2
+    assert [error for _, error in results] == [None] * 3
+
+
+def test_retries_stop_at_max_total_delay():
+    def handler(method, url, kwargs):
+        return json_response(200, {'responses': [
+            {'id': r['id'], 'status': 429, 'headers': {'Retry-After': '3600'}}
+            for r in kwargs['json']['requests']]})
+
+    batch, session = new_batch(handler)
+    errors = []
+    batch.add({'method': 'GET', 'url': '/me/messages/1'},
+              callback=lambda request_id, body, error: errors.append(error))
+
+    start = time.monotonic()
+    batch.execute()
+
+    assert time.monotonic() - start < 1
+    assert len(session.requests) == 1
+    assert isinstance(errors[0], Office365ClientError) and errors[0].is_throttled
+
+
+def test_throttled_items_are_retried_alone():
+    throttled = set()
+
+    def status_of(request):
+        # every odd request is throttled once
+        if int(request['id']) % 2 and request['id'] not in throttled:
+            throttled.add(request['id'])
+            return 429
+        return 200
+
+    batch, session = new_batch(batch_handler(status_of=status_of))
+    results = {}
+    for i in range(6):
+        batch.add({'method': 'GET', 'url': '/me/messages/{}'.format(i)},
+                  callback=lambda request_id, body, error: results.setdefault(request_id, error))
+
+    batch.execute()
+
+    assert results == {str(i): None for i in range(1, 7)}
+    assert [len(kwargs['json']['requests']) for _, _, kwargs in session.requests] == [6, 3]
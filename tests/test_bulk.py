@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from office365_api.v2.aio import AsyncMicrosoftGraphClient
+from office365_api.v2.services import MAX_BATCH_SIZE
+
+from .helpers import SessionTransport, batch_handler, new_batch
+
+MESSAGE_IDS = ['u1-{:08d}'.format(i) for i in range(50)]
+
+
+def test_bulk_reports_every_item_once(fake_graph):
+    client, _ = fake_graph(batch_failure_rate=0.5, throttle_rate=0.1, retry_after=0.01, seed=3)
+    message_ids = ['u1-{:08d}'.format(i) for i in range(200)]
+
+    report = client.users('u1').message.bulk_update(message_ids, {'isRead': True}, parallelism=3)
+
+    assert sorted(list(report.succeeded) + list(report.failed)) == message_ids
+    assert report.failed
+    for error in report.failed.values():
+        # the PATCH requests are not retried on 503
+        assert error.status_code in (429, 503)
+    assert all(new_id == message_id for message_id, new_id in report.succeeded.items())
+
+
+def test_bulk_move_reports_the_new_ids(fake_graph):
+    client, _ = fake_graph()
+
+    report = client.users('u1').message.bulk_move(MESSAGE_IDS, 'archive')
+
+    assert report.ok and len(report) == 50
+    assert report.succeeded[MESSAGE_IDS[0]] == 'moved-' + MESSAGE_IDS[0]
+
+
+def test_bulk_delete(fake_graph):
+    client, _ = fake_graph()
+
+    report = client.users('u1').message.bulk_delete(MESSAGE_IDS, parallelism=2)
+
+    assert report.ok and list(report.succeeded) == MESSAGE_IDS
+    assert set(report.succeeded.values()) == {None}
+
+
+def test_bulk_requests_are_sent_in_slices():
+    batch, session = new_batch(batch_handler(
+        status_of=lambda request: 404 if request['url'].endswith('7') else 200))
+    messages = batch.client.users('u').message
+
+    report = messages.bulk_update([str(i) for i in range(100)], {'isRead': True}, parallelism=2)
+
+    assert len(report) == 100
+    assert list(report.failed) == [str(i) for i in range(7, 100, 10)]
+    assert all(error.is_not_found for error in report.failed.values())
+    # slices of 2 batches of MAX_BATCH_SIZE requests
+    sent = [kwargs['json']['requests'] for _, _, kwargs in session.requests]
+    assert [len(requests) for requests in sent] == [MAX_BATCH_SIZE] * 5
+    assert {request['method'] for requests in sent for request in requests} == {'PATCH'}
+
+
+def test_async_bulk_update(fake_graph):
+    client, _ = fake_graph(throttle_rate=0.1, retry_after=0.01, seed=1)
+    message_ids = ['u1-{:08d}'.format(i) for i in range(50)]
+
+    async def bulk_update():
+        async_client = AsyncMicrosoftGraphClient(SessionTransport(client.session))
+        return await async_client.users('u1').message.bulk_update(
+            message_ids, {'isRead': True}, parallelism=2)
+
+    report = asyncio.run(bulk_update())
+
+    assert sorted(list(report.succeeded) + list(report.failed)) == message_ids
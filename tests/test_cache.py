@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from office365_api.v2.aio import AsyncMicrosoftGraphClient
+from office365_api.v2.cache import ResponseCache
+from office365_api.v2.client import MicrosoftGraphClient
+
+from .helpers import MockSession, SessionTransport, json_response
+
+FOLDERS = {'value': [{'id': 'inbox'}]}
+
+
+def folders_handler(cache=None, evict=False):
+    """Answer with FOLDERS and an ETag, 304 to a matching If-None-Match."""
+    def handler(method, url, kwargs):
+        if method == 'POST':
+            return json_response(201, {'id': 'new'})
+        if (kwargs.get('headers') or {}).get('If-None-Match') == 'W/"1"':
+            if evict:
+                # the entry is evicted between the lookup and the response
+                cache.clear()
+            return json_response(304)
+        return json_response(200, FOLDERS, {'ETag': 'W/"1"'})
+    return handler
+
+
+def new_client(cache, handler):
+    session = MockSession(handler)
+    return MicrosoftGraphClient(session, response_cache=cache), session
+
+
+def if_none_match(session):
+    return [(kwargs.get('headers') or {}).get('If-None-Match') for _, _, kwargs in session.requests]
+
+
+def test_fresh_entry_is_served_without_request():
+    cache = ResponseCache(ttl=300)
+    client, session = new_client(cache, folders_handler())
+    folders = client.users('u').mailfolder
+
+    assert folders.list()[0] == FOLDERS
+    assert folders.list()[0] == FOLDERS
+    assert len(session.requests) == 1
+    assert cache.stats['MailFolderService'].hits == 1
+
+
+def test_stale_entry_is_revalidated():
+    cache = ResponseCache(ttl=0)
+    client, session = new_client(cache, folders_handler())
+    folders = client.users('u').mailfolder
+
+    folders.list()
+    resp, _ = folders.list()
+
+    assert resp == FOLDERS
+    assert if_none_match(session) == [None, 'W/"1"']
+    assert cache.stats['MailFolderService'].revalidations == 1
+
+
+def test_entry_evicted_before_the_not_modified_response():
+    cache = ResponseCache(ttl=0)
+    client, session = new_client(cache, folders_handler(cache, evict=True))
+    folders = client.users('u').mailfolder
+
+    folders.list()
+    resp, _ = folders.list()
+
+    assert resp == FOLDERS
+    # the revalidated entry is cached again
+    assert len(cache.entries) == 1
+
+
+def test_cached_data_is_not_shared_with_the_callers():
+    cache = ResponseCache(ttl=300)
+    client, _ = new_client(cache, folders_handler())
+    folders = client.users('u').mailfolder
+
+    folders.list()[0]['value'].append({'id': 'changed'})
+
+    assert folders.list()[0] == FOLDERS
+
+
+def test_other_requests_invalidate_the_service_entries():
+    cache = ResponseCache(ttl=300)
+    client, session = new_client(cache, folders_handler())
+    folders = client.users('u').mailfolder
+
+    folders.list()
+    client.users('v').mailfolder.list()
+    folders.create(displayName='New')
+    folders.list()
+
+    assert if_none_match(session) == [None, None, None, None]
+    assert len(session.requests) == 4
+    # the entries of the other mailbox are kept
+    client.users('v').mailfolder.list()
+    assert len(session.requests) == 4
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_entries=2)
+    client, session = new_client(cache, folders_handler())
+
+    for user_id in ('a', 'b', 'a', 'c', 'a', 'b'):
+        client.users(user_id).mailfolder.list()
+
+    assert [method for method, _, _ in session.requests] == ['GET'] * 4
+
+
+def test_stale_entry_without_etag_is_fetched_again():
+    def handler(method, url, kwargs):
+        return json_response(200, FOLDERS)
+
+    cache = ResponseCache(ttl=0)
+    client, session = new_client(cache, handler)
+    folders = client.users('u').mailfolder
+
+    folders.list()
+    folders.list()
+
+    assert if_none_match(session) == [None, None]
+    assert cache.stats['MailFolderService'].misses == 2
+
+
+def test_queries_are_cached_apart():
+    cache = ResponseCache(ttl=300)
+    client, session = new_client(cache, folders_handler())
+    folders = client.users('u').mailfolder
+
+    folders.list()
+    folders.list(max_entries=10)
+    folders.list(max_entries=10)
+
+    assert len(session.requests) == 2 and len(cache.entries) == 2
+
+
+def test_only_the_cacheable_requests_are_cached():
+    cache = ResponseCache(ttl=300)
+    client, session = new_client(cache, folders_handler())
+    messages = client.users('u').message
+
+    messages.list()
+    messages.list()
+
+    assert len(session.requests) == 2 and not cache.entries
+
+
+def test_async_client_uses_the_cache():
+    cache = ResponseCache(ttl=0)
+    session = MockSession(folders_handler())
+
+    async def list_twice():
+        client = AsyncMicrosoftGraphClient(SessionTransport(session), response_cache=cache)
+        folders = client.users('u').mailfolder
+        await folders.list()
+        return await folders.list()
+
+    resp, _ = asyncio.run(list_twice())
+
+    assert resp == FOLDERS
+    assert if_none_match(session) == [None, 'W/"1"']
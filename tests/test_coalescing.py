@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import threading
+from unittest import mock
+
+from office365_api.v2.cache import ResponseCache
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.coalescing import Coalescer
+from office365_api.v2.exceptions import Office365ClientError
+from office365_api.v2.services import MAX_BATCH_SIZE
+
+from .helpers import MockSession, batch_handler
+
+
+def test_concurrent_coalescing_blocks_share_the_coalescer():
+    client = MicrosoftGraphClient(MockSession(None))
+    entered = threading.Barrier(3)
+    seen = []
+
+    def block():
+        with client.coalescing() as coalescer:
+            entered.wait()
+            seen.append(coalescer)
+            entered.wait()
+            # still in use while another thread has left its block
+            assert client.coalescer is coalescer
+
+    threads = [threading.Thread(target=block) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(seen) == 3 and len(set(map(id, seen))) == 1
+    assert client.coalescer is None
+
+
+def test_coalesce_window_keeps_the_client_coalescer():
+    client = MicrosoftGraphClient(MockSession(None), coalesce_window=0.01)
+    coalescer = client.coalescer
+
+    with client.coalescing() as block_coalescer:
+        assert block_coalescer is coalescer
+
+    assert client.coalescer is coalescer
+
+
+def test_coalesced_requests(fake_graph):
+    client, _ = fake_graph()
+    messages = client.users('u1').message
+    message_ids = ['u1-{:08d}'.format(i) for i in range(30)]
+    results = {}
+
+    def get(message_id):
+        results[message_id] = messages.get(message_id)['id']
+
+    with mock.patch.object(client.session, 'request', wraps=client.session.request) as request, \
+            client.coalescing(window=0.05):
+        threads = [threading.Thread(target=get, args=(message_id, )) for message_id in message_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert results == {message_id: message_id for message_id in message_ids}
+    # sent as $batch requests of up to 20 requests
+    assert 2 <= request.call_count < 30
+
+
+def test_accepted_requests():
+    client = MicrosoftGraphClient(MockSession(None), response_cache=ResponseCache())
+    coalescer = Coalescer(client)
+    messages = client.users('u').message
+    folders = client.users('u').mailfolder
+
+    assert coalescer.accepts(messages, 'get')
+    assert not coalescer.accepts(messages, 'PATCH', body='{}')
+    assert not coalescer.accepts(messages, 'GET', parse_json_result=False)
+    # served by the response cache instead
+    assert not coalescer.accepts(folders, 'GET', cacheable=True)
+
+
+def test_errors_go_to_their_callers():
+    session = MockSession(batch_handler(
+        status_of=lambda request: 404 if request['url'].endswith('/1') else 200))
+    client = MicrosoftGraphClient(session)
+    messages = client.users('u').message
+    results = {}
+
+    def get(message_id):
+        try:
+            results[message_id] = messages.get(message_id)['id']
+        except Office365ClientError as e:
+            results[message_id] = e.status_code
+
+    with client.coalescing(window=0.05):
+        threads = [threading.Thread(target=get, args=(str(i), )) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(session.requests) == 1
+    assert results.pop('1') == 404
+    # the bodies of the fake batch are named after the batch request ids
+    assert len(results) == 2 and all(body.startswith('new-') for body in results.values())
+
+
+def test_full_queue_is_sent_before_the_window():
+    session = MockSession(batch_handler())
+    client = MicrosoftGraphClient(session)
+    coalescer = Coalescer(client, window=60, parallelism=1)
+    messages = client.users('u').message
+
+    def get(message_id):
+        coalescer.submit(messages, 'GET', '/messages/' + message_id)
+
+    threads = [threading.Thread(target=get, args=(str(i), )) for i in range(MAX_BATCH_SIZE)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(session.requests) == 1
+    coalescer.flush()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import types
+
+from office365_api.v2 import patches
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.services import MessageService, OutlookServicesCollection
+
+from .helpers import MockSession, json_response
+
+
+def new_client():
+    session = MockSession(lambda method, url, kwargs: json_response(201, {'id': 'moved'}))
+    return MicrosoftGraphClient(session), session
+
+
+def test_services_are_built_on_first_access():
+    client, _ = new_client()
+    services = client.users('u1')
+
+    assert 'message' not in vars(services)
+    message = services.message
+    assert isinstance(message, MessageService) and message.prefix == 'users/u1'
+    assert services.message is message
+    assert isinstance(services.outlook, OutlookServicesCollection)
+    assert services.outlook.masterCategories.prefix == 'users/u1/outlook'
+    assert client.users('me').message.prefix == 'me'
+
+
+def test_service_objects_are_slotted():
+    client, _ = new_client()
+    message = client.users('u1').message
+
+    # client and prefix are kept in slots, the instance dict stays empty
+    assert vars(message) == {}
+    assert message.client is client
+
+
+def test_patching_one_caller_does_not_affect_another():
+    client, session = new_client()
+    message = client.users('u1').message
+    message.execute_request = types.MethodType(patches.become_request, message)
+
+    assert message.move('m1', 'inbox')['method'] == 'POST'
+    assert len(session.requests) == 0
+
+    assert client.users('u1').message.move('m2', 'inbox')['id'] == 'moved'
+    assert len(session.requests) == 1
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from office365_api.v2.aio import AsyncMicrosoftGraphClient
+from office365_api.v2.decoders import (JSONDecoder, OrjsonDecoder, StreamingPage, default_decoder,
+                                       orjson)
+
+from .helpers import MockSession, SessionTransport
+
+PAGE = {
+    '@odata.context': 'https://graph.microsoft.com/v1.0/$metadata#users(\'u\')/messages',
+    'value': [
+        {'id': '1', 'subject': 'Brackets ] } [ { and "quotes", commas',
+         'body': {'content': 'back\\slash \\" escaped quote'}},
+        {'id': '2', 'categories': [], 'toRecipients': [{'emailAddress': {'address': 'a@b.c'}}]},
+        {'id': '3', 'subject': 'Emoji \U0001f600 and accents é', 'isRead': False,
+         'importance': None, 'size': 12.5},
+        {'id': '4', 'nested': [[1, [2]], {'value': [3]}]},
+    ],
+    '@odata.nextLink': 'https://graph.microsoft.com/v1.0/users/u/messages?$skip=4',
+}
+
+
+def chunked(content, size):
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_streaming_page_at_every_chunk_boundary(indent):
+    content = json.dumps(PAGE, indent=indent).encode('utf-8')
+    for size in range(1, len(content) + 1):
+        page = StreamingPage(chunked(content, size), decoder=JSONDecoder())
+
+        assert list(page.items()) == PAGE['value'], size
+        assert page.get('@odata.nextLink') == PAGE['@odata.nextLink']
+        assert page.get('@odata.context') == PAGE['@odata.context']
+
+
+def test_streaming_page_split_around_an_escape():
+    content = json.dumps({'value': [{'id': 'a\\"b'}]}).encode('utf-8')
+    position = content.index(b'\\')
+    page = StreamingPage([content[:position + 1], content[position + 1:]])
+
+    assert list(page.items()) == [{'id': 'a\\"b'}]
+
+
+def test_streaming_page_without_items():
+    page = StreamingPage(chunked(b'{"value": [], "@odata.deltaLink": "x"}', 3))
+
+    assert list(page.items()) == []
+    assert page.get('@odata.deltaLink') == 'x'
+    assert page.get('@odata.nextLink') is None
+
+
+def test_streaming_page_metadata_before_items():
+    page = StreamingPage([b'{"value": []}'])
+
+    with pytest.raises(RuntimeError):
+        page.get('@odata.nextLink')
+
+
+@pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+def test_orjson_decoder_falls_back_on_lone_surrogates():
+    # a bodyPreview cut in the middle of an emoji
+    content = b'{"bodyPreview": "cut \\ud83d"}'
+
+    assert OrjsonDecoder().loads(content) == json.loads(content)
+
+
+def test_default_decoder():
+    expected = JSONDecoder if orjson is None else OrjsonDecoder
+    assert type(default_decoder()) is expected
+
+
+def test_streaming_pages_match_the_decoded_ones(fake_graph):
+    client, _ = fake_graph(messages_count=250)
+    messages = client.users('u1').message
+
+    streamed = list(messages.iter_all(streaming=True, max_entries=100))
+
+    assert streamed == list(messages.iter_all(max_entries=100))
+    assert [m['id'] for m in messages.streaming().iter_all()] == [m['id'] for m in streamed]
+
+
+def test_async_streaming_is_rejected():
+    client = AsyncMicrosoftGraphClient(SessionTransport(MockSession(None)))
+    messages = client.users('u1').message
+
+    with pytest.raises(TypeError):
+        messages.iter_all(streaming=True)
+    with pytest.raises(TypeError):
+        messages.streaming()
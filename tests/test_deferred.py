@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.descriptors import RequestDescriptor
+from office365_api.v2.models import Event
+
+from .helpers import MockSession, batch_handler, new_batch
+
+
+def deferred(service_name, user_id='u'):
+    services = MicrosoftGraphClient(MockSession(None)).users(user_id)
+    return getattr(services, service_name).deferred()
+
+
+def test_descriptors_are_not_sent():
+    session = MockSession(None)
+    events = MicrosoftGraphClient(session).users('u').event.deferred()
+
+    descriptor = events.get('1', as_model=True)
+
+    assert session.requests == []
+    assert isinstance(descriptor, RequestDescriptor)
+    assert (descriptor.method, descriptor.url) == ('GET', '/users/u/calendar/events/1')
+    assert descriptor.model_class is Event
+    assert descriptor.to_batch_request() == {'method': 'GET', 'url': '/users/u/calendar/events/1'}
+
+
+def test_descriptor_of_a_request_with_a_body():
+    descriptor = deferred('message').update('m1', isRead=True)
+
+    assert descriptor.to_batch_request() == {
+        'method': 'PATCH', 'url': '/users/u/messages/m1', 'body': {'isRead': True},
+        'headers': {'Content-Type': 'application/json'}}
+
+
+def test_descriptor_keeps_the_query():
+    descriptor = deferred('message', 'me').list(fields=['id'], max_entries=10)
+
+    assert descriptor.url == '/me/messages?%24top=10&%24select=id'
+
+
+@pytest.mark.parametrize('call', [
+    lambda messages: messages.send('m1'),
+    lambda messages: messages.download_raw('m1', None),
+])
+def test_requests_which_cannot_be_deferred(call):
+    with pytest.raises(TypeError):
+        call(deferred('message'))
+
+
+def test_callbacks_get_the_models():
+    batch, _ = new_batch(batch_handler(status_of=lambda r: 404 if r['url'].endswith('2') else 200))
+    events = MicrosoftGraphClient(MockSession(None)).users('u').event.deferred()
+    results = []
+    for event_id in ('1', '2'):
+        batch.add(events.get(event_id, as_model=True),
+                  callback=lambda request_id, body, error: results.append((body, error)))
+
+    batch.execute()
+
+    assert results[0][0].id == 'new-1' and results[0][1] is None
+    assert results[1][1].is_not_found
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from collections import Counter
+
+import pytest
+
+from office365_api.v2.deltastate import (DeltaState, FileDeltaStateStore, MemoryDeltaStateStore,
+                                         SQLiteDeltaStateStore)
+from office365_api.v2.exceptions import Office365ClientError
+from office365_api.v2.sync import (DeltaResource, MailboxSyncScheduler, MailFolderDelta,
+                                   iter_resumable_delta)
+
+from .helpers import error_data
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'file'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryDeltaStateStore()
+    if request.param == 'sqlite':
+        return SQLiteDeltaStateStore(str(tmp_path / 'states.db'))
+    return FileDeltaStateStore(str(tmp_path / 'states'))
+
+
+def test_store_round_trip(store):
+    store.save('u1', 'inbox', DeltaState(next_link='next', delta_token='token'))
+    store.save('u1', 'backfill', DeltaState(checkpoint='done'))
+
+    state = store.get('u1', 'inbox')
+    assert (state.next_link, state.delta_token, state.checkpoint) == ('next', 'token', None)
+    state = store.get('u1', 'backfill')
+    assert (state.next_link, state.delta_token, state.checkpoint) == (None, None, 'done')
+    assert store.get('u2', 'inbox') is None
+
+    store.delete('u1', 'inbox')
+    assert store.get('u1', 'inbox') is None
+
+
+def test_sqlite_table_without_checkpoints(tmp_path):
+    path = str(tmp_path / 'states.db')
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(
+            'CREATE TABLE delta_state (mailbox TEXT NOT NULL, resource TEXT NOT NULL, '
+            'next_link TEXT, delta_token TEXT, updated_at REAL, PRIMARY KEY (mailbox, resource))')
+        connection.execute(
+            "INSERT INTO delta_state VALUES ('u1', 'inbox', NULL, 'token', 1.0)")
+    connection.close()
+
+    store = SQLiteDeltaStateStore(path)
+    store.save('u1', 'backfill', DeltaState(checkpoint='done'))
+
+    assert store.get('u1', 'inbox').delta_token == 'token'
+    assert store.get('u1', 'backfill').checkpoint == 'done'
+
+
+class PagesDelta(DeltaResource):
+    """A delta query of two pages, whose delta tokens 'expired' have expired."""
+    key = 'pages'
+    max_entries = 10
+
+    def __init__(self):
+        self.calls = []
+
+    def service(self, services):
+        return self
+
+    def first_page(self, services, delta_token=None):
+        self.calls.append(('first_page', delta_token))
+        if delta_token == 'expired':
+            raise Office365ClientError(410, error_data('SyncStateNotFound'))
+        return {'value': [1]}, 'next'
+
+    def follow_next_link(self, next_link, max_entries):
+        self.calls.append(('follow_next_link', next_link))
+        return {'value': [2], '@odata.deltaLink': 'https://x/delta?$deltatoken=fresh'}, None
+
+
+def test_resumable_delta_resyncs_on_expired_state():
+    store = MemoryDeltaStateStore()
+    store.save('u1', 'pages', DeltaState(delta_token='expired'))
+    resource = PagesDelta()
+    resynced = []
+
+    pages = list(iter_resumable_delta(
+        None, 'u1', resource, store, on_resync=lambda mailbox, r: resynced.append(mailbox)))
+
+    assert [page['value'] for page in pages] == [[1], [2]]
+    assert resynced == ['u1']
+    assert resource.calls == [
+        ('first_page', 'expired'), ('first_page', None), ('follow_next_link', 'next')]
+    assert store.get('u1', 'pages').delta_token == 'fresh'
+
+
+def test_resumable_delta_resumes_from_the_next_link():
+    store = MemoryDeltaStateStore()
+    store.save('u1', 'pages', DeltaState(next_link='next'))
+    resource = PagesDelta()
+
+    pages = list(iter_resumable_delta(None, 'u1', resource, store))
+
+    assert [page['value'] for page in pages] == [[2]]
+    assert resource.calls == [('follow_next_link', 'next')]
+
+
+def test_resumable_delta_raises_without_a_state_to_drop():
+    store = MemoryDeltaStateStore()
+    resource = PagesDelta()
+
+    def first_page(services, delta_token=None):
+        raise Office365ClientError(410, error_data('SyncStateNotFound'))
+    resource.first_page = first_page
+
+    with pytest.raises(Office365ClientError):
+        list(iter_resumable_delta(None, 'u1', resource, store))
+
+
+def test_scheduler_resumes_mid_pagination(fake_graph):
+    client, _ = fake_graph(messages_count=250)
+    store = MemoryDeltaStateStore()
+    seen = Counter()
+    pages = []
+
+    def sink(user_id, resource, items, delta_token):
+        pages.append(items)
+        if len(pages) == 3:
+            raise RuntimeError('Worker stopped')
+        seen.update(item['id'] for item in items)
+
+    def sync():
+        scheduler = MailboxSyncScheduler(client, sink, state_store=store)
+        scheduler.add('u1', MailFolderDelta('inbox', max_entries=50))
+        return scheduler.run()
+
+    with pytest.raises(RuntimeError):
+        sync()
+    assert store.get('u1', MailFolderDelta('inbox').key).next_link
+
+    assert sync() == {('u1', MailFolderDelta('inbox').key): 'synced'}
+    assert len(seen) == 250 and max(seen.values()) == 1
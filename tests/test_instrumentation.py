@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.exceptions import Office365ClientError
+from office365_api.v2.instrumentation import (BATCH, PAGE, REQUEST, Event, HistogramAggregator,
+                                              Instrumentation, endpoint_template, measure)
+
+from .helpers import MockSession, error_data, json_response
+
+
+@pytest.mark.parametrize('path, template', [
+    ('/me/messages?$top=10', '/me/messages'),
+    ('/users/AAMkADIzNmY4ZGI1LTQ2YjEtNDc0Zi1iOTU2LWNhMTE2OGRmNjE2NQ=/messages',
+     '/users/{id}/messages'),
+    ("/users('u1')/events/12", '/users({id})/events/{id}'),
+])
+def test_endpoint_template(path, template):
+    assert endpoint_template(path) == template
+
+
+def test_measure_records_the_errors():
+    events = []
+
+    with pytest.raises(Office365ClientError):
+        with measure(Instrumentation(events.append), REQUEST, service='S') as event:
+            raise Office365ClientError(404, error_data('ErrorItemNotFound'))
+
+    assert events == [event]
+    assert event.status_code == 404 and event.latency >= 0
+    assert isinstance(event.error, Office365ClientError)
+
+
+def test_failing_listeners_are_ignored():
+    events = []
+
+    def failing(event):
+        raise RuntimeError('Listener failed')
+
+    instrumentation = Instrumentation(failing, events.append)
+    instrumentation.emit(Event(REQUEST))
+
+    assert len(events) == 1
+
+
+def test_client_events():
+    def handler(method, url, kwargs):
+        if len(session.requests) == 1:
+            return json_response(429, error_data('TooManyRequests'), {'Retry-After': '0'})
+        if url.endswith('$batch'):
+            return json_response(200, {'responses': [{'id': '1', 'status': 200, 'body': {}}]})
+        return json_response(200, {'value': [{'id': 'a'}, {'id': 'b'}]})
+
+    session = MockSession(handler)
+    events = []
+    client = MicrosoftGraphClient(session, instrumentation=Instrumentation(events.append))
+
+    list(client.users('u1').message.iter_all())
+    batch = client.new_batch_request()
+    batch.add({'method': 'GET', 'url': '/me/messages/1'})
+    batch.execute()
+
+    request, page, batch_event = events
+    assert (request.kind, request.service, request.http_method) == (
+        REQUEST, 'MessageService', 'GET')
+    assert (request.endpoint, request.mailbox) == ('/messages', 'users/u1')
+    assert request.status_code == 200 and request.retries == 1 and request.bytes_in > 0
+    assert (page.kind, page.items) == (PAGE, 2)
+    assert (batch_event.kind, batch_event.batch_size) == (BATCH, 1)
+
+
+def test_histogram_aggregator():
+    aggregator = HistogramAggregator(buckets=(0.1, 1), labels=('kind', 'status'))
+    for latency, status in ((0.05, 200), (0.5, 200), (5, 200), (0.05, None)):
+        event = Event(REQUEST)
+        event.latency = latency
+        event.status_code = status
+        if status is None:
+            event.error = ConnectionResetError()
+        aggregator(event)
+
+    text = aggregator.export_prometheus()
+
+    assert 'office365_duration_seconds_bucket{kind="request",status="200",le="0.1"} 1' in text
+    assert 'office365_duration_seconds_bucket{kind="request",status="200",le="1"} 2' in text
+    assert 'office365_duration_seconds_bucket{kind="request",status="200",le="+Inf"} 3' in text
+    assert 'office365_duration_seconds_count{kind="request",status="200"} 3' in text
+    assert 'office365_errors_total{kind="request",status="ConnectionResetError"} 1' in text
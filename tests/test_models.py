@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.models import Contact, Event, MailFolder, Message, Recipient
+
+from .helpers import MockSession, json_response
+
+MESSAGE = {
+    '@odata.etag': 'W/"1"',
+    'id': 'm1',
+    'subject': 'Hello',
+    'isRead': False,
+    'from': {'emailAddress': {'name': 'Ann', 'address': 'ann@example.com'}},
+    'toRecipients': [{'emailAddress': {'address': 'bob@example.com'}}],
+    'body': {'contentType': 'html', 'content': '<p>Hi</p>'},
+}
+
+
+def test_models_have_no_instance_dict():
+    for model_class in (Message, Event, Contact, MailFolder):
+        assert not hasattr(model_class({'id': 'x'}), '__dict__')
+
+    message = Message(MESSAGE)
+    with pytest.raises(AttributeError):
+        message.unknown = 1
+
+
+def test_properties_and_extra():
+    message = Message(MESSAGE)
+
+    assert message.id == 'm1' and message.isRead is False
+    assert message.sentDateTime is None
+    assert message.extra == {'@odata.etag': 'W/"1"'}
+    assert message['@odata.etag'] == 'W/"1"'
+    assert message.get('sentDateTime', 'unset') == 'unset'
+    with pytest.raises(KeyError):
+        message['unknown']
+
+
+def test_nested_models_are_wrapped_on_access():
+    message = Message(MESSAGE)
+
+    assert type(message._from_) is dict
+    assert isinstance(message.from_, Recipient)
+    assert message.from_.emailAddress.address == 'ann@example.com'
+    assert message.from_ is message.from_
+    [recipient] = message.toRecipients
+    assert recipient.emailAddress.address == 'bob@example.com'
+    assert message.ccRecipients is None
+
+
+def test_to_dict_round_trip():
+    message = Message(MESSAGE)
+    message.toRecipients
+
+    assert message.to_dict() == MESSAGE
+    assert Message(message.to_dict()).to_dict() == MESSAGE
+
+
+def test_services_return_their_models():
+    session = MockSession(lambda method, url, kwargs: json_response(
+        200, {'value': [MESSAGE, dict(MESSAGE, id='m2')]}))
+    messages = MicrosoftGraphClient(session).users('u').message
+
+    items = list(messages.iter_all(as_model=True))
+
+    assert [type(item) for item in items] == [Message, Message]
+    assert [item.id for item in items] == ['m1', 'm2']
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from office365_api.v2.models import Message
+from office365_api.v2.pagination import delta_token_from_link
+
+
+def test_iter_all_follows_the_next_links(fake_graph):
+    client, _ = fake_graph(messages_count=45)
+
+    messages = list(client.users('u1').message.iter_all(max_entries=10))
+
+    assert [m['id'] for m in messages] == ['u1-{:08d}'.format(i) for i in range(45)]
+
+
+def test_pages_are_requested_as_consumed(fake_graph):
+    client, graph = fake_graph(messages_count=45)
+    pages = client.users('u1').message.iter_pages(max_entries=10)
+
+    assert graph.requests_count == 0
+    items = iter(pages.items())
+    for _ in range(15):
+        next(items)
+    assert graph.requests_count == 2 and pages.pages_count == 2
+    assert pages.next_link.endswith('%24skip=20')
+
+
+def test_iter_delta_exposes_the_delta_token(fake_graph):
+    client, _ = fake_graph(messages_count=25)
+    items = client.users('u1').mailfolder.iter_delta('inbox', max_entries=10)
+
+    assert items.delta_token is None
+    assert len(list(items)) == 25
+    assert items.delta_token == 'synced'
+    assert items.next_link is None
+
+
+def test_iter_all_as_models(fake_graph):
+    client, _ = fake_graph(messages_count=3)
+
+    messages = list(client.users('u1').message.iter_all(as_model=True))
+
+    assert all(isinstance(m, Message) for m in messages)
+    assert messages[0].id == 'u1-00000000'
+    with pytest.raises(TypeError):
+        client.users('u1').calendar.iter_all(as_model=True)
+
+
+def test_delta_token_from_link():
+    assert delta_token_from_link('https://x/delta?$deltatoken=a%2Bb') == 'a+b'
+    assert delta_token_from_link('https://x/delta?$deltaToken=t') == 't'
+    assert delta_token_from_link('https://x/delta') is None
+    assert delta_token_from_link(None) is None
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from office365_api.v2.pagination import PageIterator
+
+
+class PagesService(object):
+    """Serve pages_count pages of page_size items, failing on the page fail_at."""
+
+    def __init__(self, pages_count, page_size=10, fail_at=None):
+        self.pages_count = pages_count
+        self.page_size = page_size
+        self.fail_at = fail_at
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def page(self, index):
+        with self.lock:
+            self.fetched.append(index)
+        if index == self.fail_at:
+            raise RuntimeError('Page {} failed'.format(index))
+        items = list(range(index * self.page_size, (index + 1) * self.page_size))
+        next_link = str(index + 1) if index + 1 < self.pages_count else None
+        return {'value': items}, next_link
+
+    def list(self, max_entries=None):
+        return self.page(0)
+
+    def follow_next_link(self, next_link, max_entries=None):
+        return self.page(int(next_link))
+
+
+def wait_for(condition, timeout=1):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_prefetched_pages_keep_their_order():
+    service = PagesService(20)
+
+    pages = list(PageIterator(service, service.list, prefetch=3))
+
+    assert [page['value'][0] for page in pages] == list(range(0, 200, 10))
+
+
+def test_prefetch_fetches_ahead_up_to_prefetch_pages():
+    service = PagesService(20)
+    pages = iter(PageIterator(service, service.list, prefetch=3))
+
+    next(pages)
+    wait_for(lambda: len(service.fetched) >= 4)
+    time.sleep(0.05)
+
+    # the page yielded, then 3 pages ahead
+    assert len(service.fetched) == 4
+    pages.close()
+
+
+def test_prefetch_is_capped_by_the_buffered_items():
+    service = PagesService(20, page_size=10)
+    pages = iter(PageIterator(service, service.list, prefetch=10, max_prefetch_items=25))
+
+    next(pages)
+    wait_for(lambda: len(service.fetched) >= 4)
+    time.sleep(0.05)
+
+    # a page is fetched while less than 25 items are buffered
+    assert len(service.fetched) == 4
+    pages.close()
+
+
+def test_prefetch_raises_the_error_of_its_page():
+    service = PagesService(5, fail_at=3)
+    pages = iter(PageIterator(service, service.list, prefetch=2))
+
+    assert [next(pages)['value'][0] for _ in range(3)] == [0, 10, 20]
+    with pytest.raises(RuntimeError):
+        next(pages)
+
+
+def test_closed_iterator_stops_prefetching():
+    service = PagesService(1000)
+    pages = iter(PageIterator(service, service.list, prefetch=2))
+
+    next(pages)
+    pages.close()
+    time.sleep(0.05)
+    fetched = len(service.fetched)
+    time.sleep(0.05)
+
+    assert fetched <= 4 and len(service.fetched) == fetched
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from office365_api.v2 import projections
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.projections import (FULL, PROFILE_SYNC_HEADERS, Projection, get_profile,
+                                          profiles, register_profile)
+
+from .helpers import MockSession, json_response
+
+
+def new_client(**kwargs):
+    session = MockSession(lambda method, url, kwargs: json_response(200, {'value': []}))
+    return MicrosoftGraphClient(session, **kwargs), session
+
+
+def projection_params(session):
+    """Return the $select and $expand of the last request."""
+    query = parse_qs(urlsplit(session.requests[-1][1]).query)
+    return {k: v[0] for k, v in query.items() if k in ('$select', '$expand')}
+
+
+def test_projection_query_params():
+    assert Projection(['id', 'subject'], ['attachments']).query_params() == {
+        '$select': 'id,subject', '$expand': 'attachments'}
+    assert FULL.query_params() == {}
+
+
+def test_profiles_registry(monkeypatch):
+    monkeypatch.setattr(projections, '_profiles', dict(projections._profiles))
+    projection = register_profile('test-ids', 'message', fields=['id'])
+
+    assert get_profile('test-ids', 'message') is projection
+    assert 'test-ids' in profiles()['message']
+    assert get_profile('full', 'message') is FULL
+    with pytest.raises(KeyError):
+        get_profile('test-ids', 'event')
+    assert get_profile('test-ids', 'event', strict=False) is FULL
+
+
+def test_explicit_fields_win_over_the_profile():
+    client, session = new_client()
+    messages = client.users('u').message
+
+    messages.list(fields=['id', 'subject'], expand=['attachments'], profile=PROFILE_SYNC_HEADERS)
+
+    assert projection_params(session) == {'$select': 'id,subject', '$expand': 'attachments'}
+
+
+def test_profile_of_a_request():
+    client, session = new_client()
+
+    client.users('u').message.list(profile=PROFILE_SYNC_HEADERS)
+
+    fields = get_profile(PROFILE_SYNC_HEADERS, 'message').fields
+    assert projection_params(session) == {'$select': ','.join(fields)}
+    with pytest.raises(KeyError):
+        client.users('u').message.list(profile='unknown')
+
+
+def test_profile_of_the_client():
+    client, session = new_client(projection_profile=PROFILE_SYNC_HEADERS)
+
+    client.users('u').event.list()
+    assert projection_params(session) == {
+        '$select': ','.join(get_profile(PROFILE_SYNC_HEADERS, 'event').fields)}
+
+    # the profile is not registered for the calendars: they are fully requested
+    client.users('u').calendar.list()
+    assert projection_params(session) == {}
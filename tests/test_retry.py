@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.exceptions import Office365ClientError, Office365ServerError
+from office365_api.v2.retry import NoRetryPolicy, RetryPolicy, retry_after_seconds
+
+from .helpers import MockSession, error_data, json_response
+
+
+def failing_handler(statuses, data=None):
+    """Answer with the statuses first (Retry-After: 0), then 200 and data."""
+    statuses = list(statuses)
+
+    def handler(method, url, kwargs):
+        if statuses:
+            return json_response(statuses.pop(0), error_data('Injected'), {'Retry-After': '0'})
+        return json_response(200, data or {'id': 'm1'})
+    return handler
+
+
+def new_client(statuses, retry_policy=None):
+    session = MockSession(failing_handler(statuses))
+    return MicrosoftGraphClient(session, retry_policy=retry_policy), session
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds({'retry-after': '2.5'}) == 2.5
+    assert retry_after_seconds({'Retry-After': '-1'}) == 0
+    assert retry_after_seconds({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0
+    assert retry_after_seconds({'Retry-After': 'soon'}) is None
+    assert retry_after_seconds(None) is None
+
+
+def test_policy_delays():
+    policy = RetryPolicy(max_retries=3, backoff_factor=1, max_backoff=3, jitter=False)
+    throttled = Office365ClientError(429, None, retry_after=7)
+    unavailable = Office365ServerError(503, None)
+
+    assert policy.get_retry_delay('get', throttled, 0) == 7
+    assert [policy.get_retry_delay('GET', unavailable, attempt) for attempt in range(4)] == [
+        1, 2, 3, None]
+    # the non idempotent methods and the other statuses are not retried
+    assert policy.get_retry_delay('POST', throttled, 0) is None
+    assert policy.get_retry_delay('GET', Office365ServerError(500, None), 0) is None
+    # nor once the overall wait would exceed max_total_delay
+    assert policy.get_retry_delay('GET', throttled, 0, waited=55) is None
+    assert NoRetryPolicy().get_retry_delay('GET', throttled, 0) is None
+
+
+def test_backoff_jitter_stays_below_the_delay():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=4)
+
+    assert all(0 <= policy.backoff(attempt) <= min(4, 2 ** attempt) for attempt in range(10))
+
+
+def test_throttled_request_is_retried():
+    client, session = new_client([429, 503])
+
+    assert client.users('u').message.get('m1')['id'] == 'm1'
+    assert len(session.requests) == 3
+
+
+def test_retries_are_limited_by_the_policy():
+    client, session = new_client([503] * 3, retry_policy=RetryPolicy(max_retries=2))
+
+    with pytest.raises(Office365ServerError):
+        client.users('u').message.get('m1')
+    assert len(session.requests) == 3
+
+
+def test_post_is_not_retried():
+    client, session = new_client([503])
+
+    with pytest.raises(Office365ServerError):
+        client.users('u').message.create(subject='x')
+    assert len(session.requests) == 1
+
+
+def test_stream_request_is_retried_before_the_first_chunk():
+    client, session = new_client([429, 503])
+
+    chunks = list(client.users('u').message.stream_raw('m1', chunk_size=4))
+
+    assert b''.join(chunks) == b'{"id": "m1"}'
+    assert len(session.requests) == 3
+    assert all(kwargs['stream'] for _, _, kwargs in session.requests)
+
+
+def test_stream_request_gives_up_with_the_retry_policy():
+    client, session = new_client([429] * 3, retry_policy=RetryPolicy(max_retries=1))
+
+    with pytest.raises(Office365ClientError) as info:
+        list(client.users('u').message.stream_raw('m1'))
+    assert info.value.is_throttled
+    assert len(session.requests) == 2
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from office365_api.v2.aio import AsyncMicrosoftGraphClient
+from office365_api.v2.sharding import (WindowMerger, iter_window_pages, parse_datetime,
+                                       split_windows)
+
+from .helpers import SessionTransport
+
+START = '2020-01-01T00:00:00Z'
+END = '2020-02-01T00:00:00Z'
+
+
+def test_split_windows():
+    windows = split_windows('2020-01-01', '2020-01-03T12:00:00Z', timedelta(days=1))
+
+    utc = timezone.utc
+    assert windows == [
+        (datetime(2020, 1, 1, tzinfo=utc), datetime(2020, 1, 2, tzinfo=utc)),
+        (datetime(2020, 1, 2, tzinfo=utc), datetime(2020, 1, 3, tzinfo=utc)),
+        (datetime(2020, 1, 3, tzinfo=utc), datetime(2020, 1, 3, 12, tzinfo=utc)),
+    ]
+    with pytest.raises(ValueError):
+        split_windows(START, END, timedelta(0))
+
+
+def test_parse_datetime_of_graph():
+    assert parse_datetime('2020-01-01T10:00:00.1234567') == datetime(
+        2020, 1, 1, 10, 0, 0, 123456, tzinfo=timezone.utc)
+
+
+def window_pages_fetch(pages_count, calls):
+    """fetch of iter_window_pages over pages_count pages per window, the first windows last."""
+    def fetch(window, next_link):
+        calls.append((window, next_link))
+        page = int(next_link or 0)
+        time.sleep(0.002 * (10 - window))
+        return (window, page), str(page + 1) if page + 1 < pages_count else None
+    return fetch
+
+
+def test_iter_window_pages_keeps_the_order_of_the_windows():
+    calls = []
+    pages = list(iter_window_pages(window_pages_fetch(3, calls), range(10), max_workers=4))
+
+    assert pages == [(window, (window, page)) for window in range(10) for page in range(3)]
+    assert len(calls) == 30
+
+
+def test_iter_window_pages_yields_before_the_window_is_fetched():
+    calls = []
+    pages = iter_window_pages(
+        window_pages_fetch(100, calls), range(3), max_workers=2, max_pages_ahead=2)
+
+    assert next(pages) == (0, (0, 0))
+    time.sleep(0.1)
+    # the windows buffer up to max_pages_ahead pages
+    assert len(calls) <= 6
+    pages.close()
+
+
+def test_iter_window_pages_raises_when_the_failed_window_is_reached():
+    def fetch(window, next_link):
+        if window == 1:
+            raise RuntimeError('Window failed')
+        return window, None
+
+    pages = iter_window_pages(fetch, range(3), max_workers=3)
+
+    assert next(pages) == (0, 0)
+    with pytest.raises(RuntimeError):
+        next(pages)
+
+
+def test_window_merger_yields_spanning_events_once():
+    utc = timezone.utc
+    spanning = {'id': 'a', 'end': {'dateTime': '2020-01-03T00:00:00.0000000'}}
+    merger = WindowMerger()
+
+    first = merger.merge(datetime(2020, 1, 2, tzinfo=utc), [spanning, {'id': 'b', 'end': None}])
+    second = merger.merge(datetime(2020, 1, 3, tzinfo=utc), [spanning])
+    third = merger.merge(datetime(2020, 1, 4, tzinfo=utc), [spanning, {'id': 'c'}])
+
+    assert [e['id'] for e in first] == ['a', 'b']
+    # ending on the boundary, it may still be returned by the next window
+    assert second == []
+    assert [e['id'] for e in third] == ['c']
+
+
+def test_window_merger_of_pages():
+    utc = timezone.utc
+    spanning = {'id': 'a', 'end': {'dateTime': '2020-01-02T12:00:00'}}
+    merger = WindowMerger()
+
+    first = merger.merge(datetime(2020, 1, 2, tzinfo=utc), [spanning])
+    # the event spanning the windows comes on the second page of the next one
+    second = merger.merge(datetime(2020, 1, 3, tzinfo=utc), [{'id': 'b'}])
+    third = merger.merge(datetime(2020, 1, 3, tzinfo=utc), [spanning, {'id': 'c'}])
+
+    assert [e['id'] for e in first + second + third] == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('window', [
+    timedelta(hours=7),  # every window starts with an event
+    timedelta(hours=2),  # shorter than the events
+    timedelta(days=3, hours=1),
+])
+def test_iter_sharded_matches_the_serial_listing(fake_graph, window):
+    client, _ = fake_graph(events_count=100, throttle_rate=0.05, retry_after=0.01, seed=2)
+    calendar_view = client.users('u1').calendarview
+
+    serial = [e['id'] for e in calendar_view.iter_all(START, END, max_entries=50)]
+    sharded = [e['id'] for e in calendar_view.iter_sharded(
+        START, END, window=window, max_workers=6, max_entries=50)]
+
+    assert len(serial) == 100
+    assert sharded == serial
+
+
+def test_iter_sharded_of_a_sub_range(fake_graph):
+    client, _ = fake_graph(events_count=300)
+    calendar_view = client.users('u1').calendarview
+    start, end = '2020-01-02T05:00:00Z', '2020-01-20T00:00:00Z'
+
+    sharded = list(calendar_view.iter_sharded(
+        start, end, window=timedelta(hours=5), as_model=True, fields=['subject']))
+
+    serial = [e['id'] for e in calendar_view.iter_all(start, end)]
+    assert [e.id for e in sharded] == serial
+
+
+def test_iter_sharded_rejects_another_order(fake_graph):
+    client, _ = fake_graph()
+
+    with pytest.raises(TypeError):
+        next(client.users('u1').calendarview.iter_sharded(START, END, _orderby='subject'))
+
+
+def test_iter_sharded_stopped_early(fake_graph):
+    client, _ = fake_graph(events_count=300)
+    events = client.users('u1').calendarview.iter_sharded(START, END, window=timedelta(days=1))
+
+    assert next(events)['id'] == 'u1-event-00000000'
+    events.close()
+
+
+def test_async_iter_sharded(fake_graph):
+    client, _ = fake_graph(events_count=100, throttle_rate=0.05, retry_after=0.01, seed=2)
+    serial = [e['id'] for e in client.users('u1').calendarview.iter_all(START, END)]
+
+    async def sharded():
+        async_client = AsyncMicrosoftGraphClient(SessionTransport(client.session))
+        calendar_view = async_client.users('u1').calendarview
+        return [e['id'] async for e in calendar_view.iter_sharded(
+            START, END, window=timedelta(days=2), max_workers=4)]
+
+    assert asyncio.run(sharded()) == serial
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+from requests.exceptions import ChunkedEncodingError
+
+from benchmarks.fake_graph import iter_content
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.exceptions import Office365ClientError
+from office365_api.v2.services import write_chunks
+
+from .helpers import MockSession, json_response
+
+CONTENT_SIZE = 200 * 1000
+
+
+def test_download_content_to_a_path(fake_graph, tmp_path):
+    client, _ = fake_graph(content_size=CONTENT_SIZE)
+    path = tmp_path / 'attachment'
+
+    size = client.users('u1').attachment.download_content('m1', 'a1', str(path))
+
+    assert size == CONTENT_SIZE
+    assert path.read_bytes() == b''.join(iter_content(CONTENT_SIZE))
+
+
+def test_stream_raw_in_bounded_chunks(fake_graph):
+    client, _ = fake_graph(content_size=CONTENT_SIZE)
+
+    chunks = list(client.users('u1').message.stream_raw('m1', chunk_size=1000))
+
+    assert max(map(len, chunks)) <= 1000
+    assert sum(map(len, chunks)) == CONTENT_SIZE
+
+
+def test_download_raw_to_a_file_object(fake_graph):
+    client, _ = fake_graph(content_size=CONTENT_SIZE)
+    sink = io.BytesIO()
+
+    assert client.users('u1').message.download_raw('m1', sink) == CONTENT_SIZE
+    assert len(sink.getvalue()) == CONTENT_SIZE
+
+
+def test_request_is_sent_on_the_first_chunk():
+    session = MockSession(lambda method, url, kwargs: json_response(200, {'id': 'm1'}))
+    chunks = MicrosoftGraphClient(session).users('u').message.stream_raw('m1')
+
+    assert session.requests == []
+    next(chunks)
+    [(method, url, kwargs)] = session.requests
+    assert url.endswith('/users/u/messages/m1/$value') and kwargs['stream']
+
+
+def test_error_is_raised_before_any_chunk(fake_graph):
+    client, _ = fake_graph()
+
+    with pytest.raises(Office365ClientError) as info:
+        next(client.users('u1').attachment.stream_content('m1', 'a1/unknown'))
+    assert info.value.is_not_found
+
+
+def test_connection_error_is_retried():
+    attempts = []
+
+    def handler(method, url, kwargs):
+        attempts.append(url)
+        if len(attempts) == 1:
+            raise ChunkedEncodingError('Connection broken')
+        return json_response(200, {'id': 'm1'})
+
+    client = MicrosoftGraphClient(MockSession(handler))
+
+    assert b''.join(client.users('u').message.stream_raw('m1')) == b'{"id": "m1"}'
+    assert len(attempts) == 2
+
+
+def test_write_chunks():
+    sink = io.BytesIO()
+
+    assert write_chunks(iter([b'ab', b'', b'cde']), sink) == 5
+    assert sink.getvalue() == b'abcde'
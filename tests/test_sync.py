@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import Counter
+
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.deltastate import MemoryDeltaStateStore
+from office365_api.v2.exceptions import Office365ClientError
+from office365_api.v2.sync import DeltaResource, MailboxSyncScheduler, MailFolderDelta
+
+from .helpers import MockSession, error_data
+
+
+class CountedDelta(DeltaResource):
+    """A delta query of pages_count pages per mailbox, counting the pages fetched at once."""
+    key = 'counted'
+
+    def __init__(self, pages_count, fail_for=()):
+        self.pages_count = pages_count
+        self.fail_for = fail_for
+        self.fetched = []
+        self.running = Counter()
+        self.max_running = Counter()
+        self.lock = threading.Lock()
+
+    def service(self, services):
+        return self
+
+    def page(self, user_id, index):
+        with self.lock:
+            self.fetched.append(user_id)
+            self.running[user_id] += 1
+            self.max_running[user_id] = max(self.max_running[user_id], self.running[user_id])
+        time.sleep(0.005)
+        with self.lock:
+            self.running[user_id] -= 1
+        if user_id in self.fail_for:
+            raise Office365ClientError(403, error_data('ErrorAccessDenied'))
+        if index + 1 < self.pages_count:
+            return {'value': [index]}, '{}/{}'.format(user_id, index + 1)
+        delta_link = 'https://x/delta?$deltatoken=' + user_id
+        return {'value': [index], '@odata.deltaLink': delta_link}, None
+
+    def first_page(self, services, delta_token=None):
+        return self.page(services.prefix.split('/')[-1], 0)
+
+    def follow_next_link(self, next_link, max_entries):
+        user_id, index = next_link.split('/')
+        return self.page(user_id, int(index))
+
+
+def new_scheduler(sink, **kwargs):
+    return MailboxSyncScheduler(MicrosoftGraphClient(MockSession(None)), sink, **kwargs)
+
+
+def test_scheduler_serves_the_mailboxes_in_turn():
+    resource = CountedDelta(pages_count=5)
+    scheduler = new_scheduler(lambda *args: None, max_workers=1)
+    for user_id in ('a', 'b', 'c'):
+        scheduler.add(user_id, resource)
+
+    results = scheduler.run()
+
+    assert resource.fetched == ['a', 'b', 'c'] * 5
+    assert results == {(user_id, 'counted'): user_id for user_id in ('a', 'b', 'c')}
+
+
+def test_scheduler_caps_the_pages_of_a_mailbox_in_flight():
+    resource = CountedDelta(pages_count=3)
+    scheduler = new_scheduler(lambda *args: None, max_workers=8, per_mailbox_concurrency=2)
+    for user_id in ('a', 'b'):
+        # three queries of the same mailbox
+        for _ in range(3):
+            scheduler.add(user_id, resource)
+
+    scheduler.run()
+
+    assert len(resource.fetched) == 18
+    assert resource.max_running == {'a': 2, 'b': 2}
+
+
+def test_scheduler_reports_the_failed_mailboxes():
+    resource = CountedDelta(pages_count=2, fail_for=('b',))
+    sunk = []
+    scheduler = new_scheduler(lambda user_id, r, items, token: sunk.append((user_id, token)))
+    for user_id in ('a', 'b'):
+        scheduler.add(user_id, resource)
+
+    results = scheduler.run()
+
+    assert results[('a', 'counted')] == 'a'
+    assert isinstance(results[('b', 'counted')], Office365ClientError)
+    # the delta token is passed with the last page only
+    assert sunk == [('a', None), ('a', 'a')]
+
+
+def test_scheduler_syncs_the_fake_graph(fake_graph):
+    client, _ = fake_graph(messages_count=250, throttle_rate=0.05, retry_after=0.01, seed=6)
+    store = MemoryDeltaStateStore()
+    seen = Counter()
+
+    def sink(user_id, resource, items, delta_token):
+        seen.update((user_id, item.id) for item in items)
+
+    scheduler = MailboxSyncScheduler(client, sink, max_workers=4, state_store=store,
+                                     as_models=True)
+    for user_id in ('u1', 'u2', 'u3'):
+        scheduler.add(user_id, MailFolderDelta('inbox', max_entries=100))
+
+    results = scheduler.run()
+
+    assert len(seen) == 750 and max(seen.values()) == 1
+    assert set(results.values()) == {'synced'}
+    assert store.get('u2', MailFolderDelta('inbox').key).delta_token == 'synced'
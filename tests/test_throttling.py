@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from office365_api.v2.client import MicrosoftGraphClient
+from office365_api.v2.throttling import RateLimiter, TokenBucket, mailbox_key
+
+from .helpers import MockSession, json_response
+
+
+@pytest.mark.parametrize('path, key', [
+    ('me/messages', 'me'),
+    ('/users/u1/messages/x', 'users/u1'),
+    ('users/u1?$select=id', 'users/u1'),
+    ('subscriptions', None),
+])
+def test_mailbox_key(path, key):
+    assert mailbox_key(path) == key
+
+
+def test_bucket_reservations_wait_in_order():
+    bucket = TokenBucket(rate=10)
+
+    assert [bucket.reserve() for _ in range(10)] == [0] * 10
+    first, second = bucket.reserve(), bucket.reserve()
+    assert first == pytest.approx(0.1, abs=0.01)
+    assert second == pytest.approx(0.2, abs=0.01)
+
+
+def test_bucket_pause():
+    bucket = TokenBucket(rate=10)
+
+    bucket.pause(5)
+
+    assert bucket.reserve() == pytest.approx(5, abs=0.01)
+
+
+def test_limiter_takes_the_tenant_and_mailbox_tokens():
+    limiter = RateLimiter(tenant_rate=100, mailbox_rate=2)
+
+    assert [limiter.reserve('users/u1') for _ in range(2)] == [0, 0]
+    assert limiter.reserve('users/u1') > 0
+    # the other mailboxes are not limited by u1
+    assert limiter.reserve('users/u2') == 0
+    assert limiter.reserve('subscriptions') == 0
+
+
+def test_limiter_adapts_to_the_throttling():
+    limiter = RateLimiter(tenant_rate=100, mailbox_rate=8, min_rate=1)
+
+    for _ in range(4):
+        limiter.on_throttled('users/u1')
+    assert limiter.mailbox_buckets['users/u1'].rate == 1
+    assert limiter.tenant_bucket.rate == 100 * 0.5 ** 4
+
+    limiter.on_success('users/u1')
+    assert limiter.mailbox_buckets['users/u1'].rate == pytest.approx(1.1)
+
+    limiter.on_throttled('users/u1', retry_after=30)
+    assert limiter.reserve('users/u1') > 29
+
+
+def test_limiter_forgets_the_least_recently_used_mailboxes():
+    limiter = RateLimiter(max_mailboxes=2)
+
+    for user_id in ('a', 'b', 'a', 'c'):
+        limiter.reserve('users/' + user_id)
+
+    assert list(limiter.mailbox_buckets) == ['users/a', 'users/c']
+
+
+def test_client_requests_go_through_the_limiter():
+    def handler(method, url, kwargs):
+        if len(session.requests) == 1:
+            return json_response(429, {'error': {'code': 'TooManyRequests'}}, {'Retry-After': '0'})
+        return json_response(200, {'value': []})
+
+    session = MockSession(handler)
+    limiter = RateLimiter(tenant_rate=100, mailbox_rate=8)
+    client = MicrosoftGraphClient(session, rate_limiter=limiter)
+
+    client.users('u1').message.list()
+
+    assert len(session.requests) == 2
+    # halved by the 429, then increased by the success
+    assert limiter.mailbox_buckets['users/u1'].rate == pytest.approx(4.1)
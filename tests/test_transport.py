@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from office365_api.v2.transport import (DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_CONCURRENCY,
+                                        DEFAULT_READ_TIMEOUT, GRAPH_URL, Http2Session,
+                                        TimeoutHTTPAdapter, build_session, raise_for_status)
+
+from .helpers import error_data, json_response
+
+
+def test_session_defaults():
+    session = build_session(headers={'Authorization': 'Bearer token'})
+
+    adapter = session.get_adapter(GRAPH_URL + '/v1.0/me')
+    assert isinstance(adapter, TimeoutHTTPAdapter)
+    assert adapter._pool_maxsize == DEFAULT_MAX_CONCURRENCY
+    assert adapter.timeout == (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+    assert session.headers['Authorization'] == 'Bearer token'
+    assert session.hooks['response'] == [raise_for_status]
+    # the other hosts keep the default adapter
+    assert type(session.get_adapter('https://login.microsoftonline.com')) is HTTPAdapter
+
+
+def test_existing_session_is_tuned_once():
+    session = requests.Session()
+    auth = ('user', 'password')
+
+    assert build_session(session=session, auth=auth, max_concurrency=8) is session
+    build_session(session=session, max_concurrency=8)
+
+    assert session.auth == auth
+    assert session.get_adapter(GRAPH_URL)._pool_maxsize == 8
+    assert session.hooks['response'] == [raise_for_status]
+
+
+@pytest.mark.parametrize('timeout, sent', [
+    (None, (1, 2)),
+    (10, 10),
+])
+def test_default_timeout(monkeypatch, timeout, sent):
+    timeouts = []
+
+    def send(adapter, request, **kwargs):
+        timeouts.append(kwargs['timeout'])
+        return json_response(200, {})
+    monkeypatch.setattr(HTTPAdapter, 'send', send)
+    session = build_session(connect_timeout=1, read_timeout=2)
+
+    session.get(GRAPH_URL + '/v1.0/me', timeout=timeout)
+
+    assert timeouts == [sent]
+
+
+def test_error_responses_raise():
+    with pytest.raises(requests.HTTPError):
+        raise_for_status(json_response(404, {}))
+    raise_for_status(json_response(200, {}))
+
+
+def test_http2_does_not_tune_a_requests_session():
+    with pytest.raises(ValueError):
+        build_session(http2=True, session=requests.Session())
+
+
+def test_http2_session_raises_the_requests_exceptions():
+    httpx = pytest.importorskip('httpx')
+
+    def handler(request):
+        if request.url.path.endswith('missing'):
+            return httpx.Response(404, json=error_data('ErrorItemNotFound'))
+        if request.url.path.endswith('down'):
+            raise httpx.ConnectError('Connection refused')
+        return httpx.Response(200, json={'id': 'm1'})
+
+    session = Http2Session(client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+    assert session.request('GET', GRAPH_URL + '/v1.0/me/messages/m1').json() == {'id': 'm1'}
+    with pytest.raises(requests.HTTPError) as info:
+        session.request('GET', GRAPH_URL + '/v1.0/me/messages/missing')
+    assert info.value.response.status_code == 404
+    with pytest.raises(requests.ConnectionError):
+        session.request('GET', GRAPH_URL + '/v1.0/me/messages/down')
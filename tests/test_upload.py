@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
+from office365_api.v2.exceptions import Office365ClientError, Office365ServerError
+from office365_api.v2.retry import RetryPolicy
+from office365_api.v2.services import UPLOAD_RETRIES_COUNT, UploadSession
+
+from .helpers import MockSession, error_data, json_response
+
+UPLOAD_URL = 'https://outlook.office.com/api/upload?token=x'
+
+
+class UploadServer(object):
+    """Answer the ranges of an upload with the statuses of `failures` first."""
+
+    def __init__(self, size, failures=(), status_failures=()):
+        self.size = size
+        self.failures = list(failures)
+        self.status_failures = list(status_failures)
+        self.received = 0
+        self.ranges = []
+        self.status_requests = 0
+
+    def __call__(self, method, url, kwargs):
+        if method == 'GET':
+            self.status_requests += 1
+            if self.status_failures:
+                status = self.status_failures.pop(0)
+                return json_response(status, error_data('Injected'), {'Retry-After': '0'})
+            return json_response(200, {'nextExpectedRanges': ['{}-'.format(self.received)]})
+        self.ranges.append(kwargs['headers']['Content-Range'])
+        if self.failures:
+            status = self.failures.pop(0)
+            return json_response(status, error_data('Injected'), {'Retry-After': '0'})
+        self.received += len(kwargs['data'])
+        if self.received < self.size:
+            return json_response(200, {'nextExpectedRanges': ['{}-'.format(self.received)]})
+        return json_response(201, headers={'Location': 'https://attachment'})
+
+
+def upload(server, chunk_size=4, resume=False):
+    session = UploadSession(UPLOAD_URL, session=MockSession(server),
+                            retry_policy=RetryPolicy(backoff_factor=0))
+    return session.upload(io.BytesIO(b'x' * server.size), chunk_size=chunk_size, resume=resume)
+
+
+def test_upload_in_ranges():
+    server = UploadServer(10)
+
+    assert upload(server) == 'https://attachment'
+    assert server.ranges == ['bytes 0-3/10', 'bytes 4-7/10', 'bytes 8-9/10']
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_failed_range_is_retried(status):
+    server = UploadServer(10, failures=[status])
+
+    assert upload(server) == 'https://attachment'
+    assert server.ranges == ['bytes 0-3/10', 'bytes 0-3/10', 'bytes 4-7/10', 'bytes 8-9/10']
+
+
+def test_range_is_retried_up_to_the_retries_count():
+    server = UploadServer(10, failures=[503] * UPLOAD_RETRIES_COUNT)
+
+    assert upload(server) == 'https://attachment'
+    assert server.ranges.count('bytes 0-3/10') == UPLOAD_RETRIES_COUNT + 1
+
+
+def test_range_failing_more_than_the_retries_count():
+    server = UploadServer(10, failures=[503] * (UPLOAD_RETRIES_COUNT + 1))
+
+    with pytest.raises(Office365ServerError):
+        upload(server)
+    assert len(server.ranges) == UPLOAD_RETRIES_COUNT + 1
+
+
+def test_status_request_is_retried():
+    # the status requested after a failed range, then the one of a resumed upload
+    server = UploadServer(10, failures=[503], status_failures=[429, 503])
+
+    assert upload(server) == 'https://attachment'
+    assert server.status_requests == 3
+
+    server = UploadServer(10, status_failures=[503])
+    assert upload(server, resume=True) == 'https://attachment'
+    assert server.status_requests == 2
+
+
+def test_client_errors_are_not_retried():
+    server = UploadServer(10, failures=[400])
+
+    with pytest.raises(Office365ClientError):
+        upload(server)
+    assert len(server.ranges) == 1
+
+
+def test_default_session_has_timeouts():
+    session = UploadSession(UPLOAD_URL).session
+
+    assert session.get_adapter(UPLOAD_URL).timeout == (5, 60)
+    assert 'Authorization' not in session.headers
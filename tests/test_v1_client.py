@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from office365_api.client import Office365Client, build_session
+from office365_api.exceptions import Office365ClientError
+from office365_api.v2.transport import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+
+from .helpers import MockSession, error_data, json_response
+
+BASE_URL = 'https://graph.microsoft.com/v1.0/me'
+
+
+def messages_handler(pages_count=3):
+    """Answer the message lists with pages_count pages of 2 messages, ending with a delta link."""
+    def handler(method, url, kwargs):
+        if '/attachments/' in url:
+            return json_response(404, error_data('ErrorItemNotFound'))
+        page = int(url.rpartition('page=')[2]) if 'page=' in url else 0
+        data = {'value': [{'id': '{}-{}'.format(page, i)} for i in range(2)]}
+        if page + 1 < pages_count:
+            data['@odata.nextLink'] = BASE_URL + '/MailFolders/AllItems/messages?page={}'.format(
+                page + 1)
+        else:
+            data['@odata.deltaLink'] = BASE_URL + '/messages/delta?$deltatoken=token'
+        return json_response(200, data)
+    return handler
+
+
+def test_lazy_list_requests_the_pages_as_consumed():
+    session = MockSession(messages_handler())
+    messages = Office365Client(session=session).outlook.get_messages(lazy=True)
+
+    items = iter(messages)
+    assert next(items) == {'id': '0-0'}
+    assert len(session.requests) == 1
+    assert [item['id'] for item in items] == ['0-1', '1-0', '1-1', '2-0', '2-1']
+    assert len(session.requests) == 3
+    assert messages.delta_token == 'token'
+
+
+def test_list_returns_the_items_and_the_delta_token():
+    client = Office365Client(session=MockSession(messages_handler(pages_count=2)))
+
+    items, delta_token = client.outlook.get_messages()
+
+    assert len(items) == 4 and delta_token == 'token'
+
+
+def test_errors_raised_by_the_session_hook():
+    client = Office365Client(session=MockSession(messages_handler()))
+
+    with pytest.raises(Office365ClientError) as info:
+        client.attachment.get_attachment('m', 'a')
+    assert info.value.status_code == 404
+
+
+def test_session_of_the_v2_factory():
+    session = build_session(max_concurrency=4)
+    adapter = session.get_adapter(BASE_URL)
+
+    assert adapter.timeout == (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+    assert adapter._pool_maxsize == 4
+
+
+def test_client_requires_http_or_session():
+    with pytest.raises(ValueError):
+        Office365Client()